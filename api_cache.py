@@ -0,0 +1,301 @@
+"""
+Author Name:    Victoria Scavetta
+Date:           4/19/2022
+Course:         Concepts in AI
+
+This program predicts the results of NBA games based on each team's stats and past matchups between the teams.
+
+This file (api_cache.py) contains a persistent on-disk cache for NBA api responses, so data that has already been
+downloaded doesn't have to be downloaded again.
+"""
+
+from datetime import date, datetime, timedelta
+import hashlib
+import json
+import os
+import threading
+import time
+import pandas as pd
+import api_client
+import instrumentation
+
+# How long a cached response stays valid (in seconds). None means the response never expires.
+today_ttl = 5 * 60          # Today's games and stats change throughout the day
+recent_ttl = 60 * 60        # Yesterday's late games may not have been final when they were downloaded
+active_season_ttl = 60 * 60  # Season wide responses change every day while the season is being played
+
+cache_dir = '.nba_cache'
+max_cache_bytes = 512 * 1024 * 1024
+
+
+class CachedResponse:
+    """
+    A stand-in for an nba_api endpoint object that was built from a cached response. It supports the same methods that
+    data_processing uses on the real endpoint objects.
+    """
+
+    def __init__(self, data):
+        self._data = data
+
+    def _result_sets(self):
+        result_sets = self._data.get('resultSets', self._data.get('resultSet', []))
+        # Some endpoints return a single result set instead of a list of them
+        if isinstance(result_sets, dict):
+            result_sets = [result_sets]
+        return result_sets
+
+    def get_dict(self):
+        return self._data
+
+    def get_normalized_dict(self):
+        normalized = {}
+        for result_set in self._result_sets():
+            headers = result_set['headers']
+            normalized[result_set['name']] = [dict(zip(headers, row)) for row in result_set['rowSet']]
+        return normalized
+
+    def get_data_frames(self):
+        return [pd.DataFrame(result_set['rowSet'], columns=result_set['headers'])
+                for result_set in self._result_sets()]
+
+
+class ResponseCache:
+    """
+    A content-addressed cache that stores each response as a JSON file named after a hash of the endpoint and its
+    parameters. Files are evicted in least recently used order once the cache grows past max_bytes.
+    """
+
+    def __init__(self, directory=cache_dir, max_bytes=max_cache_bytes):
+        """
+        :param directory:   The directory the cached responses are saved in
+        :param max_bytes:   The maximum total size of the cached responses
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._total_bytes = None  # Running total of the cache size, so the directory is only scanned when needed
+        self._lock = threading.Lock()
+
+    def key(self, endpoint, params):
+        """
+        Creates the cache key for an endpoint call
+
+        :param endpoint:    The name of the endpoint
+        :param params:      A dictionary containing the parameters of the call
+        :return:            A hex string that is unique to the endpoint and parameters
+        """
+        content = json.dumps([endpoint, params], sort_keys=True, default=str)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f'{key}.json')
+
+    def get(self, endpoint, params):
+        """
+        Gets a cached response
+
+        :param endpoint:    The name of the endpoint
+        :param params:      A dictionary containing the parameters of the call
+        :return:            The cached response, or None if there isn't a valid one
+        """
+        path = self._path(self.key(endpoint, params))
+        try:
+            with open(path, 'r') as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            self._count('misses')
+            return None
+
+        # Expired responses are deleted so they get downloaded again
+        if entry['expires'] is not None and entry['expires'] < time.time():
+            self._remove(path)
+            self._count('misses')
+            return None
+
+        # The modified time of a file is used as its last access time for LRU eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self._count('hits')
+        return entry['data']
+
+    def put(self, endpoint, params, data, ttl=None):
+        """
+        Saves a response to the cache
+
+        :param endpoint:    The name of the endpoint
+        :param params:      A dictionary containing the parameters of the call
+        :param data:        The response, which must be JSON serializable
+        :param ttl:         The amount of seconds the response is valid for, or None if it never expires
+        """
+        path = self._path(self.key(endpoint, params))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {
+            'endpoint': endpoint,
+            'params': params,
+            'expires': None if ttl is None else time.time() + ttl,
+            'data': data
+        }
+
+        # Write to a temporary file first so a crash never leaves a half written response in the cache
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump(entry, file, default=str)
+        os.replace(temp_path, path)
+
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += os.path.getsize(path)
+            needs_eviction = self._total_bytes is None or self._total_bytes > self.max_bytes
+        if needs_eviction:
+            self._evict()
+
+    def get_or_fetch(self, endpoint, params, fetch, ttl=None):
+        """
+        Gets a cached response, or calls fetch and caches its result if there isn't a valid one
+
+        :param endpoint:    The name of the endpoint
+        :param params:      A dictionary containing the parameters of the call
+        :param fetch:       A function with no arguments that downloads the response
+        :param ttl:         The amount of seconds the response is valid for, or None if it never expires
+        :return:            The response
+        """
+        with instrumentation.span('cache.lookup', endpoint=endpoint):
+            data = self.get(endpoint, params)
+        if data is None:
+            instrumentation.count('cache.misses')
+            data = fetch()
+            with instrumentation.span('cache.store', endpoint=endpoint):
+                self.put(endpoint, params, data, ttl)
+        else:
+            instrumentation.count('cache.hits')
+        return data
+
+    def stats(self):
+        """
+        :return:    A dictionary containing the amount of hits, misses and evictions
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def clear(self):
+        """
+        Deletes every cached response
+        """
+        for path, size, modified in self._entries():
+            self._remove(path)
+        with self._lock:
+            self._total_bytes = 0
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _entries(self):
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for subdirectory in os.listdir(self.directory):
+            subdirectory_path = os.path.join(self.directory, subdirectory)
+            if not os.path.isdir(subdirectory_path):
+                continue
+            for name in os.listdir(subdirectory_path):
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(subdirectory_path, name)
+                try:
+                    file_stats = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, file_stats.st_size, file_stats.st_mtime))
+        return entries
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(size for path, size, modified in entries)
+
+        # Delete the least recently used responses until the cache fits again
+        if total > self.max_bytes:
+            entries.sort(key=lambda entry: entry[2])
+            for path, size, modified in entries:
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+                self._count('evictions')
+
+        with self._lock:
+            self._total_bytes = total
+
+
+default_cache = ResponseCache()
+
+
+def _parse_date(date_str):
+    for date_format in ('%m/%d/%Y', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(date_str, date_format).date()
+        except ValueError:
+            pass
+    return None
+
+
+def ttl_for(params):
+    """
+    Decides how long a response is valid for based on the dates and season it covers. Responses that only cover dates
+    that are completed never change, so they never expire.
+
+    :param params:  A dictionary containing the parameters of the call
+    :return:        The amount of seconds the response is valid for, or None if it never expires
+    """
+    today = date.today()
+
+    # The last date a response covers decides how long it stays valid
+    date_str = params.get('date_to_nullable') or params.get('game_date')
+    if date_str:
+        last_date = _parse_date(str(date_str))
+        if last_date is not None:
+            if last_date >= today:
+                return today_ttl
+            if last_date >= today - timedelta(days=1):
+                return recent_ttl
+            return None
+
+    # A response covering a whole season only changes while that season is being played
+    season = params.get('season') or params.get('season_nullable')
+    if season:
+        end_year = int(str(season)[0:4]) + 1
+        if today < date(end_year, 10, 15):
+            return active_season_ttl
+
+    return None
+
+
+def fetch_endpoint(endpoint_class, cache=None, ttl='auto', **params):
+    """
+    Calls an nba_api endpoint, or reuses its cached response
+
+    :param endpoint_class:  The nba_api endpoint class. ex: leaguegamelog.LeagueGameLog
+    :param cache:           The ResponseCache to use. The default cache is used if this is None
+    :param ttl:             The amount of seconds the response is valid for, None if it never expires, or 'auto' to
+                            decide based on the parameters
+    :param params:          The parameters to call the endpoint with
+    :return:                A CachedResponse containing the endpoint's response
+    """
+    if cache is None:
+        cache = default_cache
+    if ttl == 'auto':
+        ttl = ttl_for(params)
+
+    data = cache.get_or_fetch(endpoint_class.__name__, params,
+                              lambda: api_client.call_endpoint(endpoint_class, **params).get_dict(), ttl)
+    return CachedResponse(data)
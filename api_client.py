@@ -0,0 +1,339 @@
+"""
+Author Name:    Victoria Scavetta
+Date:           4/19/2022
+Course:         Concepts in AI
+
+This program predicts the results of NBA games based on each team's stats and past matchups between the teams.
+
+This file (api_client.py) contains the shared layer every NBA api request goes through. It keeps the requests under
+the rate stats.nba.com allows, even when they are made from many threads at once, retries failed requests with
+exponential backoff, and stops calling an endpoint for a while after it keeps failing.
+"""
+
+import multiprocessing
+import random
+import threading
+import time
+from nba_api.stats.library.http import NBAStatsHTTP
+import instrumentation
+
+# The default request rate. stats.nba.com starts rejecting requests when they come in too quickly.
+requests_per_second = 4
+burst_size = 4
+
+# Retry settings. The delay before retry n is a random amount between 0 and base_delay * 2^(n - 1), capped at max_delay.
+max_attempts = 5
+base_delay = 0.5
+max_delay = 30
+request_timeout = 30
+
+# After failure_threshold failures in a row, an endpoint's circuit opens and requests to it fail immediately until
+# reset_timeout seconds have passed
+failure_threshold = 5
+reset_timeout = 60
+
+
+class RequestFailedError(Exception):
+    """
+    Raised when a request still fails after every attempt
+    """
+
+    def __init__(self, endpoint, attempts, error):
+        super().__init__(f"{endpoint} failed after {attempts} attempt(s): {error!r}")
+        self.endpoint = endpoint
+        self.attempts = attempts
+        self.error = error
+
+
+class CircuitOpenError(RequestFailedError):
+    """
+    Raised without making a request when an endpoint has failed too many times in a row
+    """
+
+    def __init__(self, endpoint):
+        Exception.__init__(self, f"{endpoint} is failing repeatedly, so requests to it are paused")
+        self.endpoint = endpoint
+        self.attempts = 0
+        self.error = None
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket rate limiter. Each request takes a token, and tokens are refilled at a fixed rate up to
+    the capacity of the bucket.
+    """
+
+    def __init__(self, rate, capacity):
+        """
+        :param rate:        The amount of tokens added per second
+        :param capacity:    The maximum amount of tokens the bucket can hold, which is how many requests can be made at
+                            once after the bucket has filled up
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Takes a token from the bucket, waiting until one is available
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+                self._last_refill = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+
+            # Sleep outside of the lock so other threads can check the bucket in the meantime
+            time.sleep(wait)
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    A token bucket that can be shared by several processes, so they all stay under one request budget together. It has
+    to be created in the parent process and handed to the other processes when they start.
+    """
+
+    def __init__(self, rate, capacity):
+        """
+        :param rate:        The amount of tokens added per second across every process
+        :param capacity:    The maximum amount of tokens the bucket can hold
+        """
+        self.rate = rate
+        self.capacity = capacity
+        # The state lives in shared memory. Wall clock time is used because it's the same in every process.
+        self._shared_tokens = multiprocessing.Value('d', capacity, lock=False)
+        self._shared_last_refill = multiprocessing.Value('d', time.time(), lock=False)
+        self._lock = multiprocessing.Lock()
+
+    def acquire(self):
+        """
+        Takes a token from the bucket, waiting until one is available
+        """
+        while True:
+            with self._lock:
+                now = time.time()
+                elapsed = max(0.0, now - self._shared_last_refill.value)
+                tokens = min(self.capacity, self._shared_tokens.value + elapsed * self.rate)
+                self._shared_last_refill.value = now
+
+                if tokens >= 1:
+                    self._shared_tokens.value = tokens - 1
+                    return
+                self._shared_tokens.value = tokens
+                wait = (1 - tokens) / self.rate
+
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Keeps track of the failures of one endpoint. The circuit opens after failure_threshold failures in a row. Once
+    reset_timeout seconds have passed, a single request is let through to test the endpoint, and the circuit closes if
+    it succeeds or opens again if it fails.
+    """
+
+    def __init__(self, threshold=failure_threshold, timeout=reset_timeout):
+        """
+        :param threshold:   The amount of failures in a row that opens the circuit
+        :param timeout:     The amount of seconds the circuit stays open for
+        """
+        self.threshold = threshold
+        self.timeout = timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False  # True while the request let through after the timeout hasn't finished
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        :return:    True if a request can be made, False if the circuit is open or another request is already testing
+                    the endpoint
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self._opened_at < self.timeout:
+                return False
+            # Every other request is turned away until this one's result is recorded
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+
+
+class EndpointMetrics:
+    """
+    Counts the requests, retries and failures of every endpoint and how long the requests took
+    """
+
+    def __init__(self):
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, latency=None, retry=False, failure=False):
+        """
+        Records one attempt of a request
+
+        :param endpoint:    The name of the endpoint
+        :param latency:     The amount of seconds the attempt took, if it reached the server
+        :param retry:       True if the attempt is going to be retried
+        :param failure:     True if the request failed for good
+        """
+        with self._lock:
+            metrics = self._endpoints.setdefault(endpoint, {'requests': 0, 'retries': 0, 'failures': 0,
+                                                            'total_seconds': 0.0, 'max_seconds': 0.0})
+            if latency is not None:
+                metrics['requests'] += 1
+                metrics['total_seconds'] += latency
+                metrics['max_seconds'] = max(metrics['max_seconds'], latency)
+            if retry:
+                metrics['retries'] += 1
+            if failure:
+                metrics['failures'] += 1
+
+    def summary(self):
+        """
+        :return:    A dictionary containing the metrics of each endpoint, including the average latency
+        """
+        with self._lock:
+            summary = {}
+            for endpoint, metrics in self._endpoints.items():
+                summary[endpoint] = dict(metrics)
+                summary[endpoint]['avg_seconds'] = metrics['total_seconds'] / metrics['requests'] \
+                    if metrics['requests'] else 0.0
+            return summary
+
+    def print_summary(self):
+        """
+        Prints the metrics of each endpoint to the console
+        """
+        for endpoint, metrics in self.summary().items():
+            print(f"{endpoint}: {metrics['requests']} requests, {metrics['retries']} retries, "
+                  f"{metrics['failures']} failures, {metrics['avg_seconds']:.2f}s average, "
+                  f"{metrics['max_seconds']:.2f}s max")
+
+
+default_limiter = TokenBucket(requests_per_second, burst_size)
+metrics = EndpointMetrics()
+breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def configure(rate=None, capacity=None):
+    """
+    Changes the rate limit used for every request
+
+    :param rate:        The amount of requests allowed per second
+    :param capacity:    The amount of requests allowed at once
+    """
+    global default_limiter
+    default_limiter = TokenBucket(rate if rate is not None else default_limiter.rate,
+                                  capacity if capacity is not None else default_limiter.capacity)
+
+
+def use_limiter(limiter):
+    """
+    Makes every request in this process use a specific rate limiter, such as a SharedTokenBucket created by a parent
+    process
+
+    :param limiter: The TokenBucket to use
+    """
+    global default_limiter
+    default_limiter = limiter
+
+
+def set_base_url(url):
+    """
+    Points every nba_api stats endpoint at a different server, such as a local fake server used for testing
+
+    :param url: The base URL of the server. ex: 'http://127.0.0.1:8000/stats'
+    """
+    NBAStatsHTTP.base_url = url.rstrip('/') + '/{endpoint}'
+
+
+def get_breaker(endpoint):
+    """
+    :param endpoint:    The name of the endpoint
+    :return:            The CircuitBreaker of the endpoint
+    """
+    with _breakers_lock:
+        if endpoint not in breakers:
+            breakers[endpoint] = CircuitBreaker()
+        return breakers[endpoint]
+
+
+def backoff_delay(attempt):
+    """
+    :param attempt: The attempt that just failed, starting at 1
+    :return:        The amount of seconds to wait before the next attempt
+    """
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+
+
+def call_endpoint(endpoint_class, limiter=None, attempts=None, timeout=None, **params):
+    """
+    Calls an nba_api endpoint once the rate limiter allows it, retrying with exponential backoff if it fails
+
+    :param endpoint_class:  The nba_api endpoint class. ex: leaguegamelog.LeagueGameLog
+    :param limiter:         The TokenBucket to use. The default limiter is used if this is None
+    :param attempts:        The maximum amount of attempts. max_attempts is used if this is None
+    :param timeout:         The amount of seconds to wait for each response. request_timeout is used if this is None
+    :param params:          The parameters to call the endpoint with
+    :return:                The endpoint object containing the response
+    :raises RequestFailedError: If every attempt failed or the endpoint's circuit is open
+    """
+    if limiter is None:
+        limiter = default_limiter
+    if attempts is None:
+        attempts = max_attempts
+    if timeout is None:
+        timeout = request_timeout
+
+    endpoint = endpoint_class.__name__
+    breaker = get_breaker(endpoint)
+
+    for attempt in range(1, attempts + 1):
+        if not breaker.allow():
+            metrics.record(endpoint, failure=True)
+            instrumentation.count('api.circuit_open')
+            raise CircuitOpenError(endpoint)
+
+        with instrumentation.span('api.throttle', endpoint=endpoint):
+            limiter.acquire()
+        start = time.monotonic()
+        try:
+            with instrumentation.span('api.request', endpoint=endpoint, attempt=attempt):
+                response = endpoint_class(timeout=timeout, **params)
+        except Exception as error:
+            metrics.record(endpoint, latency=time.monotonic() - start, retry=attempt < attempts,
+                           failure=attempt == attempts)
+            breaker.record_failure()
+            if attempt == attempts:
+                instrumentation.count('api.failures')
+                raise RequestFailedError(endpoint, attempt, error) from error
+            instrumentation.count('api.retries')
+            with instrumentation.span('api.backoff', endpoint=endpoint, attempt=attempt):
+                time.sleep(backoff_delay(attempt))
+            continue
+
+        metrics.record(endpoint, latency=time.monotonic() - start)
+        breaker.record_success()
+        return response
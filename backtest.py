@@ -0,0 +1,177 @@
+"""
+Author Name:    Victoria Scavetta
+Date:           4/19/2022
+Course:         Concepts in AI
+
+This program predicts the results of NBA games based on each team's stats and past matchups between the teams.
+
+This file (backtest.py) tests how the model would have done day by day. The games are split into weekly or monthly
+blocks, and for each block a model is trained only on the games before it (every earlier game, or a rolling window of
+the most recent ones) and scored on the block. The blocks are independent, so they're trained in parallel.
+
+Example:    python backtest.py --cadence M --window expanding --output backtest.csv
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import os
+import numpy as np
+import pandas as pd
+from sklearn.metrics import accuracy_score, log_loss, roc_auc_score
+from xgboost import XGBClassifier
+import feature_store
+
+# The hyperparameters of every model trained by the backtest
+default_params = {'n_estimators': 100, 'learning_rate': 0.1, 'max_depth': 2}
+
+# The features and results, shared with every worker process once instead of being sent with every block
+_x = None
+_y = None
+
+
+def make_windows(dates, cadence='W', window='expanding', window_periods=8, min_train_games=300):
+    """
+    Splits the games into test blocks and the training games for each block
+
+    :param dates:           A Series containing the date of every game, in order
+    :param cadence:         'W' to test one week at a time or 'M' to test one month at a time
+    :param window:          'expanding' to train on every game before a block, or 'rolling' to only train on the games
+                            in the window_periods blocks before it
+    :param window_periods:  The amount of blocks in a rolling window
+    :param min_train_games: Blocks with fewer training games than this are skipped
+    :return:                A list of [period, training start row, training end row, test start row, test end row]
+                            lists, where the end rows are exclusive
+    """
+    periods = dates.dt.to_period(cadence)
+    # The games are in date order, so each block is a range of rows
+    block_starts = np.flatnonzero(np.r_[True, periods.to_numpy()[1:] != periods.to_numpy()[:-1]])
+    block_ends = np.r_[block_starts[1:], len(dates)]
+
+    windows = []
+    for i, (test_start, test_end) in enumerate(zip(block_starts, block_ends)):
+        if window == 'rolling':
+            train_start = block_starts[max(0, i - window_periods)]
+        else:
+            train_start = 0
+        if test_start - train_start < min_train_games:
+            continue
+        windows.append([str(periods.iloc[test_start]), int(train_start), int(test_start), int(test_start),
+                        int(test_end)])
+    return windows
+
+
+def _init_worker(x, y):
+    global _x, _y
+    _x = x
+    _y = y
+
+
+def _run_window(window, params, nthread):
+    """
+    Trains a model on a window's training games and scores it on the window's test block
+
+    :return:    A dictionary containing the window's metrics and test predictions
+    """
+    period, train_start, train_end, test_start, test_end = window
+    model = XGBClassifier(objective='binary:logistic', n_jobs=nthread, **params)
+    model.fit(_x[train_start:train_end], _y[train_start:train_end])
+
+    y_test = _y[test_start:test_end]
+    probabilities = model.predict_proba(_x[test_start:test_end])[:, 1]
+    predictions = (probabilities > 0.5).astype(int)
+
+    return {
+        'PERIOD': period,
+        'TRAIN_GAMES': train_end - train_start,
+        'TEST_GAMES': test_end - test_start,
+        'ACCURACY': accuracy_score(y_test, predictions),
+        # AUC needs both wins and losses in the block
+        'AUC': roc_auc_score(y_test, probabilities) if len(np.unique(y_test)) > 1 else np.nan,
+        'LOG_LOSS': log_loss(y_test, probabilities, labels=[0, 1]),
+        'probabilities': probabilities
+    }
+
+
+def run_backtest(games_df=None, cadence='W', window='expanding', window_periods=8, min_train_games=300,
+                 params=None, processes=None):
+    """
+    Runs a walk-forward backtest
+
+    :param games_df:        A DataFrame of games ordered by date. Every game in the feature store is used if this is
+                            None
+    :param cadence:         'W' for weekly blocks or 'M' for monthly blocks
+    :param window:          'expanding' or 'rolling', see make_windows
+    :param window_periods:  The amount of blocks in a rolling window
+    :param min_train_games: Blocks with fewer training games than this are skipped
+    :param params:          The XGBoost hyperparameters. default_params is used if this is None
+    :param processes:       The amount of blocks to train at the same time. Every core is used if this is None
+    :return:                A list containing a DataFrame of the metrics of each block and a dictionary of the metrics
+                            of every tested game together
+    :raises ValueError: If no block has at least min_train_games training games before it
+    """
+    if games_df is None:
+        games_df = feature_store.load_games()
+    if params is None:
+        params = default_params
+    if processes is None:
+        processes = os.cpu_count()
+
+    dates = pd.to_datetime(games_df['DATE'], format='%m/%d/%Y') if games_df['DATE'].dtype == object \
+        else games_df['DATE']
+    order = np.argsort(dates.to_numpy(), kind='stable')
+    games_df = games_df.iloc[order].reset_index(drop=True)
+    dates = dates.iloc[order].reset_index(drop=True)
+
+    x = games_df.drop(columns=['HOME_TEAM', 'AWAY_TEAM', 'DATE', 'RESULT']).to_numpy(dtype=np.float32)
+    y = games_df['RESULT'].to_numpy()
+    windows = make_windows(dates, cadence, window, window_periods, min_train_games)
+    if not windows:
+        raise ValueError(f"No block of the {len(games_df)} games has at least {min_train_games} earlier games to train "
+                         f"on. Use more games or a smaller min_train_games.")
+
+    # Each process trains one block at a time with a single thread, so the cores aren't oversubscribed
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(x, y)) as executor:
+        results = list(executor.map(_run_window, windows, [params] * len(windows), [1] * len(windows)))
+
+    periods_df = pd.DataFrame([{key: value for key, value in result.items() if key != 'probabilities'}
+                               for result in results])
+
+    # Metrics over every tested game together
+    y_tested = np.concatenate([y[test_start:test_end] for period, a, b, test_start, test_end in windows])
+    probabilities = np.concatenate([result['probabilities'] for result in results])
+    overall = {
+        'TEST_GAMES': len(y_tested),
+        'ACCURACY': accuracy_score(y_tested, (probabilities > 0.5).astype(int)),
+        'AUC': roc_auc_score(y_tested, probabilities),
+        'LOG_LOSS': log_loss(y_tested, probabilities, labels=[0, 1])
+    }
+    return [periods_df, overall]
+
+
+def main(args=None):
+    """
+    Runs a walk-forward backtest from the command line and prints the results
+
+    :param args:    The command line arguments. sys.argv is used if this is None
+    """
+    parser = argparse.ArgumentParser(description="Walk-forward backtest of the NBA game predictor.")
+    parser.add_argument('--cadence', choices=['W', 'M'], default='W', help="Test one week (W) or month (M) at a time")
+    parser.add_argument('--window', choices=['expanding', 'rolling'], default='expanding')
+    parser.add_argument('--window-periods', type=int, default=8, help="The amount of blocks in a rolling window")
+    parser.add_argument('--min-train-games', type=int, default=300)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--output', help="A CSV file to save the metrics of each block to")
+    args = parser.parse_args(args)
+
+    periods_df, overall = run_backtest(cadence=args.cadence, window=args.window, window_periods=args.window_periods,
+                                       min_train_games=args.min_train_games, processes=args.processes)
+
+    print(periods_df.to_string(index=False))
+    print(f"\nOverall: {overall['TEST_GAMES']} games, accuracy {overall['ACCURACY'] * 100:.1f}%, "
+          f"AUC {overall['AUC']:.3f}, log-loss {overall['LOG_LOSS']:.3f}")
+    if args.output:
+        periods_df.to_csv(args.output, index=False)
+
+
+if __name__ == '__main__':
+    main()
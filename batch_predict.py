@@ -0,0 +1,185 @@
+"""
+Author Name:    Victoria Scavetta
+Date:           4/19/2022
+Course:         Concepts in AI
+
+This program predicts the results of NBA games based on each team's stats and past matchups between the teams.
+
+This file (batch_predict.py) predicts every game in a range of dates, or a whole season, in a single run without asking
+for any input, and saves the predictions to a CSV or JSON file.
+
+Example:    python batch_predict.py --start 04/01/2022 --end 04/10/2022 --output predictions.csv
+            python batch_predict.py --season 2021-22 --output predictions.json
+"""
+
+import argparse
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import data_processing as dp
+import fast_predictor
+import game_features
+import season_stats
+
+# The columns the model makes predictions from, which are the game columns without the result and date
+feature_columns = season_stats.game_columns[:-2]
+
+
+def get_date_range(start_date, end_date):
+    """
+    :param start_date:  The first date in format "mm/dd/yyyy"
+    :param end_date:    The last date in format "mm/dd/yyyy"
+    :return:            A list of every date from start_date to end_date in format "mm/dd/yyyy"
+    """
+    start = datetime.strptime(start_date, '%m/%d/%Y')
+    end = datetime.strptime(end_date, '%m/%d/%Y')
+    return [(start + timedelta(days=i)).strftime('%m/%d/%Y') for i in range((end - start).days + 1)]
+
+
+def get_season_for_date(date):
+    """
+    Figures out the season a date belongs to.
+    Example: if the date is 04/13/2022 the season will be 2021-22. If the date is 10/13/2022 the season will be 2022-23.
+
+    :param date:    A date in format "mm/dd/yyyy"
+    :return:        The season in format "yyyy-yy"
+    """
+    if int(date[0:2]) < 10:
+        return f"{int(date[6:]) - 1}-{date[8:]}"
+    return f"{int(date[6:])}-{int(date[8:]) + 1}"
+
+
+def collect_games(dates, nba_teams, stats_source='game_log', extra_features=False, endpoints=None):
+    """
+    Collects the games on every date and both team's stats through the day before each game. Everything that can be
+    shared between dates is only collected once per season.
+
+    :param dates:           A list of dates in format "mm/dd/yyyy"
+    :param nba_teams:       Dictionary containing all of the NBA teams and their IDs
+    :param stats_source:    'game_log' to compute every date's stats from one season game log, or 'dashboard' to ask
+                            the API for each team's stats like nba_predictor.py does
+    :param extra_features:  If True, add the head-to-head, recent form and rest features from game_features.py
+    :param endpoints:       The types of stats the 'dashboard' source requests, from dp.get_required_endpoints. Every
+                            type is requested if this is None.
+    :return:                A DataFrame containing the date, both teams and both team's stats for every game
+    """
+    season_data = {}  # Season -> the season start date, or the cumulative stats computed from the game log
+    games = []
+
+    for date in dates:
+        matchups = dp.get_matchups(date, nba_teams)
+        if not matchups:
+            continue
+
+        season = get_season_for_date(date)
+        previous_day = (datetime.strptime(date, '%m/%d/%Y') - timedelta(days=1)).strftime('%m/%d/%Y')
+        print(f"{date}: {len(matchups)} game(s)")
+
+        if stats_source == 'dashboard':
+            if season not in season_data:
+                season_data[season] = dp.get_season_start_end(season)[0]
+            for game in dp.combine_games_stats([matchups], season_data[season], previous_day, season, nba_teams,
+                                               endpoints=endpoints):
+                games.append([date] + game)
+            continue
+
+        if season not in season_data:
+            season_data[season] = season_stats.compute_cumulative_stats(dp.get_season_game_log(season))
+        team_stats = season_stats.stats_as_of(season_data[season], previous_day)
+
+        # Teams that haven't played yet this season don't have any stats, which the model treats as missing values
+        for home_team, away_team in matchups.items():
+            game = [date, home_team, away_team]
+            for team in (home_team, away_team):
+                team_id = nba_teams[team]
+                if team_id in team_stats.index:
+                    game.extend(team_stats.loc[team_id, season_stats.stat_names].tolist())
+                else:
+                    game.extend([np.nan] * len(season_stats.stat_names))
+            games.append(game)
+
+    games_df = pd.DataFrame(games, columns=['DATE'] + feature_columns)
+    if not extra_features or games_df.empty:
+        return games_df
+
+    # The features are computed per season, from the same game log the training set was built from
+    seasons = games_df['DATE'].map(get_season_for_date)
+    season_dfs = [game_features.add_game_features(games_df[seasons == season], dp.get_season_game_log(season),
+                                                  nba_teams) for season in seasons.unique()]
+    return pd.concat(season_dfs)
+
+
+def predict_dates(dates, stats_source='game_log', extra_features=None):
+    """
+    Predicts every game on a list of dates with a single call to the model
+
+    :param dates:           A list of dates in format "mm/dd/yyyy"
+    :param stats_source:    'game_log' or 'dashboard', see collect_games
+    :param extra_features:  Whether to add the features from game_features.py. If this is None, they're added when the
+                            exported model was trained with them
+    :return:                A DataFrame containing the date, the teams, their stats, the predicted result (1 if the home
+                            team wins) and the predicted winner of every game
+    """
+    if extra_features is None:
+        extra_features = bool(set(game_features.feature_names) & set(fast_predictor.model_feature_names()))
+    nba_teams = dp.get_teams()
+    # Only the types of stats the exported model uses are requested
+    endpoints = dp.get_required_endpoints(fast_predictor.model_feature_names())
+    games_df = collect_games(dates, nba_teams, stats_source, extra_features, endpoints)
+    if games_df.empty:
+        return games_df
+
+    columns = feature_columns + game_features.feature_names if extra_features else feature_columns
+    predictions = fast_predictor.make_predictions(games_df[columns].copy())
+    games_df['PREDICTED_RESULT'] = predictions['PREDICTED_RESULT'].to_numpy()
+    games_df['PREDICTED_WINNER'] = np.where(games_df['PREDICTED_RESULT'] == 1, games_df['HOME_TEAM'],
+                                            games_df['AWAY_TEAM'])
+    return games_df
+
+
+def save_predictions(predictions_df, output):
+    """
+    Saves predictions to a CSV file, or a JSON file if the file name ends with .json
+
+    :param predictions_df:  The DataFrame returned by predict_dates
+    :param output:          The file to save the predictions to
+    """
+    if output.endswith('.json'):
+        predictions_df.to_json(output, orient='records', indent=2)
+    else:
+        predictions_df.to_csv(output, index=False)
+
+
+def main(args=None):
+    """
+    Predicts every game between two dates, or in a whole season, and saves the predictions
+
+    :param args:    The command line arguments. sys.argv is used if this is None
+    """
+    parser = argparse.ArgumentParser(description="Predict every NBA game in a range of dates.")
+    parser.add_argument('--start', help="The first date to predict in format mm/dd/yyyy")
+    parser.add_argument('--end', help="The last date to predict in format mm/dd/yyyy. Defaults to the start date")
+    parser.add_argument('--season', help="Predict every game of a season instead, in format yyyy-yy")
+    parser.add_argument('--output', default='predictions.csv', help="The CSV or JSON file to save the predictions to")
+    parser.add_argument('--stats', choices=['game_log', 'dashboard'], default='game_log',
+                        help="Where the team stats come from")
+    args = parser.parse_args(args)
+
+    if args.season:
+        start_date, end_date = dp.get_season_start_end(args.season)
+    elif args.start:
+        start_date, end_date = args.start, args.end or args.start
+    else:
+        parser.error("either --start or --season is required")
+
+    predictions_df = predict_dates(get_date_range(start_date, end_date), args.stats)
+    if predictions_df.empty:
+        print("There are no games to predict!")
+        return
+
+    save_predictions(predictions_df, args.output)
+    print(f"Saved {len(predictions_df)} predictions to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,401 @@
+"""
+Author Name:    Victoria Scavetta
+Date:           4/19/2022
+Course:         Concepts in AI
+
+This program predicts the results of NBA games based on each team's stats and past matchups between the teams.
+
+This file (fake_stats_server.py) is a local stand-in for stats.nba.com that the benchmarks run against. It answers the
+LeagueGameLog, Scoreboard, TeamDashboardByGeneralSplits, LeagueDashTeamStats and LeagueGameFinder endpoints with
+recorded responses from the fixtures directory, or with responses made up from a synthetic season when there's no
+recording. Every response can be delayed and a share of them can fail on purpose, so the retries and the rate limiter
+are exercised too. In record mode, requests without a fixture are sent to the real API and the responses are saved as
+new fixtures.
+
+Example:    python benchmarks/fake_stats_server.py --port 8000 --latency 0.05 --failure-rate 0.02
+            python benchmarks/fake_stats_server.py --port 8000 --record
+"""
+
+import argparse
+from datetime import datetime, timedelta
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import random
+import sys
+import threading
+import time
+from urllib.parse import parse_qsl, urlparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nba_api.stats.endpoints import teamdashboardbygeneralsplits, leaguegamelog, scoreboard, leaguegamefinder, \
+    leaguedashteamstats  # noqa
+from nba_api.stats.library.http import STATS_HEADERS  # noqa
+from nba_api.stats.static import teams  # noqa
+import season_stats  # noqa
+
+fixtures_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+upstream_url = 'https://stats.nba.com/stats'
+
+# The endpoints the server can answer, by the name in the URL
+endpoint_classes = {cls.endpoint.lower(): cls for cls in [leaguegamelog.LeagueGameLog, scoreboard.Scoreboard,
+                                                          teamdashboardbygeneralsplits.TeamDashboardByGeneralSplits,
+                                                          leaguedashteamstats.LeagueDashTeamStats,
+                                                          leaguegamefinder.LeagueGameFinder]}
+
+
+def fixture_key(endpoint, params):
+    """
+    :param endpoint:    The name of the endpoint in the URL
+    :param params:      A list of the (name, value) query parameters
+    :return:            The name of the fixture file of a request
+    """
+    key = json.dumps([endpoint.lower(), sorted(params)])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class SyntheticLeague:
+    """
+    A made up season for every requested season, with the real teams, used when a request has no recorded fixture. The
+    same season and seed always make the same games.
+    """
+
+    def __init__(self, days=60, seed=0):
+        """
+        :param days:    The amount of days each season lasts
+        :param seed:    The seed of the random stats and results
+        """
+        self.days = days
+        self.seed = seed
+        # Season -> the last day whose games are over in format "yyyy-mm-dd". The later games are on the scoreboard but
+        # not in the game log or the stats yet, like a season that is being played.
+        self.played_through = {}
+        self._seasons = {}
+        self._lock = threading.Lock()
+
+    def game_log(self, season):
+        """
+        :param season:  The season in format "yyyy-yy"
+        :return:        A list containing the season's LeagueGameLog DataFrame and its cumulative stats
+        """
+        with self._lock:
+            if season not in self._seasons:
+                game_log_df = self._make_season(season)
+                self._seasons[season] = [game_log_df, season_stats.compute_cumulative_stats(game_log_df)]
+            return self._seasons[season]
+
+    def _make_season(self, season):
+        rng = np.random.default_rng([self.seed, int(season[:4])])
+        nba_teams = sorted(teams.get_teams(), key=lambda team: team['id'])
+        start = datetime(int(season[:4]), 10, 19)
+        game_id = int(season[2:4]) * 100000 + 20000001
+
+        rows = []
+        for day in range(self.days):
+            # Leave a day off every week, like the breaks in the real schedule
+            if day % 7 == 6:
+                continue
+            date = (start + timedelta(days=day)).strftime('%Y-%m-%d')
+            playing = rng.permutation(len(nba_teams))[:int(rng.integers(4, 15)) * 2]
+            for i in range(0, len(playing), 2):
+                home, away = nba_teams[playing[i]], nba_teams[playing[i + 1]]
+                home_pts, away_pts = (int(pts) for pts in rng.integers(90, 130, 2))
+                if home_pts == away_pts:
+                    home_pts += 1
+                for team, opponent, pts, opp_pts, is_home in [(home, away, home_pts, away_pts, True),
+                                                              (away, home, away_pts, home_pts, False)]:
+                    fga, fgm = int(rng.integers(80, 95)), int(rng.integers(35, 50))
+                    fg3a, fg3m = int(rng.integers(25, 40)), int(rng.integers(8, 16))
+                    fta = int(rng.integers(15, 30))
+                    ftm = int(rng.integers(10, fta))
+                    oreb, dreb = int(rng.integers(5, 15)), int(rng.integers(30, 40))
+                    separator = 'vs.' if is_home else '@'
+                    rows.append({
+                        'SEASON_ID': f'2{season[:4]}', 'TEAM_ID': team['id'], 'TEAM_ABBREVIATION': team['abbreviation'],
+                        'TEAM_NAME': team['full_name'], 'GAME_ID': f'00{game_id}', 'GAME_DATE': date,
+                        'MATCHUP': f"{team['abbreviation']} {separator} {opponent['abbreviation']}",
+                        'WL': 'W' if pts > opp_pts else 'L', 'MIN': 240, 'FGM': fgm, 'FGA': fga,
+                        'FG_PCT': round(fgm / fga, 3), 'FG3M': fg3m, 'FG3A': fg3a, 'FG3_PCT': round(fg3m / fg3a, 3),
+                        'FTM': ftm, 'FTA': fta, 'FT_PCT': round(ftm / fta, 3), 'OREB': oreb, 'DREB': dreb,
+                        'REB': oreb + dreb, 'AST': int(rng.integers(18, 30)), 'STL': int(rng.integers(4, 12)),
+                        'BLK': int(rng.integers(2, 8)), 'TOV': int(rng.integers(10, 18)), 'PF': 20, 'PTS': pts,
+                        'PLUS_MINUS': pts - opp_pts, 'VIDEO_AVAILABLE': 1
+                    })
+                game_id += 1
+
+        return pd.DataFrame(rows, columns=leaguegamelog.LeagueGameLog.expected_data['LeagueGameLog'])
+
+
+def _result_sets(endpoint_class, data_sets):
+    """
+    Puts DataFrames into the JSON format of the NBA api. Every data set the endpoint expects is included, even the ones
+    that are empty, since nba_api fails to load a response that is missing one.
+    """
+    result_sets = []
+    for name, headers in endpoint_class.expected_data.items():
+        data_set = data_sets.get(name)
+        if data_set is None:
+            result_sets.append({'name': name, 'headers': headers, 'rowSet': []})
+        else:
+            result_sets.append({'name': name, 'headers': list(data_set.columns),
+                                'rowSet': json.loads(data_set.to_json(orient='values'))})
+    return {'resultSets': result_sets}
+
+
+def _to_iso(date):
+    return datetime.strptime(date, '%m/%d/%Y').strftime('%Y-%m-%d')
+
+
+def synthetic_response(league, endpoint, params):
+    """
+    Makes up the response of a request from a synthetic season
+
+    :param league:      The SyntheticLeague
+    :param endpoint:    The name of the endpoint in the URL
+    :param params:      A dictionary of the query parameters
+    :return:            The response as a dictionary, or None if the endpoint isn't supported
+    """
+    endpoint_class = endpoint_classes.get(endpoint.lower())
+    if endpoint_class is None:
+        return None
+
+    if endpoint_class is scoreboard.Scoreboard:
+        date = _to_iso(params['GameDate'])
+        season_start = int(date[:4]) - (int(date[5:7]) < 10)
+        game_log_df = league.game_log(f"{season_start}-{str(season_start + 1)[2:]}")[0]
+        home = game_log_df[(game_log_df['GAME_DATE'] == date) &
+                           game_log_df['MATCHUP'].str.contains('vs.', regex=False)]
+        away = game_log_df[(game_log_df['GAME_DATE'] == date) &
+                           ~game_log_df['MATCHUP'].str.contains('vs.', regex=False)]
+        games = home[['GAME_ID', 'TEAM_ID']].merge(away[['GAME_ID', 'TEAM_ID']], on='GAME_ID', suffixes=('_H', '_A'))
+        header = pd.DataFrame({'GAME_DATE_EST': f'{date}T00:00:00', 'GAME_ID': games['GAME_ID'],
+                               'HOME_TEAM_ID': games['TEAM_ID_H'], 'VISITOR_TEAM_ID': games['TEAM_ID_A']})
+        return _result_sets(endpoint_class, {'GameHeader': header})
+
+    game_log_df, cumulative = league.game_log(params['Season'])
+    date_from = _to_iso(params['DateFrom']) if params.get('DateFrom') else None
+    date_to = _to_iso(params['DateTo']) if params.get('DateTo') else None
+    stats_through = params.get('DateTo')
+
+    # Games that aren't over yet aren't in any response except the scoreboard
+    played_through = league.played_through.get(params['Season'])
+    if played_through is not None:
+        game_log_df = game_log_df[game_log_df['GAME_DATE'] <= played_through]
+        if date_to is None or date_to > played_through:
+            date_to = played_through
+            stats_through = datetime.strptime(played_through, '%Y-%m-%d').strftime('%m/%d/%Y')
+
+    if endpoint_class is teamdashboardbygeneralsplits.TeamDashboardByGeneralSplits:
+        # The stats are the team's season-to-date stats through the end date. Both the base and the advanced stats are
+        # in every response, since the same columns are never asked for from both.
+        team_stats = season_stats.stats_as_of(cumulative, stats_through)
+        team_id = int(params['TeamID'])
+        if team_id not in team_stats.index:
+            return _result_sets(endpoint_class, {})
+        overall = team_stats.loc[[team_id], season_stats.stat_names].reset_index(drop=True)
+        overall.insert(0, 'GROUP_SET', 'Overall')
+        return _result_sets(endpoint_class, {'OverallTeamDashboard': overall})
+
+    if endpoint_class is leaguedashteamstats.LeagueDashTeamStats:
+        # Every team's stats through the end date, the same as each team's dashboard
+        team_stats = season_stats.stats_as_of(cumulative, stats_through)
+        league = team_stats[['TEAM_NAME'] + season_stats.stat_names].reset_index()
+        return _result_sets(endpoint_class, {'LeagueDashTeamStats': league})
+
+    games = game_log_df
+    if date_from is not None:
+        games = games[games['GAME_DATE'] >= date_from]
+    if date_to is not None:
+        games = games[games['GAME_DATE'] <= date_to]
+
+    if endpoint_class is leaguegamefinder.LeagueGameFinder:
+        # The game finder returns the newest games first
+        columns = endpoint_class.expected_data['LeagueGameFinderResults']
+        games = games.iloc[::-1][columns]
+        return _result_sets(endpoint_class, {'LeagueGameFinderResults': games})
+
+    return _result_sets(endpoint_class, {'LeagueGameLog': games})
+
+
+class FakeStatsServer:
+    """
+    A local HTTP server that answers nba_api stats requests, running in a background thread
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, fixtures=fixtures_dir, latency=0.0, jitter=0.0, failure_rate=0.0,
+                 record=False, upstream=upstream_url, season_days=60, seed=0):
+        """
+        :param host:            The address to listen on
+        :param port:            The port to listen on. A free port is picked if this is 0
+        :param fixtures:        The directory of recorded responses, or None to only use synthetic responses
+        :param latency:         The amount of seconds every response is delayed by
+        :param jitter:          Up to this many seconds are randomly added to the latency
+        :param failure_rate:    The share of requests, from 0 to 1, that fail with a 500 error
+        :param record:          If True, requests without a fixture are sent to the upstream API and saved as fixtures
+        :param upstream:        The base URL of the real API, used in record mode
+        :param season_days:     The amount of days in each synthetic season
+        :param seed:            The seed of the synthetic seasons, the jitter and the failures
+        """
+        self.fixtures = fixtures
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.record = record
+        self.upstream = upstream.rstrip('/')
+        self.league = SyntheticLeague(season_days, seed)
+        self.counts = {'requests': 0, 'fixtures': 0, 'synthetic': 0, 'recorded': 0, 'failures': 0}
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        """
+        :return:    The URL to pass to api_client.set_base_url
+        """
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}/stats'
+
+    def start(self):
+        """
+        Starts answering requests in a background thread
+
+        :return:    The server
+        """
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops the server
+        """
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def _fixture_path(self, endpoint, params):
+        return os.path.join(self.fixtures, endpoint.lower(), f'{fixture_key(endpoint, params)}.json')
+
+    def _record(self, endpoint, params):
+        # Only imported in record mode, since replaying never touches the network
+        import requests
+        response = requests.get(f'{self.upstream}/{endpoint}', params=params, headers=STATS_HEADERS, timeout=30)
+        response.raise_for_status()
+        body = response.json()
+
+        path = self._fixture_path(endpoint, params)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f'{path}.tmp', 'w') as file:
+            json.dump({'endpoint': endpoint, 'params': params, 'response': body}, file)
+        os.replace(f'{path}.tmp', path)
+        return body
+
+    def respond(self, endpoint, params):
+        """
+        Answers one request
+
+        :param endpoint:    The name of the endpoint in the URL
+        :param params:      A list of the (name, value) query parameters
+        :return:            A list containing the HTTP status and the response as a dictionary
+        """
+        self._count('requests')
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            fail = self._random.random() < self.failure_rate
+        if delay > 0:
+            time.sleep(delay)
+        if fail:
+            self._count('failures')
+            return [500, None]
+
+        # Recorded responses come first, then the upstream API in record mode, then a synthetic response
+        if self.fixtures is not None:
+            path = self._fixture_path(endpoint, params)
+            if os.path.exists(path):
+                self._count('fixtures')
+                with open(path, 'r') as file:
+                    return [200, json.load(file)['response']]
+            if self.record:
+                self._count('recorded')
+                return [200, self._record(endpoint, params)]
+
+        body = synthetic_response(self.league, endpoint, dict(params))
+        if body is None:
+            return [404, None]
+        self._count('synthetic')
+        return [200, body]
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                endpoint = url.path.rstrip('/').rsplit('/', 1)[-1]
+                try:
+                    status, body = server.respond(endpoint, parse_qsl(url.query, keep_blank_values=True))
+                except Exception as error:
+                    status, body = 500, {'error': str(error)}
+
+                content = json.dumps(body).encode('utf-8') if body is not None else b'An error has occurred.'
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def main(args=None):
+    """
+    Runs the fake server from the command line until it's stopped with Ctrl+C
+
+    :param args:    The command line arguments. sys.argv is used if this is None
+    """
+    parser = argparse.ArgumentParser(description="A local stand-in for the NBA stats API.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--fixtures', default=fixtures_dir, help="The directory of recorded responses")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds every response is delayed by")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Up to this many seconds are added to the latency")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="The share of requests that fail")
+    parser.add_argument('--record', action='store_true', help="Save responses from the real API as new fixtures")
+    parser.add_argument('--season-days', type=int, default=60, help="The length of the synthetic seasons")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(args)
+
+    server = FakeStatsServer(args.host, args.port, args.fixtures, args.latency, args.jitter, args.failure_rate,
+                             args.record, season_days=args.season_days, seed=args.seed)
+    print(f"Serving the NBA stats API at {server.base_url}. Point the program at it with "
+          f"api_client.set_base_url('{server.base_url}')")
+    server.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,341 @@
+"""
+Author Name:    Victoria Scavetta
+Date:           4/19/2022
+Course:         Concepts in AI
+
+This program predicts the results of NBA games based on each team's stats and past matchups between the teams.
+
+This file (run_benchmarks.py) times the slow parts of the program against the local fake stats server instead of the
+live API: building a season, making one night's predictions (also on the first day of a season, when no team has any
+stats yet), training the model and scoring games. Every run is saved as a JSON file in benchmarks/results, and passing
+an earlier results file with --compare prints how much each benchmark changed, so regressions show up.
+
+Example:    python benchmarks/run_benchmarks.py
+            python benchmarks/run_benchmarks.py --latency 0.05 --failure-rate 0.02 --compare benchmarks/results/old.json
+"""
+
+import argparse
+import contextlib
+from datetime import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(benchmarks_dir)
+sys.path.insert(0, repo_dir)
+
+import api_cache  # noqa
+import api_client  # noqa
+import data_processing as dp  # noqa
+import fast_predictor  # noqa
+import season_stats  # noqa
+import stats_cache  # noqa
+from fake_stats_server import FakeStatsServer  # noqa
+
+results_dir = os.path.join(benchmarks_dir, 'results')
+
+# The XGBoost hyperparameters of the benchmark model, the same as the best grid search parameters
+train_params = {'n_estimators': 100, 'learning_rate': 0.1, 'max_depth': 2}
+
+
+@contextlib.contextmanager
+def fresh_state():
+    """
+    Gives a benchmark empty caches and fresh request metrics, so every repeat does the same amount of work
+    """
+    cache_dir = tempfile.mkdtemp(prefix='nba_bench_cache_')
+    old_cache = api_cache.default_cache
+    old_stats_cache = stats_cache.default_cache
+    api_cache.default_cache = api_cache.ResponseCache(cache_dir)
+    stats_cache.default_cache = stats_cache.TeamStatsCache(os.path.join(cache_dir, 'team_stats.sqlite'))
+    dp._team_game_dates.clear()
+    api_client.metrics = api_client.EndpointMetrics()
+    api_client.breakers.clear()
+    try:
+        yield
+    finally:
+        api_cache.default_cache = old_cache
+        stats_cache.default_cache = old_stats_cache
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def request_count():
+    """
+    :return:    The amount of requests that reached the server since the last fresh_state
+    """
+    return sum(metrics['requests'] for metrics in api_client.metrics.summary().values())
+
+
+def time_repeats(function, repeats):
+    """
+    Runs a benchmark a few times
+
+    :param function:    A function that runs the benchmark once and returns a dictionary of extra measurements
+    :param repeats:     The amount of times to run it
+    :return:            A dictionary containing the time of every run, the median time and the measurements of the
+                        last run
+    """
+    seconds = []
+    extra = {}
+    for i in range(repeats):
+        with fresh_state():
+            start = time.perf_counter()
+            # The program prints every day and game it collects, which would drown out the results
+            with contextlib.redirect_stdout(io.StringIO()):
+                extra = function() or {}
+            seconds.append(time.perf_counter() - start)
+    return {'seconds': seconds, 'median_seconds': statistics.median(seconds), 'min_seconds': min(seconds), **extra}
+
+
+def bench_season_build(season, season_days):
+    """
+    Builds a season day by day with two TeamDashboardByGeneralSplits requests per team, like data_processing.main
+    """
+    def run():
+        nba_teams = dp.get_teams()
+        start_date, end_date = dp.get_season_start_end(season)
+        games_df = dp.get_season_games_df(datetime.strptime(start_date, '%m/%d/%Y'),
+                                          datetime.strptime(end_date, '%m/%d/%Y'), season, nba_teams)
+        return {'games': len(games_df), 'requests': request_count(), 'failed_days': len(games_df.attrs['failed_days'])}
+
+    result = time_repeats(run, 1)
+    result['games_per_second'] = result['games'] / result['median_seconds']
+    result['season_days'] = season_days
+    return result
+
+
+def bench_season_build_game_log(season, repeats):
+    """
+    Builds a season from a single game log, like data_processing.main(from_game_log=True)
+    """
+    def run():
+        games_df = season_stats.build_season_games_df(dp.get_season_game_log(season))
+        return {'games': len(games_df), 'requests': request_count()}
+
+    result = time_repeats(run, repeats)
+    result['games_per_second'] = result['games'] / result['median_seconds']
+    return result
+
+
+def bench_nightly_prediction(season, date, model_path, repeats):
+    """
+    Makes one night's predictions the same way nba_predictor.py does, starting from an empty cache
+    """
+    def run():
+        nba_teams = dp.get_teams()
+        matchups = dp.get_matchups(date, nba_teams)
+        season_start = dp.get_season_start_end(season)[0]
+        previous_day = (pd.to_datetime(date) - pd.Timedelta(days=1)).strftime('%m/%d/%Y')
+        endpoints = dp.get_required_endpoints(fast_predictor.model_feature_names(model_path))
+        games_stats = dp.combine_games_stats([matchups], season_start, previous_day, season, nba_teams,
+                                             endpoints=endpoints)
+        games_df = pd.DataFrame(games_stats, columns=season_stats.game_columns[:-2])
+        fast_predictor.make_predictions(games_df, model_path)
+        return {'games': len(games_df), 'requests': request_count()}
+
+    return time_repeats(run, repeats)
+
+
+def bench_season_opener(league, season, model_path, repeats):
+    """
+    Makes the predictions of a season's first day before any of its games are over, the same way nba_predictor.py
+    does. No team has any stats yet, so none should be requested.
+    """
+    first_day = pd.to_datetime(league.game_log(season)[0]['GAME_DATE'].min())
+    league.played_through[season] = (first_day - pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    date = first_day.strftime('%m/%d/%Y')
+
+    def run():
+        nba_teams = dp.get_teams()
+        games_df = dp.get_prediction_games(date, season, nba_teams, fast_predictor.model_feature_names(model_path))
+        fast_predictor.make_predictions(games_df, model_path)
+        return {'games': len(games_df), 'requests': request_count()}
+
+    return time_repeats(run, repeats)
+
+
+def bench_training(x, y, repeats):
+    """
+    Trains the model with fixed hyperparameters on the synthetic games
+    """
+    from xgboost import XGBClassifier
+    trained = []
+
+    def run():
+        model = XGBClassifier(objective='binary:logistic', **train_params)
+        model.fit(x, y)
+        trained.append(model)
+        return {'rows': len(x)}
+
+    result = time_repeats(run, repeats)
+    result['rows_per_second'] = result['rows'] / result['median_seconds']
+    return [result, trained[-1]]
+
+
+def bench_scoring(model, model_path, x, rows, repeats):
+    """
+    Scores many games with the exported trees in fast_predictor.py and with XGBoost itself
+    """
+    x = np.resize(x, (rows, x.shape[1])).astype(np.float32)
+    ensemble = fast_predictor.load(model_path)
+
+    def run_numpy():
+        ensemble.predict(x)
+        return {'rows': rows}
+
+    def run_xgboost():
+        model.predict(x)
+        return {'rows': rows}
+
+    numpy_result = time_repeats(run_numpy, repeats)
+    numpy_result['rows_per_second'] = rows / numpy_result['median_seconds']
+    xgboost_result = time_repeats(run_xgboost, repeats)
+    xgboost_result['rows_per_second'] = rows / xgboost_result['median_seconds']
+    return [numpy_result, xgboost_result]
+
+
+def environment():
+    """
+    :return:    A dictionary describing the machine, the library versions and the commit the benchmarks ran on
+    """
+    versions = {}
+    for package in ['numpy', 'pandas', 'sklearn', 'xgboost', 'nba_api']:
+        try:
+            versions[package] = __import__(package).__version__
+        except (ImportError, AttributeError):
+            versions[package] = None
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=repo_dir, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'commit': commit, 'packages': versions}
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints how much each benchmark's median time changed since an earlier run
+
+    :param results:     The results of this run
+    :param baseline:    The results of the earlier run
+    :param threshold:   The share a benchmark can slow down by before it counts as a regression. ex: 0.1 for 10%
+    :return:            The names of the benchmarks that regressed
+    """
+    regressions = []
+    print("\nCompared to", baseline.get('timestamp'), f"({baseline.get('environment', {}).get('commit')})")
+    for name, result in results['benchmarks'].items():
+        old = baseline.get('benchmarks', {}).get(name)
+        if old is None:
+            print(f"  {name}: new")
+            continue
+        change = result['median_seconds'] / old['median_seconds'] - 1
+        regressed = change > threshold
+        if regressed:
+            regressions.append(name)
+        print(f"  {name}: {old['median_seconds']:.3f}s -> {result['median_seconds']:.3f}s ({change * 100:+.1f}%)"
+              f"{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main(args=None):
+    """
+    Runs every benchmark, prints the results and saves them to a JSON file
+
+    :param args:    The command line arguments. sys.argv is used if this is None
+    :return:        0, or 1 if --compare found a regression
+    """
+    parser = argparse.ArgumentParser(description="Benchmarks of the NBA game predictor against a fake stats server.")
+    parser.add_argument('--season', default='2021-22')
+    parser.add_argument('--season-days', type=int, default=30, help="The length of the synthetic season")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds every fake response is delayed by")
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="The share of fake requests that fail")
+    parser.add_argument('--rate', type=float, default=1000.0,
+                        help="The request rate limit. The real budget is api_client.requests_per_second")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--score-rows', type=int, default=100000, help="The amount of games scored at once")
+    parser.add_argument('--fixtures', default=None, help="A directory of recorded responses to replay")
+    parser.add_argument('--output', default=None, help="The results file. Defaults to benchmarks/results/<time>.json")
+    parser.add_argument('--compare', default=None, help="An earlier results file to compare with")
+    parser.add_argument('--threshold', type=float, default=0.1, help="The slowdown that counts as a regression")
+    args = parser.parse_args(args)
+
+    server = FakeStatsServer(fixtures=args.fixtures, latency=args.latency, jitter=args.jitter,
+                             failure_rate=args.failure_rate, season_days=args.season_days).start()
+    api_client.set_base_url(server.base_url)
+    api_client.configure(args.rate, max(1, int(args.rate)))
+    # Failures are injected on purpose, so the retries only wait a moment instead of backing off for seconds
+    api_client.base_delay = 0.01 if args.failure_rate > 0 else api_client.base_delay
+    work_dir = tempfile.mkdtemp(prefix='nba_bench_')
+
+    results = {'timestamp': datetime.now().isoformat(timespec='seconds'), 'environment': environment(),
+               'config': vars(args), 'benchmarks': {}}
+    benchmarks = results['benchmarks']
+    try:
+        print("Building a season from the team dashboards...")
+        benchmarks['season_build'] = bench_season_build(args.season, args.season_days)
+        print("Building a season from the game log...")
+        benchmarks['season_build_game_log'] = bench_season_build_game_log(args.season, args.repeats)
+
+        # The synthetic season is the training set of the training and scoring benchmarks
+        with fresh_state():
+            games_df = season_stats.build_season_games_df(dp.get_season_game_log(args.season))
+        x = games_df[season_stats.game_columns[2:-2]].to_numpy(dtype=np.float32)
+        y = games_df['RESULT'].to_numpy()
+
+        print("Training...")
+        benchmarks['training'], model = bench_training(x, y, args.repeats)
+        model_path = os.path.join(work_dir, 'nba_model.json')
+        model.get_booster().feature_names = season_stats.game_columns[2:-2]
+        model.get_booster().save_model(model_path)
+
+        print("Making one night's predictions...")
+        night = games_df['DATE'].iloc[len(games_df) // 2]
+        benchmarks['nightly_prediction'] = bench_nightly_prediction(args.season, night, model_path, args.repeats)
+        print("Making the predictions of the next season's first day...")
+        next_season = f"{int(args.season[:4]) + 1}-{str(int(args.season[:4]) + 2)[2:]}"
+        benchmarks['season_opener'] = bench_season_opener(server.league, next_season, model_path, args.repeats)
+
+        print("Scoring...")
+        benchmarks['scoring_numpy'], benchmarks['scoring_xgboost'] = bench_scoring(model, model_path, x,
+                                                                                   args.score_rows, args.repeats)
+    finally:
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    results['server'] = dict(server.counts)
+
+    print()
+    for name, result in benchmarks.items():
+        details = ', '.join(f"{key} {value:.1f}" if isinstance(value, float) else f"{key} {value}"
+                            for key, value in result.items() if key not in ('seconds', 'median_seconds', 'min_seconds'))
+        print(f"{name}: {result['median_seconds']:.3f}s median ({details})")
+    print(f"Fake server: {server.counts}")
+
+    output = args.output
+    if output is None:
+        os.makedirs(results_dir, exist_ok=True)
+        output = os.path.join(results_dir, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f"Saved the results to {output}")
+
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            if compare(results, json.load(file), args.threshold):
+                return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
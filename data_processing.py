@@ -9,11 +9,26 @@ This file (data_processing.py) contains all of the functions responsible for cre
 train the model.
 """
 
-from nba_api.stats.endpoints import teamdashboardbygeneralsplits, leaguegamelog, scoreboard, leaguegamefinder
-from nba_api.stats.static import teams
+from nba_api.stats.endpoints import teamdashboardbygeneralsplits, leaguegamelog, scoreboard, \
+    leaguedashteamstats
+import numpy as np
 import pandas as pd
-from datetime import timedelta, datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+import multiprocessing
+import json
+import os
+import queue
+import threading
 import time
+import api_cache
+import api_client
+import feature_store
+import game_features
+import instrumentation
+import nba_metadata
+import season_stats
+import stats_cache
 
 stats = {
     'W_PCT': 'Base',
@@ -31,91 +46,314 @@ stats = {
     'TS_PCT': 'Advanced'
 }
 
+# The parameters that ask a dashboard endpoint for each type of stats in the stats dict
+measure_params = {
+    'Base': {'per_mode_detailed': 'Per100Possessions'},
+    'Advanced': {'measure_type_detailed_defense': 'Advanced'}
+}
+
+
+def get_required_endpoints(feature_names=None):
+    """
+    Figures out which dashboard requests a model needs. Each type of stats in the stats dict is its own request, so a
+    model that doesn't use any of a type's stats doesn't need that request.
+
+    :param feature_names:   The names of the features the model was trained on, or None (or an empty list) if they
+                            aren't known
+    :return:                A list of the stat types to request, like ['Base', 'Advanced']. Every type is returned if
+                            feature_names is None or empty, and none if the model only uses the game features.
+    """
+    measure_types = list(dict.fromkeys(stats.values()))
+    if not feature_names:
+        return measure_types
+    feature_names = set(feature_names)
+    return [measure_type for measure_type in measure_types
+            if any(stat_type == measure_type and (f'H_{stat}' in feature_names or f'A_{stat}' in feature_names)
+                   for stat, stat_type in stats.items())]
+
+
+def _missing_endpoints(team_stats_dict, endpoints):
+    """
+    :return:    The stat types in endpoints that have at least one stat missing from team_stats_dict
+    """
+    return [measure_type for measure_type in endpoints
+            if team_stats_dict is None or any(stat_type == measure_type and stat not in team_stats_dict
+                                              for stat, stat_type in stats.items())]
+
 
 def get_teams():
     """
-    Pulls all of the current teams from the NBA api and returns a dictionary containing the team names and their IDs
+    Gets all of the current teams from the team table in nba_metadata.py and returns a dictionary containing the team
+    names and their IDs
 
     :return:    A dictionary containing the team names and their team ID
     """
-    nba_teams = teams.get_teams()
+    # The API refers to the Clippers as either the LA or Los Angeles Clippers, so the dict has both names
+    return nba_metadata.teams_dict()
+
+
+def get_team_stats(team, start_date, end_date, season, nba_teams, endpoints=None):
+    """
+    Gets the stats for a team between the specified start date and end date. The stats are remembered by stats_cache, so
+    the stats of a team through a date are only requested once, whether they're needed for the datasets or for a
+    prediction.
+
+    :param nba_teams:   Dictionary containing all of the NBA teams and their IDs
+    :param team:        The team to return stats for
+    :param start_date:  The start date for the stats in format 'mm/dd/yyyy'
+    :param end_date:    The end date for the stats in format 'mm/dd/yyyy'
+    :param season:      The NBA season to get the stats from. ex: '2021-22'
+    :param endpoints:   The types of stats to get, from get_required_endpoints. Every type is collected if this is None
+    :return:            A dictionary containing team stats
+    """
+    if endpoints is None:
+        endpoints = get_required_endpoints()
+    team_id = nba_teams[team]
+
+    # A team's stats only change on the days it plays, so the stats through any date are the same as the stats through
+    # the team's last game before it. Using that game's date in the key lets the stats collected for the team's last
+    # game be reused for every date until its next game.
+    # Stats through a date whose games aren't all over yet would change under the same key, so they aren't cached
+    final = is_final(season, end_date)
+    end_date = last_game_date(team_id, season, end_date)
+    key = [team_id, season, start_date, end_date]
+
+    # Only the types of stats that aren't cached yet are requested, and they're added to the cached ones
+    stats_dict = stats_cache.default_cache.get(key) if final else None
+    missing = _missing_endpoints(stats_dict, endpoints)
+    if missing:
+        stats_dict = {**(stats_dict or {}), **request_team_stats(team, start_date, end_date, season, nba_teams,
+                                                                 missing)}
+        if final:
+            stats_cache.default_cache.put(key, stats_dict)
+    # A model that only uses the game features needs no stats, so nothing is requested for a team that isn't cached
+    return dict(stats_dict or {})
+
+
+def get_league_team_stats(start_date, end_date, season, endpoints=None):
+    """
+    Gets the stats of every team between the specified start date and end date with two league-wide requests, one for
+    the base stats and one for the advanced stats, instead of two requests per team
+
+    :param start_date:  The start date for the stats in format 'mm/dd/yyyy'
+    :param end_date:    The end date for the stats in format 'mm/dd/yyyy'
+    :param season:      The NBA season to get the stats from. ex: '2021-22'
+    :param endpoints:   The types of stats to get, from get_required_endpoints. Every type is requested if this is None
+    :return:            A dictionary containing the same stats as get_team_stats for every team, keyed by team ID
+    """
+    if endpoints is None:
+        endpoints = get_required_endpoints()
+
+    league_stats = None
+    for measure_type in endpoints:
+        with instrumentation.span('stats.league_dashboard', measure=measure_type):
+            response = api_cache.fetch_endpoint(leaguedashteamstats.LeagueDashTeamStats,
+                                                **measure_params[measure_type],
+                                                season=season,
+                                                date_from_nullable=start_date,
+                                                date_to_nullable=end_date)
+
+        # Match up each team's rows from every request, keeping only the teams that are in all of them
+        rows = {row['TEAM_ID']: row for row in response.get_normalized_dict()['LeagueDashTeamStats']}
+        if league_stats is None:
+            league_stats = {team_id: {} for team_id in rows}
+        league_stats = {team_id: team_stats_dict for team_id, team_stats_dict in league_stats.items()
+                        if team_id in rows}
+        for team_id, team_stats_dict in league_stats.items():
+            team_stats_dict.update({stat: rows[team_id][stat] for stat, stat_type in stats.items()
+                                    if stat_type == measure_type})
+    return league_stats or {}
+
+
+def get_slate_team_stats(playing_teams, start_date, end_date, season, nba_teams, endpoints=None):
+    """
+    Gets the stats of every team playing on a day. Teams whose stats are already in stats_cache cost nothing. If any
+    team is missing, every team's stats are collected with get_league_team_stats and saved in stats_cache, so the
+    teams that play on the next few days are already cached too.
+
+    :param playing_teams:   A list of the teams to get stats for
+    :param start_date:      The start date for the stats in format 'mm/dd/yyyy'
+    :param end_date:        The end date for the stats in format 'mm/dd/yyyy'
+    :param season:          The NBA season to get the stats from. ex: '2021-22'
+    :param nba_teams:       Dictionary containing all of the NBA teams and their IDs
+    :param endpoints:       The types of stats to get, from get_required_endpoints. Every type is collected if this is
+                            None
+    :return:                A list containing a dictionary of stats for each team in playing_teams, in the same order
+    """
+    if endpoints is None:
+        endpoints = get_required_endpoints()
+
+    def cache_key(team_id):
+        return [team_id, season, start_date, last_game_date(team_id, season, end_date)]
+
+    # Stats through a date whose games aren't all over yet would change under the same key, so they aren't cached
+    final = is_final(season, end_date)
+    team_stats = {team: stats_cache.default_cache.get(cache_key(nba_teams[team])) if final else None
+                  for team in playing_teams}
+
+    # Only the types of stats that some playing team doesn't have cached yet are requested
+    missing = [measure_type for measure_type in endpoints
+               if any(_missing_endpoints(team_stats_dict, [measure_type]) for team_stats_dict in team_stats.values())]
+
+    if missing:
+        league_stats = get_league_team_stats(start_date, end_date, season, missing)
+        for team_id, team_stats_dict in league_stats.items():
+            if not final:
+                continue
+            # The new stats are added to whatever was already cached for the team
+            cached = stats_cache.default_cache.get(cache_key(team_id))
+            league_stats[team_id] = {**(cached or {}), **team_stats_dict}
+            stats_cache.default_cache.put(cache_key(team_id), league_stats[team_id])
+        for team in playing_teams:
+            if not _missing_endpoints(team_stats[team], endpoints):
+                continue
+            team_id = nba_teams[team]
+            if team_id in league_stats:
+                team_stats[team] = league_stats[team_id]
+                continue
+            # A team is only missing from the league-wide response when it hasn't played in the window yet, so it has
+            # no stats. They're None, the same as the game log path in batch_predict.py, instead of asking for the
+            # team's dashboard, which would be empty too.
+            team_stats[team] = {**(team_stats[team] or {}),
+                                **{stat: None for stat, stat_type in stats.items() if stat_type in missing}}
+            if final:
+                stats_cache.default_cache.put(cache_key(team_id), team_stats[team])
+
+    # A model that only uses the game features needs no stats, so nothing is requested for a team that isn't cached
+    return [dict(team_stats[team] or {}) for team in playing_teams]
+
+
+# Season -> [time it was built, last date in the game log, last finished date,
+#            {team ID: the team's game dates in order}]
+_team_game_dates = {}
+_team_game_dates_lock = threading.Lock()
+
+
+def get_team_game_dates(season):
+    """
+    Gets the dates every team played on in a season from the season game log. The dates are kept in memory, and are
+    collected again once the game log's cached response may have changed.
+
+    :param season:  The NBA season. ex: '2021-22'
+    :return:        A list containing the last date in the game log, the last date whose games are all over (see
+                    get_final_through), and a dictionary of each team's game dates, as datetime64[D] values and sorted
+                    datetime64[D] arrays keyed by team ID
+    """
+    ttl = api_cache.ttl_for({'season': season})
+
+    # The lock is held while the game log is collected, so the teams of a day that are fetched at the same time wait
+    # for one game log instead of each asking for it
+    with _team_game_dates_lock:
+        entry = _team_game_dates.get(season)
+        if entry is not None and (ttl is None or time.monotonic() - entry[0] < ttl):
+            return entry[1:]
+
+        game_log = get_season_game_log(season)
+        dates = pd.to_datetime(game_log['GAME_DATE']).values.astype('datetime64[D]')
+        team_ids = game_log['TEAM_ID'].to_numpy()
+        game_dates = {int(team_id): np.sort(dates[team_ids == team_id]) for team_id in np.unique(team_ids)}
+        last_date = dates.max() if len(dates) else None
+
+        # The game log gets each game as soon as it's over, so the last day in it may still have games being played.
+        # It's only finished once it has every game on the day's scoreboard.
+        final_date = last_date
+        if last_date is not None:
+            logged_games = game_log.loc[dates == last_date, 'GAME_ID'].nunique()
+            if logged_games < len(get_matchups(last_date.astype(datetime).strftime('%m/%d/%Y'), get_teams())):
+                final_date = last_date - np.timedelta64(1, 'D')
+
+        _team_game_dates[season] = [time.monotonic(), last_date, final_date, game_dates]
+        return [last_date, final_date, game_dates]
+
+
+def get_final_through(season):
+    """
+    Finds the last day of a season whose games are all over. The stats of any date window ending on or before it can't
+    change anymore.
 
-    teams_dict = {}
-    # We only need the team's name and their ID, so we make a dict containing only those values
-    for team in nba_teams:
-        teams_dict.update({team['full_name']: team['id']})
+    :param season:  The NBA season. ex: '2021-22'
+    :return:        The last finished day in format 'mm/dd/yyyy', or None if the season's game log is empty
+    """
+    final_date = get_team_game_dates(season)[1]
+    return None if final_date is None else final_date.astype(datetime).strftime('%m/%d/%Y')
+
+
+def is_final(season, end_date):
+    """
+    Checks whether the stats of a season through a date can still change. Only final stats are saved in stats_cache,
+    since stats for a date whose games aren't over yet would be kept under the same key as the finished stats.
+
+    :param season:      The NBA season. ex: '2021-22'
+    :param end_date:    A date in format 'mm/dd/yyyy'
+    :return:            True if every game of the season through end_date is over and in the game log
+    """
+    try:
+        final_date = get_team_game_dates(season)[1]
+    except api_client.RequestFailedError:
+        return False
+    end_day = np.datetime64(datetime.strptime(end_date, '%m/%d/%Y').date(), 'D')
+    return final_date is not None and end_day <= final_date
+
+
+def last_game_date(team_id, season, end_date):
+    """
+    Finds the team's last game on or before a date. If the date is after the end of the game log, the game log may not
+    have every game through the date yet, so the date is kept as it is.
+
+    :param team_id:     The team's ID
+    :param season:      The NBA season. ex: '2021-22'
+    :param end_date:    A date in format 'mm/dd/yyyy'
+    :return:            The date of the team's last game on or before end_date in format 'mm/dd/yyyy', or end_date if it
+                        can't be found
+    """
+    try:
+        last_date, final_date, game_dates = get_team_game_dates(season)
+    except api_client.RequestFailedError:
+        return end_date
 
-    teams_dict.update({'LA Clippers': 1610612746})  # This team is already in the dict, but for some reason the API
-    # refers to them as either LA or Los Angeles Clippers
+    end_day = np.datetime64(datetime.strptime(end_date, '%m/%d/%Y').date(), 'D')
+    team_dates = game_dates.get(team_id)
+    if last_date is None or team_dates is None or end_day > last_date:
+        return end_date
 
-    return teams_dict
+    position = np.searchsorted(team_dates, end_day, side='right')
+    if position == 0:
+        return end_date
+    return team_dates[position - 1].astype(datetime).strftime('%m/%d/%Y')
 
 
-def get_team_stats(team, start_date, end_date, season, nba_teams):
+def request_team_stats(team, start_date, end_date, season, nba_teams, endpoints=None):
     """
-    Gets the stats for a team between the specified start date and end date
+    Asks the API for the stats of a team between the specified start date and end date, without using stats_cache
 
     :param nba_teams:   Dictionary containing all of the NBA teams and their IDs
     :param team:        The team to return stats for
     :param start_date:  The start date for the stats in format 'mm/dd/yyyy'
     :param end_date:    The end date for the stats in format 'mm/dd/yyyy'
     :param season:      The NBA season to get the stats from. ex: '2021-22'
+    :param endpoints:   The types of stats to get, from get_required_endpoints. Every type is requested if this is None
     :return:            A dictionary containing team stats
     """
+    if endpoints is None:
+        endpoints = get_required_endpoints()
 
-    # There are many different exceptions that could occur from this, but it will work after a few attempts at most
-    success = False
-    while not success:
-        try:
-            team_stats = teamdashboardbygeneralsplits.TeamDashboardByGeneralSplits(team_id=nba_teams[team],
-                                                                                   per_mode_detailed='Per100Possessions',
-                                                                                   season=season,
-                                                                                   date_from_nullable=start_date,
-                                                                                   date_to_nullable=end_date)
-            success = True
-        except:
-            print("An exception occurred. Trying again...")
-            time.sleep(0.1)
-
-    team_stats_dict = team_stats.get_normalized_dict()  # Puts the stats into a dictionary for easier use
-    team_dashboard = team_stats_dict['OverallTeamDashboard'][0]
-
-    # There are many different exceptions that could occur from this, but it will work after a few attempts at most
-    # Advanced stats are NBA stats that are more complex
-    success = False
-    while not success:
-        try:
-            advanced_team_stats = teamdashboardbygeneralsplits.TeamDashboardByGeneralSplits(team_id=nba_teams[team],
-                                                                                            measure_type_detailed_defense='Advanced',
-                                                                                            season=season,
-                                                                                            date_from_nullable=start_date,
-                                                                                            date_to_nullable=end_date)
-            success = True
-        except:
-            print("An exception occurred. Trying again...")
-            time.sleep(0.1)
-
-    advanced_team_stats_dict = advanced_team_stats.get_normalized_dict()  # Puts the advanced stats into a dictionary
-    advanced_team_dashboard = advanced_team_stats_dict['OverallTeamDashboard'][0]
-
-    # Creating a dictionary containing all of the important team stats
-    final_team_stats = {
-        'W_PCT': team_dashboard['W_PCT'],
-        'FG_PCT': team_dashboard['FG_PCT'],
-        'FG3_PCT': team_dashboard['FG3_PCT'],
-        'FT_PCT': team_dashboard['FT_PCT'],
-        'REB': team_dashboard['REB'],
-        'AST': team_dashboard['AST'],
-        'TOV': team_dashboard['TOV'],
-        'STL': team_dashboard['STL'],
-        'BLK': team_dashboard['BLK'],
-        'PLUS_MINUS': team_dashboard['PLUS_MINUS'],
-        'OFF_RATING': advanced_team_dashboard['OFF_RATING'],
-        'DEF_RATING': advanced_team_dashboard['DEF_RATING'],
-        'TS_PCT': advanced_team_dashboard['TS_PCT']
-    }
-
-    return final_team_stats
+    # Advanced stats are NBA stats that are more complex, and they need their own request
+    final_team_stats = {}
+    for measure_type in endpoints:
+        with instrumentation.span('stats.team_dashboard', team=team, measure=measure_type):
+            team_stats = api_cache.fetch_endpoint(teamdashboardbygeneralsplits.TeamDashboardByGeneralSplits,
+                                                  team_id=nba_teams[team],
+                                                  **measure_params[measure_type],
+                                                  season=season,
+                                                  date_from_nullable=start_date,
+                                                  date_to_nullable=end_date)
+
+        team_dashboard = team_stats.get_normalized_dict()['OverallTeamDashboard'][0]
+        final_team_stats.update({stat: team_dashboard[stat] for stat, stat_type in stats.items()
+                                 if stat_type == measure_type})
+
+    # Keep the stats in the same order as the stats dict
+    return {stat: final_team_stats[stat] for stat in stats if stat in final_team_stats}
 
 
 def get_matchups(date, nba_teams):
@@ -127,31 +365,34 @@ def get_matchups(date, nba_teams):
     :return:            The matchups from a specified date in a dictionary where the home team is the key
     """
     # Get all of the matchups from the API and put them into a dictionary
-    matchups = scoreboard.Scoreboard(league_id='00', game_date=date)
+    with instrumentation.span('schedule.scoreboard', date=date):
+        matchups = api_cache.fetch_endpoint(scoreboard.Scoreboard, league_id='00', game_date=date)
     matchups_dict = matchups.get_normalized_dict()
     games = matchups_dict['GameHeader']
 
     # Create a new dictionary in the format {home team: away team}
     daily_matchups = {}
     for game in games:
-        home_team = ''
-        away_team = ''
+        home_team = _get_team_name(game['HOME_TEAM_ID'], nba_teams)
+        away_team = _get_team_name(game['VISITOR_TEAM_ID'], nba_teams)
+        daily_matchups.update({home_team: away_team})
 
-        home_team_id = game['HOME_TEAM_ID']
-        for team_name, team_id in nba_teams.items():
-            # Matching the home team ID to an ID in the nba_teams dict to get the team's name
-            if team_id == home_team_id:
-                home_team = team_name
+    return daily_matchups
 
-        away_team_id = game['VISITOR_TEAM_ID']
-        for team_name, team_id in nba_teams.items():
-            # Matching the away team ID to an ID in the nba_teams dict to get the team's name
-            if team_id == away_team_id:
-                away_team = team_name
 
-        daily_matchups.update({home_team: away_team})
+def _get_team_name(team_id, nba_teams):
+    """
+    Finds a team's name from its ID with one lookup in the team table. A team that isn't in the table is searched for in
+    nba_teams instead.
 
-    return daily_matchups
+    :param team_id:     The team's ID
+    :param nba_teams:   Dictionary containing all of the NBA teams and their IDs
+    :return:            The team's name, or an empty string if the ID isn't a team
+    """
+    name = nba_metadata.team_name(team_id)
+    if name is not None:
+        return name
+    return next((team_name for team_name, curr_id in nba_teams.items() if curr_id == team_id), '')
 
 
 def get_past_matchups(date, season):
@@ -163,17 +404,9 @@ def get_past_matchups(date, season):
     :return:        A list containing a dictionary of all matchups and a list of the results
     """
 
-    # There are many different exceptions that could occur from this, but it will work after a few attempts at most
-    success = False
-    while not success:
-        try:
-            games = leaguegamelog.LeagueGameLog(season=season, league_id='00', date_from_nullable=date,
-                                                date_to_nullable=date,
-                                                season_type_all_star='Regular Season')
-            success = True
-        except:
-            print("An exception occurred. Trying again...")
-            time.sleep(0.1)
+    games = api_cache.fetch_endpoint(leaguegamelog.LeagueGameLog, season=season, league_id='00',
+                                     date_from_nullable=date, date_to_nullable=date,
+                                     season_type_all_star='Regular Season')
     games_dict = games.get_normalized_dict()['LeagueGameLog']  # Puts the games into a dict
 
     matchups = {}  # Home teams are the keys, away teams are the values
@@ -201,7 +434,79 @@ def get_past_matchups(date, season):
     return [matchups, results]
 
 
-def get_season_games_df(start_date, end_date, season, nba_teams):
+def get_season_game_log(season):
+    """
+    Gets the box score of every team in every regular season game of a specified season with a single API call
+
+    :param season:  The NBA season to get the game log from. ex: '2021-22'
+    :return:        A DataFrame containing one row per team per game
+    """
+
+    with instrumentation.span('schedule.season_game_log', season=season):
+        games = api_cache.fetch_endpoint(leaguegamelog.LeagueGameLog, season=season, league_id='00',
+                                         player_or_team_abbreviation='T', season_type_all_star='Regular Season')
+
+    with instrumentation.span('dataframe.game_log', season=season):
+        return games.get_data_frames()[0]
+
+
+def get_schedule_index(season):
+    """
+    Gets the matchups and results of every day with games in a specified season from a single season game log, instead
+    of asking the API for each day separately
+
+    :param season:  The NBA season to get the schedule of. ex: '2021-22'
+    :return:        A dictionary where the keys are the dates with games in format "mm/dd/yyyy", in order, and the
+                    values are lists containing a dictionary of matchups and a list of the results, the same as
+                    get_past_matchups
+    """
+    game_log = get_season_game_log(season)
+
+    # Pair the home team's row with the away team's row of each game
+    is_home = game_log['MATCHUP'].str.contains('vs.', regex=False)
+    games = game_log[is_home][['GAME_ID', 'GAME_DATE', 'TEAM_NAME', 'WL']].merge(
+        game_log[~is_home][['GAME_ID', 'TEAM_NAME']], on='GAME_ID', suffixes=('_HOME', '_AWAY'))
+    games = games.sort_values(['GAME_DATE', 'GAME_ID'], kind='mergesort')
+
+    schedule = {}
+    for game in games.itertuples(index=False):
+        date = reformat_date(game.GAME_DATE[0:10])
+        matchups, results = schedule.setdefault(date, [{}, []])
+        matchups.update({game.TEAM_NAME_HOME: game.TEAM_NAME_AWAY})
+        results.append(game.WL)
+
+    return schedule
+
+
+def get_day_games(date, season_start, season, nba_teams, schedule=None):
+    """
+    Gets all of the games that happened on a specified date with both team's stats through that date
+
+    :param date:            The date to get the games from in format "mm/dd/yyyy"
+    :param season_start:    The start date of the season in format "mm/dd/yyyy"
+    :param season:          The NBA season the date belongs to
+    :param nba_teams:       Dictionary containing all of the NBA teams and their IDs
+    :param schedule:        The season's schedule index from get_schedule_index. If this is None, the games are
+                            requested from the API.
+    :return:                A list of games, each one a list of the teams, both team's stats, the result and the date
+    """
+    day_games = []
+    if schedule is not None:
+        curr_games = schedule.get(date, [{}, []])
+    else:
+        curr_games = get_past_matchups(date, season)
+
+    # If there are games occurring on that day, get the stats for each team and add the date to each game
+    if curr_games[0]:
+        # Combine the stats with the games
+        for game in combine_games_stats(curr_games, season_start, date, season, nba_teams):
+            game.append(date)
+            day_games.append(game)
+
+    return day_games
+
+
+def get_season_games_df(start_date, end_date, season, nba_teams, progress=None):
     """
     Puts all of the games that happened in a specified season and each team's stats per game into a Pandas DataFrame
 
@@ -209,45 +514,52 @@ def get_season_games_df(start_date, end_date, season, nba_teams):
     :param end_date:        The end date of the season as a datetime object
     :param season:          The NBA season to collect games and stats from
     :param nba_teams:       Dictionary containing all of the NBA teams and their IDs
+    :param progress:        A function called with the current date, the amount of days done and the total amount of
+                            days before each day is collected. If this is None, the date is printed instead.
     :return:                A Pandas DataFrame containing all games played in the season and both team's stats from each
-                            day
+                            day. Days that couldn't be collected are listed in its attrs['failed_days'].
     """
     season_games = []
-
-    curr_date = start_date
-    end = end_date + timedelta(days=1)  # Make end a day after the end date so the loop ends at the correct date
+    failed_days = []
     season_start_str = start_date.strftime('%m/%d/%Y')  # Turns the start date into a string
 
-    # Get all the games and team stats for each day from start_date to end_date
-    while curr_date != end:
-        curr_date_str = curr_date.strftime('%m/%d/%Y')  # Turn the current date into a string
-        print(curr_date_str)
-        time.sleep(0.01)
-        curr_games = get_past_matchups(curr_date_str, season)
+    # Only the days that actually have games are visited, so breaks like the All-Star break are skipped
+    schedule = get_schedule_index(season)
 
-        # If there are games occurring on that day, get the stats for each team and add them to the list of games
-        if curr_games:
-            # Combine the stats with the games
-            curr_games_stats = combine_games_stats(curr_games, season_start_str, curr_date_str, season, nba_teams)
-
-            # Add the games with stats into the list of season games
-            for game in curr_games_stats:
-                game.append(curr_date_str)
-                season_games.append(game)
+    # Get all the games and team stats for each day with games from start_date to end_date
+    game_days = [date for date in schedule if start_date <= datetime.strptime(date, '%m/%d/%Y') <= end_date]
+    for day_num, curr_date_str in enumerate(game_days):
+        if progress is None:
+            print(curr_date_str)
+        else:
+            progress(curr_date_str, day_num, len(game_days))
 
-        curr_date = curr_date + timedelta(days=1)  # Increment the day by 1
+        # If the API keeps failing for this day, skip it and report it at the end instead of retrying forever
+        try:
+            season_games.extend(get_day_games(curr_date_str, season_start_str, season, nba_teams, schedule))
+        except api_client.RequestFailedError as error:
+            print(f"Could not collect {curr_date_str}: {error}")
+            failed_days.append(curr_date_str)
 
     # Create a pandas Data Frame containing all of the games with each team's stats, the date, and the result
-    season_games_df = pd.DataFrame(season_games, columns=['HOME_TEAM', 'AWAY_TEAM', 'H_W_PCT', 'H_FG_PCT', 'H_FG3_PCT',
-                                                          'H_FT_PCT', 'H_REB', 'H_AST', 'H_TOV', 'H_STL', 'H_BLK',
-                                                          'H_PLUS_MINUS', 'H_OFF_RATING', 'H_DEF_RATING', 'H_TS_PCT',
-                                                          'A_W_PCT', 'A_FG_PCT', 'A_FG3_PCT', 'A_FT_PCT', 'A_REB',
-                                                          'A_AST', 'A_TOV', 'A_STL', 'A_BLK', 'A_PLUS_MINUS',
-                                                          'A_OFF_RATING', 'A_DEF_RATING', 'A_TS_PCT', 'RESULT', 'DATE'])
+    with instrumentation.span('dataframe.season_games', season=season, games=len(season_games)):
+        season_games_df = pd.DataFrame(season_games, columns=['HOME_TEAM', 'AWAY_TEAM', 'H_W_PCT', 'H_FG_PCT',
+                                                              'H_FG3_PCT', 'H_FT_PCT', 'H_REB', 'H_AST', 'H_TOV',
+                                                              'H_STL', 'H_BLK', 'H_PLUS_MINUS', 'H_OFF_RATING',
+                                                              'H_DEF_RATING', 'H_TS_PCT', 'A_W_PCT', 'A_FG_PCT',
+                                                              'A_FG3_PCT', 'A_FT_PCT', 'A_REB', 'A_AST', 'A_TOV',
+                                                              'A_STL', 'A_BLK', 'A_PLUS_MINUS', 'A_OFF_RATING',
+                                                              'A_DEF_RATING', 'A_TS_PCT', 'RESULT', 'DATE'])
+    season_games_df.attrs['failed_days'] = failed_days
+
+    if failed_days:
+        print(f"{len(failed_days)} day(s) of the {season} season could not be collected: {', '.join(failed_days)}")
+
     return season_games_df
 
 
-def combine_games_stats(games, start_date, end_date, season, nba_teams):
+def combine_games_stats(games, start_date, end_date, season, nba_teams, max_workers=8, league_wide=True,
+                        endpoints=None):
     """
     Gets the home team's and away team's stats for all of the games happening in a specified day
 
@@ -257,6 +569,13 @@ def combine_games_stats(games, start_date, end_date, season, nba_teams):
     :param end_date:    The date of the games in format "mm/dd/yyyy"
     :param season:      The current season in format "yyyy-yy"
     :param nba_teams:   A dictionary containing all of the NBA teams and their IDs
+    :param max_workers: The amount of team stats to fetch at the same time when league_wide is False. The requests
+                        themselves are kept under the rate limit by api_client, no matter how many workers there are.
+    :param league_wide: If True, get every team's stats with two league-wide requests (get_slate_team_stats) instead of
+                        two requests per team
+    :param endpoints:   The types of stats to get, from get_required_endpoints. A model that only uses some of the stats
+                        only needs their requests, and the stats that aren't requested are None. Every type is
+                        collected if this is None.
     :return:            A list containing both the home and away team's stats for each game
     """
     games_with_stats = []
@@ -269,23 +588,39 @@ def combine_games_stats(games, start_date, end_date, season, nba_teams):
     else:
         results = None
 
-    # For each game, get the home team's stats and away team's stats and add them to the current game list
+    # Fetch the stats of every team playing on this day at once. The order of the teams is home, away, home, away...
+    # so the stats can be matched back up with the games afterwards.
+    playing_teams = []
     for home_team, away_team in games[0].items():
+        playing_teams.extend([home_team, away_team])
+
+    def fetch_team_stats(team):
+        return get_team_stats(team, start_date, end_date, season, nba_teams, endpoints)
+
+    with instrumentation.span('stats.combine_games', date=end_date, teams=len(playing_teams)):
+        if league_wide:
+            all_team_stats = get_slate_team_stats(playing_teams, start_date, end_date, season, nba_teams, endpoints)
+        elif max_workers > 1 and len(playing_teams) > 1:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(playing_teams))) as executor:
+                all_team_stats = list(executor.map(fetch_team_stats, playing_teams))
+        else:
+            all_team_stats = [fetch_team_stats(team) for team in playing_teams]
+
+    # For each game, add the home team's stats and away team's stats to the current game list
+    for game_num, (home_team, away_team) in enumerate(games[0].items()):
         curr_game = [home_team, away_team]
         if results is not None:
             print(curr_game)
 
-        time.sleep(0.01)
-        home_stats = get_team_stats(home_team, start_date, end_date, season, nba_teams)
+        home_stats = all_team_stats[2 * game_num]
         # Add all of the stats to the current game list
         for stat, stat_type in stats.items():
-            curr_game.append(home_stats[stat])
+            curr_game.append(home_stats.get(stat))
 
-        time.sleep(0.01)
-        away_stats = get_team_stats(away_team, start_date, end_date, season, nba_teams)
+        away_stats = all_team_stats[2 * game_num + 1]
         # Add all of the stats to the current game list
         for stat, stat_type in stats.items():
-            curr_game.append(away_stats[stat])
+            curr_game.append(away_stats.get(stat))
 
         # If there are results for the game, binarize the result and add it to the current game list
         if results is not None:
@@ -303,6 +638,74 @@ def combine_games_stats(games, start_date, end_date, season, nba_teams):
     return games_with_stats
 
 
+def add_model_game_features(games_df, dates, nba_teams, feature_names, season=None, game_log_df=None):
+    """
+    Adds the head-to-head, recent form and rest features from game_features.py to upcoming games, if the model was
+    trained with them
+
+    :param games_df:        A DataFrame with the HOME_TEAM and AWAY_TEAM of every game
+    :param dates:           The date of the games in format "mm/dd/yyyy", or a list with the date of each game
+    :param nba_teams:       Dictionary containing all of the NBA teams and their IDs
+    :param feature_names:   The names of the features the model was trained on
+    :param season:          The NBA season of the games. ex: '2021-22'. Only used to get the game log if it isn't given
+    :param game_log_df:     The season game log of the games played before them. The whole season game log is used if
+                            this is None
+    :return:                The DataFrame, with the game features added if the model uses them
+    """
+    if not set(game_features.feature_names) & set(feature_names or []):
+        return games_df
+    if game_log_df is None:
+        game_log_df = get_season_game_log(season)
+    games_df = games_df.copy()
+    games_df['DATE'] = dates
+    return game_features.add_game_features(games_df, game_log_df, nba_teams).drop(columns='DATE')
+
+
+def get_prediction_games(date, season, nba_teams, feature_names=None, matchups=None, stats_through=None):
+    """
+    Collects everything a model needs to predict a date's games: both team's stats through the day before the date,
+    only for the types of stats the model uses, and the game features if the model was trained with them.
+    nba_predictor.py, the prediction server and precompute.py all predict from this.
+
+    :param date:            The date of the games in format "mm/dd/yyyy"
+    :param season:          The NBA season of the date. ex: '2021-22'
+    :param nba_teams:       Dictionary containing all of the NBA teams and their IDs
+    :param feature_names:   The names of the features the model was trained on, from fast_predictor.model_feature_names.
+                            Every stat is collected if this is None or empty.
+    :param matchups:        A dictionary of the games to predict where the home team is the key. Every game on the date
+                            is predicted if this is None
+    :param stats_through:   The last day of the stats in format "mm/dd/yyyy". The day before the date is used if this is
+                            None
+    :return:                A DataFrame with the HOME_TEAM, AWAY_TEAM and both team's stats of every game, and the game
+                            features if the model uses them
+    """
+    if matchups is None:
+        matchups = get_matchups(date, nba_teams)
+    columns = season_stats.game_columns[:-2]
+    if not matchups:
+        return pd.DataFrame(columns=columns)
+    if stats_through is None:
+        stats_through = (datetime.strptime(date, '%m/%d/%Y') - timedelta(days=1)).strftime('%m/%d/%Y')
+
+    try:
+        with instrumentation.span('stats.season_bounds', season=season):
+            season_start = get_season_start_end(season)[0]
+    except ValueError:
+        season_start = None
+
+    if season_start is None:
+        # Before a season's first game is over no team has played yet, so there are no stats to request. They're all
+        # None, the same as a team that hasn't played in get_slate_team_stats.
+        games_stats = [[home_team, away_team] + [None] * (len(columns) - 2)
+                       for home_team, away_team in matchups.items()]
+    else:
+        # Only the types of stats the model uses are requested
+        games_stats = combine_games_stats([matchups], season_start, stats_through, season, nba_teams,
+                                          endpoints=get_required_endpoints(feature_names))
+    games_df = pd.DataFrame(games_stats, columns=columns)
+    return add_model_game_features(games_df, date, nba_teams, feature_names, season)
+
+
 def reformat_date(date_str):
     """
     Reformat a date given in format "yyyy-mm-dd" to the format "mm/dd/yyyy"
@@ -318,36 +721,115 @@ def reformat_date(date_str):
     return new_date
 
 
+# The first and last game dates of completed seasons that aren't in nba_metadata.py, saved once they're found
+season_bounds_path = os.path.join(api_cache.cache_dir, 'season_bounds.json')
+_season_bounds_lock = threading.Lock()
+
+
+def _read_season_bounds():
+    if not os.path.exists(season_bounds_path):
+        return {}
+    with open(season_bounds_path, 'r') as file:
+        return json.load(file)
+
+
 def get_season_start_end(season):
     """
-    Gets the start date and end date (or most recent game date if season is still active) of a specified season
+    Gets the start date and end date (or most recent game date if season is still active) of a specified season.
+    Completed seasons are looked up in nba_metadata.py or in season_bounds_path, and any other season's dates come from
+    the season game log.
 
     :param season:  The season to get the start and end dates for in the format "yyyy-yy"
     :return:        A list containing the start date and end date of the season
+    :raises ValueError: If the season doesn't have any games yet
     """
-    success = False
-    while not success:
-        try:
-            # Gets all of the games from the season
-            games = leaguegamefinder.LeagueGameFinder(season_nullable=season, season_type_nullable='Regular Season',
-                                                      league_id_nullable='00')
-            success = True
-        except:
-            print("An exception occurred. Trying again...")
-            time.sleep(0.1)
-
-    games_df = games.get_data_frames()[0]  # Puts the games into a DataFrame
-
-    # The start date is found in the last row of the DataFrame
-    # The end date is found in the first row of the DataFrame
+    bounds = nba_metadata.get_season_bounds(season)
+    if bounds is not None:
+        return bounds
+
+    with _season_bounds_lock:
+        saved_bounds = _read_season_bounds()
+    if season in saved_bounds:
+        return list(saved_bounds[season])
+
+    # The game log is a single request that the schedule and the stats cache use too, so it's usually already cached
+    game_dates = get_season_game_log(season)['GAME_DATE'].str[0:10]
+    if game_dates.empty:
+        raise ValueError(f"The {season} season doesn't have any games yet.")
+
     # Reformat the dates to be in format "mm/dd/yyyy"
-    start_date = reformat_date(games_df.iat[-1, 5])
-    end_date = reformat_date(games_df.iat[0, 5])
+    bounds = [reformat_date(game_dates.min()), reformat_date(game_dates.max())]
+
+    # A completed season's dates never change, so they're saved and never looked up again
+    if api_cache.ttl_for({'season': season}) is None:
+        with _season_bounds_lock:
+            saved_bounds = _read_season_bounds()
+            saved_bounds[season] = bounds
+            os.makedirs(os.path.dirname(os.path.abspath(season_bounds_path)), exist_ok=True)
+            temp_path = f'{season_bounds_path}.{os.getpid()}.tmp'
+            with open(temp_path, 'w') as file:
+                json.dump(saved_bounds, file, indent=2)
+            os.replace(temp_path, season_bounds_path)
 
-    return [start_date, end_date]
+    return bounds
 
 
-def get_data(num_seasons, curr_season):
+def get_season_csv(season, nba_teams, from_game_log=False, progress=None, extra_features=False):
+    """
+    Creates the CSV file for a single season
+
+    :param season:          The NBA season to create the CSV file for in format "yyyy-yy"
+    :param nba_teams:       Dictionary containing all of the NBA teams and their IDs
+    :param from_game_log:   If True, compute the stats locally from one game log instead of asking the API for each
+                            team's stats on each day
+    :param progress:        A function that is passed on to get_season_games_df to report progress
+    :param extra_features:  If True, add the head-to-head, recent form and rest features from game_features.py
+    :return:                The days that could not be collected
+    """
+    # The whole season can be built from a single game log in a few seconds
+    if from_game_log:
+        season_games_df = season_stats.build_season_games_df(get_season_game_log(season), extra_features)
+        season_games_df.to_csv(f"games_{season}.csv")
+        return []
+
+    start_date, end_date = get_season_start_end(season)
+
+    # Turns the start date and end date into a datetime object
+    start_date = datetime.strptime(start_date, '%m/%d/%Y')
+    end_date = datetime.strptime(end_date, '%m/%d/%Y')
+
+    season_games_df = get_season_games_df(start_date, end_date, season, nba_teams, progress)
+    failed_days = season_games_df.attrs['failed_days']
+    if extra_features:
+        season_games_df = game_features.add_game_features(season_games_df, get_season_game_log(season), nba_teams)
+    season_games_df.to_csv(f"games_{season}.csv")
+    return failed_days
+
+
+# The progress queue of a worker process started by get_data
+_progress_queue = None
+
+
+def _init_season_worker(limiter, progress_queue):
+    """
+    Sets up a worker process so its requests share the parent's request budget and it can report its progress
+    """
+    global _progress_queue
+    api_client.use_limiter(limiter)
+    _progress_queue = progress_queue
+
+
+def _collect_season(season, nba_teams, from_game_log, extra_features):
+    """
+    Creates the CSV file for a single season in a worker process, sending its progress to the parent process
+    """
+    def progress(date, days_done, days_total):
+        _progress_queue.put((season, os.getpid(), date, days_done, days_total))
+
+    return get_season_csv(season, nba_teams, from_game_log, progress, extra_features)
+
+
+def get_data(num_seasons, curr_season, from_game_log=False, processes=1, extra_features=False):
     """
     Creates CSV files for num_seasons seasons. curr_season is the season that happened most recently.
     Example: if curr_season is 22 and num_seasons is 4, CSV files will be created for seasons 2018-19, 2019-20, 2020-21,
@@ -355,54 +837,98 @@ def get_data(num_seasons, curr_season):
 
     :param num_seasons:     The amount of seasons to create CSV files for
     :param curr_season:     The most recent season to start making CSV files for
+    :param from_game_log:   If True, compute the stats locally from one game log per season instead of asking the API
+                            for each team's stats on each day
+    :param processes:       The amount of seasons to collect at the same time, each in its own process. The processes
+                            share a single request budget of api_client.requests_per_second.
+    :param extra_features:  If True, add the head-to-head, recent form and rest features from game_features.py
+    :return:                A dictionary containing the days that could not be collected for each season
     """
     nba_teams = get_teams()
+    seasons = [f"20{curr_season - (i + 1)}-{curr_season - i}" for i in range(num_seasons)]  # Format "yyyy-yy"
 
-    # Make CSV files for the given amount of seasons
-    for i in range(num_seasons):
-        season = f"20{curr_season - (i + 1)}-{curr_season - i}"  # Season in format "yyyy-yy"
-        start_date, end_date = get_season_start_end(season)
+    # Make CSV files for the given amount of seasons, one after another
+    if processes <= 1:
+        return {season: get_season_csv(season, nba_teams, from_game_log, extra_features=extra_features)
+                for season in seasons}
 
-        # Turns the start date and end date into a datetime object
-        start_date = datetime.strptime(start_date, '%m/%d/%Y')
-        end_date = datetime.strptime(end_date, '%m/%d/%Y')
+    # Otherwise each season gets its own process. The rate limiter is shared so the processes together don't go over
+    # the request budget.
+    limiter = api_client.SharedTokenBucket(api_client.default_limiter.rate, api_client.default_limiter.capacity)
+    progress_queue = multiprocessing.Queue()
+    failed_days = {}
 
-        season_games_df = get_season_games_df(start_date, end_date, season, nba_teams)
-        season_games_df.to_csv(f"games_{season}.csv")
+    with ProcessPoolExecutor(max_workers=min(processes, num_seasons), initializer=_init_season_worker,
+                             initargs=(limiter, progress_queue)) as executor:
+        futures = {executor.submit(_collect_season, season, nba_teams, from_game_log, extra_features): season
+                   for season in seasons}
+
+        # Print the progress of every worker until all of the seasons are done
+        pending = set(futures)
+        while pending:
+            try:
+                season, worker, date, days_done, days_total = progress_queue.get(timeout=0.5)
+                print(f"[{season} | worker {worker}] {date} ({days_done + 1}/{days_total} days)")
+            except queue.Empty:
+                pass
+            pending = {future for future in pending if not future.done()}
+
+        # Print any progress that was sent right before the last season finished
+        while not progress_queue.empty():
+            season, worker, date, days_done, days_total = progress_queue.get()
+            print(f"[{season} | worker {worker}] {date} ({days_done + 1}/{days_total} days)")
+
+        for future, season in futures.items():
+            failed_days[season] = future.result()
+
+    return failed_days
 
 
 def combine_data(num_seasons, curr_season):
     """
-    Combines all of the CSV files into one CSV file
+    Combines all of the CSV files into one CSV file and saves every season in the feature store
 
     :param num_seasons:     The amount of seasons to combine
     :param curr_season:     The most recent season to start with
     """
-    season = f"20{curr_season - num_seasons}-{curr_season - (num_seasons - 1)}"  # Season in format "yyyy-yy"
-    all_data_df = pd.read_csv(f"games_{season}.csv")    # Read in the oldest season's CSV to start
-    all_data_df.drop('Unnamed: 0', axis=1, inplace=True)
+    store = feature_store.FeatureStore()
+    season_dfs = []
 
-    # Read in the rest of the seasons in oldest to newest order and add them to the combined DataFrame
-    for i in range(num_seasons - 1, 0, -1):
-        season = f"20{curr_season - i}-{curr_season - (i - 1)}"
+    # Read in the seasons in oldest to newest order
+    for i in range(num_seasons, 0, -1):
+        season = f"20{curr_season - i}-{curr_season - (i - 1)}"  # Season in format "yyyy-yy"
         curr_season_df = pd.read_csv(f"games_{season}.csv")
         curr_season_df.drop('Unnamed: 0', axis=1, inplace=True)
-        all_data_df = pd.concat([all_data_df, curr_season_df], ignore_index=True)
+        season_dfs.append(curr_season_df)
 
+        # The season was just rebuilt, so its old partition is replaced
+        store.drop_season(season)
+        store.append(season, curr_season_df)
+
+    with instrumentation.span('dataframe.combine_seasons', seasons=num_seasons):
+        all_data_df = pd.concat(season_dfs, ignore_index=True)
     all_data_df.to_csv(f"all_games_20{curr_season - num_seasons}-{curr_season}.csv")
 
 
-def main(num_seasons=4, curr_season=22):
+def main(num_seasons=4, curr_season=22, from_game_log=False, processes=1, extra_features=False):
     """
     Creates CSV files for num_seasons seasons, then combines those CSV files into one CSV file containing every game.
-    This takes a very long time to run due to the many API calls.
+    This takes a very long time to run due to the many API calls, unless from_game_log is True.
 
     :param num_seasons:     The number of seasons to collect data from
     :param curr_season:     The most recent season to collect data from
+    :param from_game_log:   If True, compute the stats locally from one game log per season
+    :param processes:       The amount of seasons to collect at the same time
+    :param extra_features:  If True, add the head-to-head, recent form and rest features from game_features.py
     """
-    get_data(num_seasons, curr_season)
+    get_data(num_seasons, curr_season, from_game_log, processes, extra_features)
 
     # Combine all datasets into one
     combine_data(num_seasons, curr_season)
 
+    print(f"API cache: {api_cache.default_cache.stats()}")
+    print(f"Team stats cache: {stats_cache.default_cache.stats()}")
+    api_client.metrics.print_summary()
+    instrumentation.report()
+
 # main()
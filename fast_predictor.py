@@ -0,0 +1,201 @@
+"""
+Author Name:    Victoria Scavetta
+Date:           4/19/2022
+Course:         Concepts in AI
+
+This program predicts the results of NBA games based on each team's stats and past matchups between the teams.
+
+This file (fast_predictor.py) makes predictions with the XGBoost model exported by model.create_model, using only
+NumPy. Loading the exported trees is much faster than importing scikit-learn and XGBoost and unpickling the grid search,
+which matters when only a handful of games are being predicted.
+"""
+
+import json
+import os
+import threading
+import numpy as np
+import instrumentation
+
+booster_path = "nba_model.json"
+
+
+class TreeEnsemble:
+    """
+    The trees of an exported XGBoost binary:logistic model. Every tree is padded to the same amount of nodes, so all of
+    the trees can be walked at the same time for every row.
+    """
+
+    def __init__(self, model_json):
+        """
+        :param model_json:  The dictionary from an XGBoost model saved in JSON format
+        """
+        learner = model_json['learner']
+        booster = learner['gradient_booster']
+        if booster['name'] != 'gbtree':
+            raise ValueError(f"Only gbtree models are supported, not {booster['name']}")
+        objective = learner['objective']['name']
+        if objective != 'binary:logistic':
+            raise ValueError(f"Only binary:logistic models are supported, not {objective}")
+
+        self.feature_names = learner.get('feature_names', [])
+
+        # Newer versions of XGBoost save the base score as a list
+        base_score = float(str(learner['learner_model_param']['base_score']).strip('[]'))
+        self.base_margin = np.log(base_score / (1 - base_score))
+
+        trees = booster['model']['trees']
+        n_nodes = max(len(tree['left_children']) for tree in trees)
+        shape = (len(trees), n_nodes)
+        self.left = np.zeros(shape, dtype=np.int32)
+        self.right = np.zeros(shape, dtype=np.int32)
+        self.feature = np.zeros(shape, dtype=np.int32)
+        self.threshold = np.zeros(shape, dtype=np.float32)
+        self.default_left = np.zeros(shape, dtype=bool)
+        self.is_leaf = np.ones(shape, dtype=bool)
+
+        for i, tree in enumerate(trees):
+            size = len(tree['left_children'])
+            self.left[i, :size] = tree['left_children']
+            self.right[i, :size] = tree['right_children']
+            self.feature[i, :size] = tree['split_indices']
+            # A leaf's value is saved in the place of its split condition
+            self.threshold[i, :size] = tree['split_conditions']
+            self.default_left[i, :size] = np.asarray(tree['default_left'], dtype=bool)
+            self.is_leaf[i, :size] = np.asarray(tree['left_children']) == -1
+
+        self.depth = max(self._tree_depth(tree) for tree in trees)
+
+    @staticmethod
+    def _tree_depth(tree):
+        depths = {0: 0}
+        for node, (left, right) in enumerate(zip(tree['left_children'], tree['right_children'])):
+            if left != -1:
+                depths[left] = depths[node] + 1
+                depths[right] = depths[node] + 1
+        return max(depths.values())
+
+    def margin(self, x):
+        """
+        :param x:   A 2D array of features, with the columns in the same order as feature_names
+        :return:    The raw score of each row, before the sigmoid
+        """
+        x = np.asarray(x, dtype=np.float32)
+        rows = np.arange(len(x))[:, None]
+        trees = np.arange(len(self.left))[None, :]
+        node = np.zeros((len(x), len(self.left)), dtype=np.int32)
+
+        # Move every row one level down every tree at a time. Rows that reached a leaf stay there.
+        for level in range(self.depth):
+            value = x[rows, self.feature[trees, node]]
+            go_left = np.where(np.isnan(value), self.default_left[trees, node], value < self.threshold[trees, node])
+            child = np.where(go_left, self.left[trees, node], self.right[trees, node])
+            node = np.where(self.is_leaf[trees, node], node, child)
+
+        return self.base_margin + self.threshold[trees, node].sum(axis=1, dtype=np.float64)
+
+    def predict_proba(self, x):
+        """
+        :param x:   A 2D array of features
+        :return:    A 2D array containing the probability of a home loss and a home win for each row, the same as
+                    XGBClassifier.predict_proba
+        """
+        win = 1 / (1 + np.exp(-self.margin(x)))
+        return np.column_stack([1 - win, win])
+
+    def predict(self, x):
+        """
+        :param x:   A 2D array of features
+        :return:    1 for each row the home team is predicted to win and 0 otherwise
+        """
+        return (self.margin(x) > 0).astype(np.int64)
+
+
+def load(path=None):
+    """
+    :param path:    The exported XGBoost JSON model. booster_path is used if this is None
+    :return:        A TreeEnsemble containing the model's trees
+    """
+    path = path if path is not None else booster_path
+    with instrumentation.span('model.load', path=path), open(path, 'r') as file:
+        return TreeEnsemble(json.load(file))
+
+
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def get_model(path=None):
+    """
+    Gets an exported model, only loading it from disk the first time or when the file changes
+
+    :param path:    The exported XGBoost JSON model. booster_path is used if this is None
+    :return:        A TreeEnsemble containing the model's trees
+    """
+    path = path if path is not None else booster_path
+    file_stats = os.stat(path)
+    version = (file_stats.st_mtime_ns, file_stats.st_size)
+    with _loaded_lock:
+        if path not in _loaded or _loaded[path][0] != version:
+            _loaded[path] = (version, load(path))
+        return _loaded[path][1]
+
+
+def model_feature_names(path=None):
+    """
+    :param path:    The exported XGBoost JSON model. booster_path is used if this is None
+    :return:        The names of the features the exported model was trained on, or an empty list if there's no export
+    """
+    if not os.path.exists(path if path is not None else booster_path):
+        return []
+    return list(get_model(path).feature_names)
+
+
+def make_predictions(games, path=None):
+    """
+    Makes predictions on a given set of NBA games with the exported model. If the model hasn't been exported, the
+    pickled model is used through model.make_predictions instead.
+
+    :param games:   A DataFrame containing NBA games and each teams stats
+    :param path:    The exported XGBoost JSON model. booster_path is used if this is None
+    :return:        The original DataFrame with an additional column containing the predicted results
+    """
+    if not os.path.exists(path if path is not None else booster_path):
+        # Only import scikit-learn and XGBoost when they're actually needed
+        import model as m
+        return m.make_predictions(games)
+
+    model = get_model(path)
+
+    # The features have to be in the same order the model was trained with
+    if model.feature_names:
+        features = games[model.feature_names]
+    else:
+        features = games.drop(columns=['HOME_TEAM', 'AWAY_TEAM'])
+    with instrumentation.span('model.predict', games=len(games)):
+        games['PREDICTED_RESULT'] = model.predict(features.to_numpy(dtype=np.float32))
+
+    return games
+
+
+def predict_proba(games, path=None):
+    """
+    Gets the chance of the home team winning each game. If the model hasn't been exported, the pickled model is used
+    instead.
+
+    :param games:   A DataFrame containing NBA games and each teams stats
+    :param path:    The exported XGBoost JSON model. booster_path is used if this is None
+    :return:        A NumPy array containing the chance of the home team winning each game
+    """
+    if not os.path.exists(path if path is not None else booster_path):
+        # Only import scikit-learn and XGBoost when they're actually needed
+        import model as m
+        classifier = m.loader.get()
+        feature_names = classifier.get_booster().feature_names
+        features = games[feature_names] if feature_names else games.drop(columns=['HOME_TEAM', 'AWAY_TEAM'])
+        with instrumentation.span('model.predict', games=len(games)):
+            return classifier.predict_proba(features)[:, 1]
+
+    model = get_model(path)
+    features = games[model.feature_names] if model.feature_names else games.drop(columns=['HOME_TEAM', 'AWAY_TEAM'])
+    with instrumentation.span('model.predict', games=len(games)):
+        return model.predict_proba(features.to_numpy(dtype=np.float32))[:, 1]
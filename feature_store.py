@@ -0,0 +1,303 @@
+"""
+Author Name:    Victoria Scavetta
+Date:           4/19/2022
+Course:         Concepts in AI
+
+This program predicts the results of NBA games based on each team's stats and past matchups between the teams.
+
+This file (feature_store.py) contains the columnar feature store that the datasets are saved in. Every season is saved
+in its own directory, and every column of a season is saved in its own binary file: float32 for the stats, int16 codes
+for the team names and int64 days for the dates. The files are memory-mapped when they are loaded, so only the columns
+and dates that are asked for are read, and new games are appended to the end of the files without rewriting them.
+"""
+
+from datetime import datetime
+import json
+import os
+import numpy as np
+import pandas as pd
+
+store_dir = 'feature_store'
+
+team_columns = ['HOME_TEAM', 'AWAY_TEAM']
+date_column = 'DATE'
+result_column = 'RESULT'
+
+
+def season_of(dates):
+    """
+    Figures out the season each date belongs to. Seasons start in October or later and end before October.
+    Example: 04/13/2022 belongs to 2021-22 and 12/22/2020 belongs to 2020-21.
+
+    :param dates:   A Series of datetime64 dates
+    :return:        A Series containing the season of each date in format "yyyy-yy"
+    """
+    start_year = dates.dt.year - (dates.dt.month < 10).astype(int)
+    return start_year.astype(str) + '-' + ((start_year + 1) % 100).astype(str).str.zfill(2)
+
+
+class FeatureStore:
+    """
+    A columnar, season partitioned store of games and both team's stats
+    """
+
+    def __init__(self, directory=store_dir):
+        """
+        :param directory:   The directory the store is saved in
+        """
+        self.directory = directory
+        self._teams_path = os.path.join(directory, 'teams.json')
+
+    def _partition(self, season):
+        return os.path.join(self.directory, f'season={season}')
+
+    def _read_meta(self, season):
+        meta_path = os.path.join(self._partition(season), 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, 'r') as file:
+            return json.load(file)
+
+    def _write_json(self, path, data):
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump(data, file)
+        os.replace(temp_path, path)
+
+    def teams(self):
+        """
+        :return:    The list of team names. A team's code in the store is its position in this list.
+        """
+        if not os.path.exists(self._teams_path):
+            return []
+        with open(self._teams_path, 'r') as file:
+            return json.load(file)
+
+    def seasons(self):
+        """
+        :return:    The seasons in the store, from oldest to newest
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[len('season='):] for name in os.listdir(self.directory) if name.startswith('season=') and
+                      self._read_meta(name[len('season='):]) is not None)
+
+    def columns(self, season=None):
+        """
+        :param season:  The season to get the columns of. The oldest season is used if this is None
+        :return:        The names of the columns in the order they were first saved in, or an empty list if the season
+                        isn't in the store
+        """
+        seasons = self.seasons() if season is None else [season]
+        meta = self._read_meta(seasons[0]) if seasons else None
+        if meta is None:
+            return []
+        return list(meta['columns'])
+
+    def rows(self, season):
+        """
+        :param season:  The season to count the games of
+        :return:        The amount of games saved for the season
+        """
+        meta = self._read_meta(season)
+        return 0 if meta is None else meta['rows']
+
+    def last_date(self, season):
+        """
+        :param season:  The season to get the last date of
+        :return:        The date of the season's last saved games as a datetime object, or None if it has no games
+        """
+        meta = self._read_meta(season)
+        if meta is None or meta['last_date'] is None:
+            return None
+        return datetime.strptime(meta['last_date'], '%Y-%m-%d')
+
+    def append(self, season, games_df):
+        """
+        Appends games to the end of a season's files. Games on or before the last date already saved for the season are
+        skipped, so appending the same day twice does nothing.
+
+        :param season:      The season the games belong to in format "yyyy-yy"
+        :param games_df:    A DataFrame with the same columns as data_processing.get_season_games_df
+        :return:            The amount of games that were appended
+        """
+        games_df = games_df.drop(columns='Unnamed: 0', errors='ignore')
+        dates = pd.to_datetime(games_df[date_column], format='%m/%d/%Y').values.astype('datetime64[D]')
+
+        partition = self._partition(season)
+        meta = self._read_meta(season)
+        if meta is None:
+            os.makedirs(partition, exist_ok=True)
+            columns = {}
+            for column in games_df.columns:
+                if column in team_columns:
+                    columns[column] = 'int16'
+                elif column == date_column:
+                    columns[column] = 'int64'
+                elif column == result_column:
+                    columns[column] = 'int8'
+                else:
+                    columns[column] = 'float32'
+            meta = {'rows': 0, 'last_date': None, 'columns': columns}
+
+        # Only keep the games after the last date that's already saved
+        if meta['last_date'] is not None:
+            new_rows = dates > np.datetime64(meta['last_date'], 'D')
+            games_df = games_df[new_rows]
+            dates = dates[new_rows]
+        if len(games_df) == 0:
+            return 0
+
+        # New team names are added to the end of the team list so the codes that are already saved stay the same
+        teams = self.teams()
+        team_codes = {team: code for code, team in enumerate(teams)}
+        for column in team_columns:
+            for team in games_df[column].unique():
+                if team not in team_codes:
+                    team_codes[team] = len(teams)
+                    teams.append(team)
+        os.makedirs(self.directory, exist_ok=True)
+        self._write_json(self._teams_path, teams)
+
+        for column, dtype in meta['columns'].items():
+            if column in team_columns:
+                values = games_df[column].map(team_codes).to_numpy(dtype=dtype)
+            elif column == date_column:
+                values = dates.astype(dtype)
+            else:
+                values = games_df[column].to_numpy(dtype=dtype)
+
+            # Cut off anything written after the last saved meta file, like a half finished append, then append
+            column_path = os.path.join(partition, f'{column}.{dtype}')
+            with open(column_path, 'ab') as file:
+                file.truncate(meta['rows'] * np.dtype(dtype).itemsize)
+                file.write(np.ascontiguousarray(values).tobytes())
+
+        # The meta file is written last, so the new rows only exist once every column has been appended
+        meta['rows'] += len(games_df)
+        meta['last_date'] = str(dates[-1])
+        self._write_json(os.path.join(partition, 'meta.json'), meta)
+        return len(games_df)
+
+    def drop_season(self, season):
+        """
+        Deletes every game of a season from the store
+
+        :param season:  The season to delete
+        """
+        partition = self._partition(season)
+        if not os.path.isdir(partition):
+            return
+        for name in os.listdir(partition):
+            os.remove(os.path.join(partition, name))
+        os.rmdir(partition)
+
+    def load_arrays(self, season, columns=None, start=None, end=None):
+        """
+        Memory-maps the columns of a single season without copying them
+
+        :param season:  The season to load
+        :param columns: The columns to load. Every column is loaded if this is None
+        :param start:   The first date to load in format "mm/dd/yyyy", or None to start at the beginning of the season
+        :param end:     The last date to load in format "mm/dd/yyyy", or None to load through the end of the season
+        :return:        A dictionary containing a read-only NumPy array for each column. The team columns contain team
+                        codes and the date column contains datetime64[D] dates.
+        """
+        meta = self._read_meta(season)
+        if meta is None or meta['rows'] == 0:
+            return {}
+        if columns is None:
+            columns = list(meta['columns'])
+        partition = self._partition(season)
+
+        def memory_map(column):
+            dtype = meta['columns'][column]
+            return np.memmap(os.path.join(partition, f'{column}.{dtype}'), dtype=dtype, mode='r',
+                             shape=(meta['rows'],))
+
+        # The games are saved in date order, so the date range is found with a binary search
+        first, last = 0, meta['rows']
+        if start is not None or end is not None:
+            dates = memory_map(date_column).view('datetime64[D]')
+            if start is not None:
+                first = int(np.searchsorted(dates, _to_day(start), side='left'))
+            if end is not None:
+                last = int(np.searchsorted(dates, _to_day(end), side='right'))
+
+        arrays = {}
+        for column in columns:
+            values = memory_map(column)[first:last]
+            arrays[column] = values.view('datetime64[D]') if column == date_column else values
+        return arrays
+
+    def load(self, columns=None, seasons=None, start=None, end=None):
+        """
+        Loads games from the store into a DataFrame
+
+        :param columns: The columns to load. Every column is loaded if this is None
+        :param seasons: The seasons to load. Every season is loaded if this is None
+        :param start:   The first date to load in format "mm/dd/yyyy", or None to start at the beginning
+        :param end:     The last date to load in format "mm/dd/yyyy", or None to load through the end
+        :return:        A DataFrame with float32 stats, categorical team names and datetime dates, ordered by date
+        """
+        if seasons is None:
+            seasons = self.seasons()
+        if columns is None:
+            columns = self.columns()
+        teams = self.teams()
+
+        frames = []
+        for season in seasons:
+            arrays = self.load_arrays(season, columns, start, end)
+            if not arrays:
+                continue
+            frame = {}
+            for column, values in arrays.items():
+                if column in team_columns:
+                    frame[column] = pd.Categorical.from_codes(values, categories=teams)
+                else:
+                    frame[column] = values
+            frames.append(pd.DataFrame(frame, columns=columns))
+
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(frames, ignore_index=True)
+
+    def import_csv(self, csv_path, season=None):
+        """
+        Copies the games from a CSV file into the store. Games that are already in the store are skipped.
+
+        :param csv_path:    The CSV file to import
+        :param season:      The season of every game in the file. If this is None, each game's season is figured out
+                            from its date, so a combined CSV file can be imported too.
+        :return:            The amount of games that were imported
+        """
+        games_df = pd.read_csv(csv_path)
+        if season is not None:
+            return self.append(season, games_df)
+
+        imported = 0
+        game_seasons = season_of(pd.to_datetime(games_df[date_column], format='%m/%d/%Y'))
+        for curr_season in sorted(game_seasons.unique()):
+            imported += self.append(curr_season, games_df[game_seasons == curr_season])
+        return imported
+
+
+def _to_day(date):
+    return np.datetime64(pd.to_datetime(date, format='%m/%d/%Y').date(), 'D')
+
+
+def load_games(csv_path="all_games_2018-22.csv", directory=store_dir, **load_args):
+    """
+    Loads the games from the feature store. If the store is empty, the games are first imported from the combined CSV
+    file.
+
+    :param csv_path:    The combined CSV file to import if the store is empty
+    :param directory:   The directory of the feature store
+    :param load_args:   Arguments passed on to FeatureStore.load, like columns, seasons, start and end
+    :return:            A DataFrame containing the games
+    """
+    store = FeatureStore(directory)
+    if not store.seasons():
+        store.import_csv(csv_path)
+    return store.load(**load_args)
@@ -0,0 +1,142 @@
+"""
+Author Name:    Victoria Scavetta
+Date:           4/19/2022
+Course:         Concepts in AI
+
+This program predicts the results of NBA games based on each team's stats and past matchups between the teams.
+
+This file (game_features.py) adds features about each team's recent games to the games: the head-to-head record between
+the two teams, each team's record in its last few games, the days of rest before the game and whether it's the second
+night of a back-to-back. The features are computed in one pass over a game index sorted by team and date, using only
+the games before each game, so the same code works for past games in the training set and for upcoming games.
+"""
+
+import numpy as np
+import pandas as pd
+
+feature_names = ['H_REST_DAYS', 'H_BACK_TO_BACK', 'H_LAST_N_W_PCT', 'A_REST_DAYS', 'A_BACK_TO_BACK', 'A_LAST_N_W_PCT',
+                 'H2H_W_PCT', 'H2H_GAMES']
+
+
+def team_game_index(game_log_df, upcoming_df=None):
+    """
+    Creates an index with one row per team per game, sorted by team and date
+
+    :param game_log_df:     A DataFrame from the LeagueGameLog endpoint with one row per team per game
+    :param upcoming_df:     A DataFrame of games that haven't been played yet with the columns GAME_DATE, HOME_TEAM_ID
+                            and AWAY_TEAM_ID, or None
+    :return:                A DataFrame with the columns TEAM_ID, OPP_TEAM_ID, GAME_DATE, IS_HOME and WIN, where WIN is
+                            NaN for games that haven't been played
+    """
+    log = game_log_df[['GAME_ID', 'TEAM_ID', 'GAME_DATE', 'MATCHUP', 'WL']].copy()
+    opponents = log[['GAME_ID', 'TEAM_ID']].rename(columns={'TEAM_ID': 'OPP_TEAM_ID'})
+    log = log.merge(opponents, on='GAME_ID')
+    log = log[log['TEAM_ID'] != log['OPP_TEAM_ID']]
+
+    index = pd.DataFrame({
+        'TEAM_ID': log['TEAM_ID'].to_numpy(),
+        'OPP_TEAM_ID': log['OPP_TEAM_ID'].to_numpy(),
+        'GAME_DATE': pd.to_datetime(log['GAME_DATE']).to_numpy(),
+        'IS_HOME': log['MATCHUP'].str.contains('vs.', regex=False).to_numpy(),
+        'WIN': (log['WL'] == 'W').astype(float).to_numpy()
+    })
+
+    # Upcoming games get a row for each team, with no result yet
+    if upcoming_df is not None and len(upcoming_df) > 0:
+        dates = pd.to_datetime(upcoming_df['GAME_DATE']).to_numpy()
+        home_ids = upcoming_df['HOME_TEAM_ID'].to_numpy()
+        away_ids = upcoming_df['AWAY_TEAM_ID'].to_numpy()
+        upcoming = pd.DataFrame({
+            'TEAM_ID': np.r_[home_ids, away_ids],
+            'OPP_TEAM_ID': np.r_[away_ids, home_ids],
+            'GAME_DATE': np.r_[dates, dates],
+            'IS_HOME': np.r_[np.ones(len(dates), dtype=bool), np.zeros(len(dates), dtype=bool)],
+            'WIN': np.nan
+        })
+        index = pd.concat([index, upcoming], ignore_index=True)
+
+    return index.sort_values(['TEAM_ID', 'GAME_DATE'], kind='mergesort').reset_index(drop=True)
+
+
+def compute_team_features(index, last_n=10):
+    """
+    Computes each team's features before every game in a team game index
+
+    :param index:   A DataFrame returned by team_game_index
+    :param last_n:  The amount of recent games the recent record is computed over
+    :return:        The index with the columns REST_DAYS, BACK_TO_BACK, LAST_N_W_PCT, H2H_WINS and H2H_GAMES added
+    """
+    index = index.copy()
+    by_team = index.groupby('TEAM_ID', sort=False)
+
+    # Days since the team's previous game. The first game of the season has no previous game.
+    index['REST_DAYS'] = (index['GAME_DATE'] - by_team['GAME_DATE'].shift(1)).dt.days
+    index['BACK_TO_BACK'] = (index['REST_DAYS'] == 1).astype(int)
+
+    # Running totals of played games and wins before each game. The record over the last N games is the difference
+    # between the running totals now and N games ago.
+    played = index['WIN'].notna().astype(int)
+    wins = index['WIN'].fillna(0)
+    index['_PLAYED'] = played.groupby(index['TEAM_ID']).cumsum() - played
+    index['_WINS'] = wins.groupby(index['TEAM_ID']).cumsum() - wins
+    by_team = index.groupby('TEAM_ID', sort=False)
+    played_n = index['_PLAYED'] - by_team['_PLAYED'].shift(last_n).fillna(0)
+    wins_n = index['_WINS'] - by_team['_WINS'].shift(last_n).fillna(0)
+    index['LAST_N_W_PCT'] = wins_n / played_n.replace(0, np.nan)
+
+    # Head-to-head record against the opponent before each game
+    by_matchup = [index['TEAM_ID'], index['OPP_TEAM_ID']]
+    index['H2H_GAMES'] = played.groupby(by_matchup).cumsum() - played
+    index['H2H_WINS'] = wins.groupby(by_matchup).cumsum() - wins
+
+    return index.drop(columns=['_PLAYED', '_WINS'])
+
+
+def add_game_features(games_df, game_log_df, nba_teams=None, last_n=10):
+    """
+    Adds the recent game features to a DataFrame of games. Games that aren't in the game log yet, like tonight's games,
+    are treated as upcoming games, so their features only use the games that have already been played.
+
+    :param games_df:    A DataFrame with the columns HOME_TEAM, AWAY_TEAM and DATE in format "mm/dd/yyyy"
+    :param game_log_df: A DataFrame from the LeagueGameLog endpoint for the season of the games
+    :param nba_teams:   Dictionary containing the NBA teams and their IDs, for team names that aren't in the game log
+    :param last_n:      The amount of recent games the recent record is computed over
+    :return:            A copy of games_df with the columns in feature_names added
+    """
+    team_ids = dict(zip(game_log_df['TEAM_NAME'], game_log_df['TEAM_ID']))
+    if nba_teams is not None:
+        team_ids.update(nba_teams)
+
+    games = pd.DataFrame({
+        'GAME_DATE': pd.to_datetime(games_df['DATE'], format='%m/%d/%Y').to_numpy(),
+        'HOME_TEAM_ID': games_df['HOME_TEAM'].map(team_ids).to_numpy(),
+        'AWAY_TEAM_ID': games_df['AWAY_TEAM'].map(team_ids).to_numpy()
+    })
+
+    # Games that were already played are in the game log. The rest are added to the index as upcoming games.
+    log_dates = pd.to_datetime(game_log_df['GAME_DATE'])
+    played_keys = pd.MultiIndex.from_arrays([game_log_df['TEAM_ID'].to_numpy(), log_dates.to_numpy()])
+    upcoming = ~pd.MultiIndex.from_arrays([games['HOME_TEAM_ID'], games['GAME_DATE']]).isin(played_keys)
+
+    team_features = compute_team_features(team_game_index(game_log_df, games[upcoming]), last_n)
+    team_features = team_features.drop_duplicates(['TEAM_ID', 'GAME_DATE'])
+
+    home = team_features[team_features['IS_HOME']].set_index(['TEAM_ID', 'GAME_DATE'])
+    away = team_features[~team_features['IS_HOME']].set_index(['TEAM_ID', 'GAME_DATE'])
+    home = home.reindex(pd.MultiIndex.from_arrays([games['HOME_TEAM_ID'], games['GAME_DATE']]))
+    away = away.reindex(pd.MultiIndex.from_arrays([games['AWAY_TEAM_ID'], games['GAME_DATE']]))
+
+    result = games_df.copy()
+    result['H_REST_DAYS'] = home['REST_DAYS'].to_numpy()
+    result['H_BACK_TO_BACK'] = home['BACK_TO_BACK'].to_numpy()
+    result['H_LAST_N_W_PCT'] = home['LAST_N_W_PCT'].to_numpy()
+    result['A_REST_DAYS'] = away['REST_DAYS'].to_numpy()
+    result['A_BACK_TO_BACK'] = away['BACK_TO_BACK'].to_numpy()
+    result['A_LAST_N_W_PCT'] = away['LAST_N_W_PCT'].to_numpy()
+    result['H2H_GAMES'] = home['H2H_GAMES'].to_numpy()
+    result['H2H_W_PCT'] = (home['H2H_WINS'] / home['H2H_GAMES'].replace(0, np.nan)).to_numpy()
+
+    # Keep the result and date as the last columns, like the rest of the datasets
+    last_columns = [column for column in ['RESULT', 'DATE'] if column in result.columns]
+    ordered = [column for column in result.columns if column not in last_columns and column not in feature_names]
+    return result[ordered + feature_names + last_columns]
@@ -0,0 +1,213 @@
+"""
+Author Name:    Victoria Scavetta
+Date:           4/19/2022
+Course:         Concepts in AI
+
+This program predicts the results of NBA games based on each team's stats and past matchups between the teams.
+
+This file (incremental_build.py) builds the datasets one day at a time. After every day, the new games are appended to
+the season's CSV file, the combined CSV file and the feature store, and the day is saved as a checkpoint, so an
+interrupted build picks up where it stopped and a nightly refresh only collects the days that are new.
+"""
+
+from datetime import datetime
+import json
+import os
+import pandas as pd
+import api_client
+import data_processing as dp
+import feature_store
+import game_features
+import season_stats
+
+checkpoint_dir = 'checkpoints'
+
+
+class CheckpointStore:
+    """
+    Keeps track of the days that have been written to a CSV file. For each completed day, it saves how many rows the
+    file had and how big it was afterwards, so anything written after the last checkpoint can be cut off when resuming.
+    """
+
+    def __init__(self, csv_path, directory=checkpoint_dir):
+        """
+        :param csv_path:    The CSV file the checkpoints belong to
+        :param directory:   The directory the checkpoints are saved in
+        """
+        self.csv_path = csv_path
+        self.path = os.path.join(directory, f'{os.path.basename(csv_path)}.json')
+        self.completed = {}  # Date in format "mm/dd/yyyy" -> [rows, size in bytes] after that date was written
+        self.rows = 0
+        self.size = 0
+
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as file:
+                checkpoint = json.load(file)
+            self.completed = checkpoint['completed']
+            self.rows = checkpoint['rows']
+            self.size = checkpoint['size']
+        elif os.path.exists(csv_path):
+            self._from_existing_csv()
+
+    def _from_existing_csv(self):
+        # A CSV file made before checkpoints existed counts as complete through its last date
+        dates = pd.read_csv(self.csv_path, usecols=['DATE'])['DATE']
+        self.rows = len(dates)
+        self.size = os.path.getsize(self.csv_path)
+        for date in dates.unique():
+            self.completed[date] = [self.rows, self.size]
+        self.save()
+
+    def is_completed(self, date):
+        """
+        :param date:    A date in format "mm/dd/yyyy"
+        :return:        True if the games from the date have already been written
+        """
+        return date in self.completed
+
+    def last_completed(self):
+        """
+        :return:    The most recent completed date as a datetime object, or None if no dates are completed
+        """
+        if not self.completed:
+            return None
+        return max(datetime.strptime(date, '%m/%d/%Y') for date in self.completed)
+
+    def append(self, date, games_df):
+        """
+        Appends the games from a date to the CSV file and saves the date as a checkpoint. Dates that are already
+        completed are skipped, so appending the same date twice does nothing.
+
+        :param date:        The date of the games in format "mm/dd/yyyy"
+        :param games_df:    A DataFrame containing the games from the date
+        """
+        if self.is_completed(date):
+            return
+
+        # Cut off anything that was written after the last checkpoint, like half of a day from a crashed build
+        if os.path.exists(self.csv_path) and os.path.getsize(self.csv_path) != self.size:
+            with open(self.csv_path, 'r+b') as file:
+                file.truncate(self.size)
+
+        # Keep the index column counting up from the rows already in the file
+        games_df = games_df.copy()
+        games_df.index = range(self.rows, self.rows + len(games_df))
+        write_header = self.size == 0
+        games_df.to_csv(self.csv_path, mode='w' if write_header else 'a', header=write_header)
+
+        self.rows += len(games_df)
+        self.size = os.path.getsize(self.csv_path)
+        self.completed[date] = [self.rows, self.size]
+        self.save()
+
+    def save(self):
+        """
+        Saves the checkpoints to disk
+        """
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump({'csv_path': self.csv_path, 'rows': self.rows, 'size': self.size, 'completed': self.completed},
+                      file)
+        os.replace(temp_path, self.path)
+
+
+def update_season(season, nba_teams, combined_path=None):
+    """
+    Collects every day of a season that isn't in the season's CSV file, the combined CSV file (if given) or the feature
+    store yet. Each day is appended to all of them as soon as it is collected.
+
+    :param season:          The NBA season to collect in format "yyyy-yy"
+    :param nba_teams:       Dictionary containing all of the NBA teams and their IDs
+    :param combined_path:   The combined CSV file to also append the new games to
+    :return:                The date that could not be collected, or None if the season is up to date
+    :raises RequestFailedError: If the season's schedule or its last finished day could not be collected
+    """
+    season_store = CheckpointStore(f'games_{season}.csv')
+    features = feature_store.FeatureStore()
+
+    # Seasons collected before the feature store existed are copied into it before new days are added
+    if features.rows(season) == 0 and os.path.exists(season_store.csv_path):
+        features.import_csv(season_store.csv_path, season)
+    combined_store = CheckpointStore(combined_path) if combined_path is not None else None
+
+    # The schedule index contains only the days with games, so the first day in it is the start of the season
+    schedule = dp.get_schedule_index(season)
+    if not schedule:
+        return None
+    season_start_str = next(iter(schedule))
+
+    # The last day in the game log may still have games being played. It's left for a later run, since a checkpointed
+    # day is never collected again.
+    final_through = dp.get_final_through(season)
+    final_through = datetime.strptime(final_through, '%m/%d/%Y') if final_through is not None else None
+
+    # Each day is written to the season CSV file, then the combined CSV file, then the feature store, so a crash
+    # between them leaves the day missing from only some of them. A day is only skipped once all of them have it, and
+    # the ones that already have it skip it when it's appended again.
+    checkpoint_stores = [season_store] + ([combined_store] if combined_store is not None else [])
+    features_last_date = features.last_date(season)
+
+    def is_completed(date_str):
+        if features_last_date is None or datetime.strptime(date_str, '%m/%d/%Y') > features_last_date:
+            return False
+        return all(store.is_completed(date_str) for store in checkpoint_stores)
+
+    # Seasons built with the extra features keep getting them, so every row has the same columns
+    extra_features = set(game_features.feature_names) <= set(features.columns(season))
+
+    for curr_date_str in schedule:
+        if final_through is None or datetime.strptime(curr_date_str, '%m/%d/%Y') > final_through:
+            break
+        if is_completed(curr_date_str):
+            continue
+        print(curr_date_str)
+
+        # Stop at the first day that can't be collected, so the next run resumes from it
+        try:
+            day_games = dp.get_day_games(curr_date_str, season_start_str, season, nba_teams, schedule)
+        except api_client.RequestFailedError as error:
+            print(f"Could not collect {curr_date_str}: {error}. Run the update again to resume from this day.")
+            return curr_date_str
+
+        day_games_df = pd.DataFrame(day_games, columns=season_stats.game_columns)
+        if extra_features:
+            try:
+                day_games_df = game_features.add_game_features(day_games_df, dp.get_season_game_log(season), nba_teams)
+            except api_client.RequestFailedError as error:
+                print(f"Could not collect {curr_date_str}: {error}. Run the update again to resume from this day.")
+                return curr_date_str
+        season_store.append(curr_date_str, day_games_df)
+        if combined_store is not None:
+            combined_store.append(curr_date_str, day_games_df)
+        features.append(season, day_games_df)
+
+    return None
+
+
+def update_data(num_seasons, curr_season):
+    """
+    Brings the CSV files of num_seasons seasons up to date and appends the new games to the combined CSV file, without
+    rewriting either of them.
+
+    :param num_seasons:     The amount of seasons the combined CSV file contains
+    :param curr_season:     The most recent season
+    :return:                A list containing the season and date the update stopped at, or None if every season is up
+                            to date. The date is None if the season's schedule could not be collected.
+    """
+    nba_teams = dp.get_teams()
+    combined_path = f"all_games_20{curr_season - num_seasons}-{curr_season}.csv"
+
+    # Update the seasons from oldest to newest. If a season stops early, the newer seasons have to wait so the games in
+    # the combined file stay in order.
+    for i in range(num_seasons - 1, -1, -1):
+        season = f"20{curr_season - (i + 1)}-{curr_season - i}"
+        try:
+            stopped_at = update_season(season, nba_teams, combined_path)
+        except api_client.RequestFailedError as error:
+            print(f"Could not collect the {season} schedule: {error}. Run the update again to resume.")
+            return [season, None]
+        if stopped_at is not None:
+            return [season, stopped_at]
+
+    return None
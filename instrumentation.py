@@ -0,0 +1,197 @@
+"""
+Author Name:    Victoria Scavetta
+Date:           4/19/2022
+Course:         Concepts in AI
+
+This program predicts the results of NBA games based on each team's stats and past matchups between the teams.
+
+This file (instrumentation.py) times the hot paths of the program: every API request, retry, rate limiter wait, cache
+lookup, DataFrame build, model load and prediction is recorded as a span, and events like cache hits are counted. At the
+end of a run the spans are summed up into a table, and they can be saved as JSON or as a Chrome trace that can be opened
+in chrome://tracing or Perfetto. When instrumentation is disabled, which is the default, a span does nothing but check a
+flag.
+
+Instrumentation is enabled by calling enable(), or by setting the NBA_INSTRUMENT environment variable. Setting
+NBA_TRACE to a file name also enables it and saves a Chrome trace to that file when report() is called.
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+enabled = bool(os.environ.get('NBA_INSTRUMENT') or os.environ.get('NBA_TRACE'))
+trace_path = os.environ.get('NBA_TRACE') or None
+
+# A span that does nothing, shared by every span made while instrumentation is disabled
+_null_span = contextlib.nullcontext()
+
+_spans = []     # [name, start, duration, thread ID, arguments] of every finished span
+_counters = {}  # Counter name -> value
+_lock = threading.Lock()
+_epoch = time.perf_counter()
+
+
+def enable(path=None):
+    """
+    Starts recording spans and counters
+
+    :param path:    A file to save a Chrome trace to when report() is called, or None to only print the summary
+    """
+    global enabled, trace_path
+    enabled = True
+    if path is not None:
+        trace_path = path
+
+
+def disable():
+    """
+    Stops recording spans and counters. Anything already recorded is kept until reset() is called.
+    """
+    global enabled
+    enabled = False
+
+
+def reset():
+    """
+    Deletes every recorded span and counter
+    """
+    global _epoch
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+        _epoch = time.perf_counter()
+
+
+class _Span:
+    __slots__ = ('name', 'args', 'start')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        with _lock:
+            _spans.append([self.name, self.start - _epoch, duration, threading.get_ident(), self.args])
+        return False
+
+
+def span(name, **args):
+    """
+    Times a block of code. Use it as a context manager: with instrumentation.span('api.request', endpoint=name): ...
+
+    :param name:    The name of the span. Spans with the same name are added up in the summary
+    :param args:    Extra details saved with the span, like the endpoint name
+    :return:        A context manager that records the span, or one that does nothing if instrumentation is disabled
+    """
+    if not enabled:
+        return _null_span
+    return _Span(name, args)
+
+
+def count(name, value=1):
+    """
+    Adds to a counter
+
+    :param name:    The name of the counter. ex: 'cache.hits'
+    :param value:   The amount to add
+    """
+    if not enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def summary():
+    """
+    :return:    A list containing a dictionary with the count, total, average and maximum seconds of every span name,
+                ordered by total time, and a dictionary of the counters
+    """
+    with _lock:
+        spans = list(_spans)
+        counters = dict(_counters)
+
+    totals = {}
+    for name, start, duration, thread, args in spans:
+        total = totals.setdefault(name, {'name': name, 'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+        total['count'] += 1
+        total['total_seconds'] += duration
+        total['max_seconds'] = max(total['max_seconds'], duration)
+    for total in totals.values():
+        total['avg_seconds'] = total['total_seconds'] / total['count']
+
+    return [sorted(totals.values(), key=lambda total: total['total_seconds'], reverse=True), counters]
+
+
+def print_summary():
+    """
+    Prints a table of the time spent in every span and the value of every counter. Spans inside other spans are counted
+    in both, so the totals can add up to more than the run took.
+    """
+    spans, counters = summary()
+    if not spans and not counters:
+        return
+    print(f"\n{'span':<28}{'count':>8}{'total s':>11}{'avg ms':>11}{'max ms':>11}")
+    for total in spans:
+        print(f"{total['name']:<28}{total['count']:>8}{total['total_seconds']:>11.3f}"
+              f"{total['avg_seconds'] * 1000:>11.1f}{total['max_seconds'] * 1000:>11.1f}")
+    if counters:
+        print(f"\n{'counter':<28}{'value':>8}")
+        for name, value in sorted(counters.items()):
+            print(f"{name:<28}{value:>8}")
+
+
+def export_json(path):
+    """
+    Saves every span, the summary and the counters to a JSON file
+
+    :param path:    The file to save to
+    """
+    with _lock:
+        spans = [{'name': name, 'start': start, 'duration': duration, 'thread': thread, 'args': args}
+                 for name, start, duration, thread, args in _spans]
+    totals, counters = summary()
+    with open(path, 'w') as file:
+        json.dump({'spans': spans, 'summary': totals, 'counters': counters}, file, indent=2, default=str)
+
+
+def export_chrome_trace(path):
+    """
+    Saves every span to a file in the Chrome trace event format
+
+    :param path:    The file to save to
+    """
+    pid = os.getpid()
+    with _lock:
+        events = [{'name': name, 'cat': name.split('.')[0], 'ph': 'X', 'ts': start * 1e6, 'dur': duration * 1e6,
+                   'pid': pid, 'tid': thread, 'args': args} for name, start, duration, thread, args in _spans]
+        end = max((start + duration for name, start, duration, thread, args in _spans), default=0.0)
+        events.extend({'name': name, 'ph': 'C', 'ts': end * 1e6, 'pid': pid, 'args': {name: value}}
+                      for name, value in _counters.items())
+    with open(path, 'w') as file:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file, default=str)
+
+
+def report(path=None):
+    """
+    Prints the summary of the run and saves a Chrome trace, if instrumentation is enabled
+
+    :param path:    The file to save the trace to. trace_path is used if this is None, and no trace is saved if both
+                    are None
+    """
+    if not enabled:
+        return
+    print_summary()
+    path = path if path is not None else trace_path
+    if path is not None:
+        export_chrome_trace(path)
+        print(f"Saved the trace to {path}")
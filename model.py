@@ -5,30 +5,289 @@ Course:         Concepts in AI
 
 This program predicts the results of NBA games based on each team's stats and past matchups between the teams.
 
-This file (model.py) creates the model that will be able to predict the results of NBA games.
+This file (model.py) creates the model that will be able to predict the results of NBA games. During the season the
+model can also be brought up to date with update_model, which adds a few trees trained on only the games played since
+the model was last trained, instead of training it again from the beginning. select_features trains a model on fewer
+stats when they predict as well as all of them, so predictions need fewer requests for stats.
 """
 
-import pandas as pd
 from sklearn.metrics import accuracy_score, make_scorer, confusion_matrix
 from sklearn.model_selection import train_test_split, KFold, GridSearchCV
 from xgboost import XGBClassifier
+import xgboost as xgb
+from datetime import datetime, timedelta
+import copy
+import json
+import numpy as np
+import pandas as pd
 import pickle
-from os.path import exists
+import os
+import shutil
+import threading
+import fast_predictor
+import feature_store
+import instrumentation
+
+model_path = "nba.pickle.dat"
+
+# Every version of the model is saved in this directory, with a manifest describing how each one was trained
+versions_dir = "model_versions"
+versions_path = os.path.join(versions_dir, "versions.json")
+
+# The amount of trees update_model adds each time it's run
+update_rounds = 10
+
+# The hyperparameters of the models select_features compares, the same as the best grid search parameters
+selection_params = {'n_estimators': 100, 'learning_rate': 0.1, 'max_depth': 2}
+
+
+def successive_halving_search(x, y, n_candidates=27, min_rounds=50, max_rounds=450, reduction=3, n_splits=10,
+                              early_stopping_rounds=20, nthread=None, seed=42):
+    """
+    Searches for the best XGBoost hyperparameters with successive halving. Random candidates are cross-validated with a
+    small amount of boosting rounds, then only the best third of them are given three times as many rounds, and so on
+    until one candidate is left. Each cross-validation stops early once the AUC stops improving, which also decides the
+    amount of trees.
+
+    :param x:                       The training features
+    :param y:                       The training results
+    :param n_candidates:            The amount of random hyperparameter combinations to start with
+    :param min_rounds:              The maximum amount of boosting rounds in the first round of the search
+    :param max_rounds:              The maximum amount of boosting rounds in any round of the search
+    :param reduction:               How many times fewer candidates, with how many times more boosting rounds, each
+                                    round of the search has
+    :param n_splits:                The amount of cross-validation folds
+    :param early_stopping_rounds:   The amount of boosting rounds without an AUC improvement before a fold stops
+    :param nthread:                 The amount of threads XGBoost uses. Every core is used if this is None
+    :param seed:                    The random seed for the candidates and the folds
+    :return:                        A dictionary containing the best hyperparameters (including n_estimators), and the
+                                    cross-validated AUC and accuracy of the best candidate
+    """
+    if nthread is None:
+        nthread = os.cpu_count()
+    rng = np.random.default_rng(seed)
+
+    # The threads are set once here, instead of being searched over, so the cores are never oversubscribed
+    base_params = {'objective': 'binary:logistic', 'eval_metric': ['error', 'auc'], 'tree_method': 'hist',
+                   'nthread': nthread, 'seed': seed}
+    candidates = [{
+        'learning_rate': float(np.exp(rng.uniform(np.log(0.05), np.log(0.3)))),
+        'max_depth': int(rng.choice([2, 3, 4])),
+        'min_child_weight': int(rng.choice([1, 2, 4])),
+        'subsample': float(rng.choice([0.8, 0.9, 1.0]))
+    } for i in range(n_candidates)]
+
+    # The data and every fold are turned into DMatrix objects once and reused by every candidate
+    dtrain = xgb.DMatrix(x, label=y, nthread=nthread)
+    kfold = KFold(n_splits=n_splits, random_state=seed, shuffle=True)
+    folds = [(dtrain.slice(train_index), dtrain.slice(test_index)) for train_index, test_index in kfold.split(x)]
+
+    def cross_validate(params, rounds):
+        aucs, accuracies, best_rounds = [], [], []
+        for fold_train, fold_test in folds:
+            evals_result = {}
+            booster = xgb.train({**base_params, **params}, fold_train, num_boost_round=rounds,
+                                evals=[(fold_test, 'test')], early_stopping_rounds=early_stopping_rounds,
+                                evals_result=evals_result, verbose_eval=False)
+            best = booster.best_iteration
+            aucs.append(evals_result['test']['auc'][best])
+            accuracies.append(1 - evals_result['test']['error'][best])
+            best_rounds.append(best + 1)
+        return {'auc': float(np.mean(aucs)), 'accuracy': float(np.mean(accuracies)),
+                'n_estimators': int(round(np.mean(best_rounds)))}
+
+    rounds = min_rounds
+    while True:
+        scores = [cross_validate(params, rounds) for params in candidates]
+        ranking = np.argsort([-score['auc'] for score in scores], kind='stable')
+        print(f'{len(candidates)} candidates with up to {rounds} rounds, best AUC: {scores[ranking[0]]["auc"]}')
 
+        # Stop once a single candidate is left or the candidates can't be given any more rounds
+        if len(candidates) == 1 or rounds >= max_rounds:
+            best = ranking[0]
+            return {'params': {**candidates[best], 'n_estimators': scores[best]['n_estimators']},
+                    'auc': scores[best]['auc'], 'accuracy': scores[best]['accuracy']}
 
-def create_model():
+        candidates = [candidates[i] for i in ranking[:max(1, len(candidates) // reduction)]]
+        rounds = min(max_rounds, rounds * reduction)
+
+
+def create_model(tuning='grid'):
     """
     Create an XGBoost model that can predict the result of NBA games
 
-    :return:    The XGBoost model
+    :param tuning:  'grid' to search every hyperparameter combination with GridSearchCV, or 'halving' to use a much
+                    faster successive halving search with early stopping
+    :return:        The XGBoost model. This is the fitted GridSearchCV for 'grid' and the fitted XGBClassifier for
+                    'halving'
     """
-    # Read in the CSV containing all of the games
-    games_df = pd.read_csv("all_games_2018-22.csv")
-    games_df.drop('Unnamed: 0', axis=1, inplace=True)
+    # Load all of the games from the feature store
+    games_df = feature_store.load_games()
+    trained_through = pd.to_datetime(games_df['DATE']).max().strftime('%m/%d/%Y')
 
     # Drop non-numeric columns
     games_df.drop(columns=['HOME_TEAM', 'AWAY_TEAM', 'DATE'], axis=1, inplace=True)
 
+    # x is all of the columns except for the result column
+    # y is the result column
+    x = games_df.drop(columns='RESULT')
+    y = games_df['RESULT']
+
+    # Split the data into training and testing sets
+    x_train, x_test, y_train, y_test = train_test_split(x, y, test_size=0.20, random_state=42, shuffle=True, stratify=y)
+
+    if tuning == 'halving':
+        search = successive_halving_search(x_train, y_train)
+        model = XGBClassifier(objective='binary:logistic', tree_method='hist', n_jobs=os.cpu_count(), random_state=42,
+                              **search['params'])
+        model.fit(x_train, y_train)
+        best_score = search['auc']
+        best_params = search['params']
+        best_estimator = model
+    elif tuning == 'grid':
+        model = grid_search(x_train, y_train)
+        best_score = model.best_score_
+        best_params = model.best_params_
+        best_estimator = model.best_estimator_
+    else:
+        raise ValueError(f"Unknown tuning mode '{tuning}'. Use 'grid' or 'halving'.")
+
+    # Make predictions on test data
+    predict = model.predict(x_test)
+    predictions = [round(value) for value in predict]
+
+    # Evaluate predictions
+    print(f'Best AUC Score: {best_score}')
+    print(f'Accuracy: {accuracy_score(y_test, predictions) * 100}%')
+    print(confusion_matrix(y_test, predictions))
+    print(best_params)
+
+    # Save the model for future use
+    with open(model_path, "wb") as file:
+        pickle.dump(model, file)
+
+    # Also export the best model's trees so fast_predictor can make predictions without scikit-learn or XGBoost
+    best_estimator.get_booster().save_model(fast_predictor.booster_path)
+    save_version('full', trained_through, len(x_train), best_params)
+
+    return model
+
+
+def read_versions():
+    """
+    :return:    A list containing a dictionary describing every saved version of the model, from oldest to newest
+    """
+    if not os.path.exists(versions_path):
+        return []
+    with open(versions_path, 'r') as file:
+        return json.load(file)
+
+
+def save_version(mode, trained_through, games, params):
+    """
+    Copies the exported model into versions_dir and adds it to the manifest
+
+    :param mode:            'full' for a model trained from the beginning, 'update' for one updated by update_model or
+                            'selection' for one trained on the stats chosen by select_features
+    :param trained_through: The date of the last game the model was trained on in format "mm/dd/yyyy"
+    :param games:           The amount of games the model was trained on this time
+    :param params:          The hyperparameters, or for an update the amount of trees added
+    :return:                The dictionary describing the new version, including the features the model uses and the
+                            types of stats predictions with it have to request
+    """
+    # Only imported here because nba_api takes a while to import and only the stats dict is needed from it
+    import data_processing as dp
+
+    versions = read_versions()
+    number = versions[-1]['version'] + 1 if versions else 1
+    os.makedirs(versions_dir, exist_ok=True)
+    path = os.path.join(versions_dir, f"nba_model.v{number}.json")
+    shutil.copyfile(fast_predictor.booster_path, path)
+    feature_names = fast_predictor.load(path).feature_names
+
+    version = {
+        'version': number,
+        'mode': mode,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'trained_through': trained_through,
+        'games': games,
+        'params': params,
+        'features': feature_names,
+        'endpoints': dp.get_required_endpoints(feature_names),
+        'path': path
+    }
+    versions.append(version)
+
+    # Write to a temporary file first so a crash never leaves a half written manifest
+    temp_path = f'{versions_path}.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump(versions, file, indent=2, default=str)
+    os.replace(temp_path, versions_path)
+    return version
+
+
+def update_model(rounds=update_rounds, model_loader=None, csv_path="all_games_2018-22.csv"):
+    """
+    Brings the saved model up to date by continuing to boost it on only the games played since it was last trained. The
+    hyperparameters are kept, and only rounds trees are added, so the update takes seconds no matter how many seasons
+    the model was trained on. The hyperparameters can still be searched again from time to time with create_model.
+
+    :param rounds:          The amount of trees to add
+    :param model_loader:    The ModelLoader to get the model from. The shared loader is used if this is None
+    :param csv_path:        The combined CSV file. A model saved before the manifest existed is assumed to be trained
+                            through the last game in this file.
+    :return:                The dictionary describing the new version, or None if there are no new games
+    """
+    if model_loader is None:
+        model_loader = loader
+
+    versions = read_versions()
+    if versions:
+        trained_through = versions[-1]['trained_through']
+    else:
+        trained_through = pd.to_datetime(pd.read_csv(csv_path, usecols=['DATE'])['DATE']).max().strftime('%m/%d/%Y')
+
+    # The loaded model is shared with predictions that may be running, so a copy of it is updated
+    model = copy.deepcopy(model_loader.get())
+    booster = model.get_booster()
+    feature_names = booster.feature_names
+
+    # Only the games after the last game the model was trained on are loaded from the store
+    start = (datetime.strptime(trained_through, '%m/%d/%Y') + timedelta(days=1)).strftime('%m/%d/%Y')
+    games_df = feature_store.load_games(csv_path, columns=feature_names + ['RESULT', 'DATE'], start=start)
+    if games_df.empty:
+        print(f"There are no games after {trained_through} to update the model with.")
+        return None
+
+    x = games_df[feature_names]
+    y = games_df['RESULT']
+    new_through = pd.to_datetime(games_df['DATE']).max().strftime('%m/%d/%Y')
+
+    # The new games haven't been seen by the model yet, so its accuracy on them shows how it's holding up
+    print(f'Accuracy on the {len(games_df)} new games before the update: {accuracy_score(y, model.predict(x)) * 100}%')
+
+    # Continue boosting from the saved trees. n_estimators is the amount of trees added on top of them.
+    model.set_params(n_estimators=rounds)
+    with instrumentation.span('model.update', games=len(games_df), rounds=rounds):
+        model.fit(x, y, xgb_model=booster)
+
+    with open(model_path, "wb") as file:
+        pickle.dump(model, file)
+    model.get_booster().save_model(fast_predictor.booster_path)
+
+    version = save_version('update', new_through, len(games_df), {'rounds': rounds})
+    print(f"Saved version {version['version']} of the model, trained through {new_through}")
+    return version
+
+
+def grid_search(x_train, y_train):
+    """
+    Searches every hyperparameter combination in the search space with cross-validation
+
+    :param x_train: The training features
+    :param y_train: The training results
+    :return:        The fitted GridSearchCV
+    """
     # Create the XGBoost model
     clf = XGBClassifier(objective='binary:logistic', use_label_encoder=False)
 
@@ -48,14 +307,6 @@ def create_model():
     # AUC and accuracy will be the important scores for grid search
     scoring = {'AUC': 'roc_auc', 'Accuracy': make_scorer(accuracy_score)}
 
-    # x is all of the columns except for the result column
-    # y is the result column
-    x = games_df.drop(columns='RESULT')
-    y = games_df['RESULT']
-
-    # Split the data into training and testing sets
-    x_train, x_test, y_train, y_test = train_test_split(x, y, test_size=0.20, random_state=42, shuffle=True, stratify=y)
-
     # Define grid search
     grid = GridSearchCV(
         clf,
@@ -67,39 +318,183 @@ def create_model():
         n_jobs=-1
     )
 
-    model = grid.fit(x_train, y_train)
+    return grid.fit(x_train, y_train)
 
-    # Make predictions on test data
-    predict = model.predict(x_test)
-    predictions = [round(value) for value in predict]
 
-    # Evaluate predictions
-    print(f'Best AUC Score: {model.best_score_}')
-    print(f'Accuracy: {accuracy_score(y_test, predictions) * 100}%')
-    print(confusion_matrix(y_test, predictions))
-    print(model.best_params_)
+def select_features(tolerance=0.005, n_splits=5, params=None, seed=42):
+    """
+    Looks for the cheapest set of stats that predicts as well as all of them, and trains the model on it. Each type of
+    stats in data_processing.stats is its own request per day (or per team), so dropping every stat of a type saves a
+    request for every prediction, and several of the stats say almost the same thing (OFF_RATING, DEF_RATING and
+    PLUS_MINUS, or TS_PCT and the shooting percentages).
 
-    # Save the model for future use
-    pickle.dump(model, open("nba.pickle.dat", "wb"))
+    The stats are ranked by their total gain in a model trained on all of them. First, whole types of stats are dropped,
+    the least important per request first, then single stats are dropped, the least important first. A drop is kept if
+    the cross-validated accuracy stays within tolerance of the model with every stat. A stat's home and away columns
+    are always kept or dropped together, and features that don't need any requests, like the game features, are kept.
+    The chosen model only replaces the saved model if its accuracy on the test set is also within tolerance of the model
+    with every stat.
 
-    return model
+    :param tolerance:   The share of accuracy a smaller model can lose and still be chosen. ex: 0.005 for half a percent
+    :param n_splits:    The amount of cross-validation folds
+    :param params:      The XGBoost hyperparameters of the compared models. selection_params is used if this is None
+    :param seed:        The random seed for the split, the folds and the models
+    :return:            A dictionary containing the chosen features and types of stats, the test accuracy of the chosen
+                        model and of the model with every stat, and whether the chosen model was saved
+    """
+    # Only imported here because nba_api takes a while to import and only the stats dict is needed from it
+    import data_processing as dp
 
+    params = dict(selection_params if params is None else params)
+    n_estimators = params.pop('n_estimators')
 
-def make_predictions(games):
+    games_df = feature_store.load_games()
+    trained_through = pd.to_datetime(games_df['DATE']).max().strftime('%m/%d/%Y')
+    games_df.drop(columns=['HOME_TEAM', 'AWAY_TEAM', 'DATE'], axis=1, inplace=True)
+    x = games_df.drop(columns='RESULT')
+    y = games_df['RESULT']
+    x_train, x_test, y_train, y_test = train_test_split(x, y, test_size=0.20, random_state=42, shuffle=True, stratify=y)
+
+    # Each stat's home and away columns. Every other feature costs nothing to collect.
+    stat_columns = {stat: [column for column in [f'H_{stat}', f'A_{stat}'] if column in x.columns]
+                    for stat in dp.stats}
+    stat_columns = {stat: columns for stat, columns in stat_columns.items() if columns}
+    free_columns = [column for column in x.columns if not any(column in columns for columns in stat_columns.values())]
+
+    def columns_of(kept_stats):
+        # Keep the columns in the order they were saved in
+        kept = set(free_columns).union(*(stat_columns[stat] for stat in kept_stats))
+        return [column for column in x.columns if column in kept]
+
+    def cross_validate(kept_stats):
+        dtrain = xgb.DMatrix(x_train[columns_of(kept_stats)], label=y_train)
+        results = xgb.cv({'objective': 'binary:logistic', 'eval_metric': 'error', 'seed': seed, **params}, dtrain,
+                         num_boost_round=n_estimators, nfold=n_splits, stratified=True, seed=seed)
+        return 1 - float(results['test-error-mean'].iloc[-1])
+
+    # Rank the stats by how much the model with every stat gains from them
+    full_model = XGBClassifier(objective='binary:logistic', n_estimators=n_estimators, random_state=seed, **params)
+    full_model.fit(x_train, y_train)
+    gains = full_model.get_booster().get_score(importance_type='total_gain')
+    importance = {stat: sum(gains.get(column, 0.0) for column in columns) for stat, columns in stat_columns.items()}
+
+    kept_stats = list(stat_columns)
+    best_accuracy = cross_validate(kept_stats)
+    print(f'Every stat (requests: {len(dp.get_required_endpoints(columns_of(kept_stats)))}): '
+          f'{best_accuracy * 100:.2f}%')
+
+    def try_dropping(stats_to_drop, description):
+        remaining = [stat for stat in kept_stats if stat not in stats_to_drop]
+        if not remaining and not free_columns:
+            return kept_stats
+        accuracy = cross_validate(remaining)
+        chosen = accuracy >= best_accuracy - tolerance
+        print(f"Without {description} (requests: {len(dp.get_required_endpoints(columns_of(remaining)))}): "
+              f"{accuracy * 100:.2f}%{'  kept' if chosen else ''}")
+        return remaining if chosen else kept_stats
+
+    # Drop whole types of stats first, since they save a request each. The least important per request goes first.
+    measure_types = sorted(set(dp.stats[stat] for stat in kept_stats),
+                           key=lambda measure_type: sum(importance[stat] for stat in kept_stats
+                                                        if dp.stats[stat] == measure_type))
+    for measure_type in measure_types:
+        kept_stats = try_dropping([stat for stat in kept_stats if dp.stats[stat] == measure_type],
+                                  f'the {measure_type} stats')
+
+    # Then drop the single stats that the rest of the stats make up for, the least important first
+    for stat in sorted(kept_stats, key=lambda stat: importance[stat]):
+        kept_stats = try_dropping([stat], stat)
+
+    # Train the chosen model and compare it with the model with every stat on the test set
+    features = columns_of(kept_stats)
+    model = XGBClassifier(objective='binary:logistic', n_estimators=n_estimators, random_state=seed, **params)
+    model.fit(x_train[features], y_train)
+    accuracy = accuracy_score(y_test, model.predict(x_test[features]))
+    full_accuracy = accuracy_score(y_test, full_model.predict(x_test))
+    endpoints = dp.get_required_endpoints(features)
+    print(f'Chosen stats: {kept_stats}')
+    print(f'Requests for stats: {len(endpoints)} instead of {len(dp.get_required_endpoints())} ({endpoints})')
+    print(f'Accuracy: {accuracy * 100}% (every stat: {full_accuracy * 100}%)')
+    print(confusion_matrix(y_test, model.predict(x_test[features])))
+
+    # The drops were only checked with cross-validation on the training set, so the test set has to agree before the
+    # chosen model replaces the saved one
+    saved = accuracy >= full_accuracy - tolerance
+    if saved:
+        # Save the model for future use, the same way create_model does
+        with open(model_path, "wb") as file:
+            pickle.dump(model, file)
+        model.get_booster().save_model(fast_predictor.booster_path)
+        save_version('selection', trained_through, len(x_train), {**params, 'n_estimators': n_estimators})
+    else:
+        print(f'The chosen stats lose more than {tolerance * 100}% of accuracy on the test set, so the saved model is '
+              f'kept')
+
+    return {'features': features, 'endpoints': endpoints, 'accuracy': accuracy, 'full_accuracy': full_accuracy,
+            'saved': saved}
+
+
+class ModelLoader:
+    """
+    Loads the saved model once and keeps it in memory, so repeated predictions only cost inference. The model is loaded
+    again if the file is replaced, which is noticed by its modified time and size changing.
+    """
+
+    def __init__(self, path=None):
+        """
+        :param path:    The file the model is saved in. model_path is used if this is None
+        """
+        self.path = path if path is not None else model_path
+        self._model = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _file_version(self):
+        try:
+            file_stats = os.stat(self.path)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"No model has been saved to {self.path}. Run model.create_model() to train one.")
+        return file_stats.st_mtime_ns, file_stats.st_size
+
+    def get(self):
+        """
+        :return:    The fitted XGBoost model, loaded from disk only if it hasn't been loaded yet or the file changed
+        """
+        version = self._file_version()
+        with self._lock:
+            if self._model is None or version != self._version:
+                with instrumentation.span('model.load', path=self.path), open(self.path, "rb") as file:
+                    model = pickle.load(file)
+                # Only the best estimator of the grid search is needed to make predictions
+                self._model = getattr(model, 'best_estimator_', model)
+                self._version = version
+            return self._model
+
+
+# The model is shared by every prediction made by this process
+loader = ModelLoader()
+
+
+def make_predictions(games, model_loader=None):
     """
-    Makes predictions on a given set of NBA games.
+    Makes predictions on a given set of NBA games. The model has to have been created with create_model first.
 
-    :param games:   A DataFrame containing NBA games and each teams stats
-    :return:        The original DataFrame with an additional column containing the predicted results
+    :param games:           A DataFrame containing NBA games and each teams stats
+    :param model_loader:    The ModelLoader to get the model from. The shared loader is used if this is None
+    :return:                The original DataFrame with an additional column containing the predicted results
     """
-    # If the model has already been created and saved, load it in. Otherwise, create the model
-    if exists("nba.pickle.dat"):
-        model = pickle.load(open("nba.pickle.dat", "rb"))
-    else:
-        model = create_model()
+    if model_loader is None:
+        model_loader = loader
+    model = model_loader.get()
 
     games_df = games.copy()  # Copy the DataFrame so we don't lose the non-numeric columns in the next step
     games_df.drop(columns=['HOME_TEAM', 'AWAY_TEAM'], axis=1, inplace=True)
-    games['PREDICTED_RESULT'] = model.predict(games_df)
+
+    # A model trained by select_features only uses some of the stats, in the order it was trained with
+    feature_names = model.get_booster().feature_names
+    if feature_names:
+        games_df = games_df[feature_names]
+    with instrumentation.span('model.predict', games=len(games_df)):
+        games['PREDICTED_RESULT'] = model.predict(games_df)
 
     return games
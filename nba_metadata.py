@@ -0,0 +1,113 @@
+"""
+Author Name:    Victoria Scavetta
+Date:           4/19/2022
+Course:         Concepts in AI
+
+This program predicts the results of NBA games based on each team's stats and past matchups between the teams.
+
+This file (nba_metadata.py) contains the facts about the league that don't change: every team's ID, name, other
+names and conference, and the first and last game dates of completed seasons. They used to be asked for from the NBA
+api on every run. Keeping them here means looking up a team or a season's dates needs no request, and this file imports
+nothing, so it can be used before pandas and nba_api are loaded.
+"""
+
+# [team ID, name, abbreviation, conference, other names] of every team. The name is the one the API uses in the game
+# logs and scoreboards, which is what the datasets contain.
+teams_table = [
+    [1610612737, 'Atlanta Hawks', 'ATL', 'East', []],
+    [1610612738, 'Boston Celtics', 'BOS', 'East', []],
+    [1610612739, 'Cleveland Cavaliers', 'CLE', 'East', []],
+    [1610612740, 'New Orleans Pelicans', 'NOP', 'West', []],
+    [1610612741, 'Chicago Bulls', 'CHI', 'East', []],
+    [1610612742, 'Dallas Mavericks', 'DAL', 'West', []],
+    [1610612743, 'Denver Nuggets', 'DEN', 'West', []],
+    [1610612744, 'Golden State Warriors', 'GSW', 'West', []],
+    [1610612745, 'Houston Rockets', 'HOU', 'West', []],
+    # The API calls them the LA Clippers in its game logs, but the Los Angeles Clippers in its team list
+    [1610612746, 'LA Clippers', 'LAC', 'West', ['Los Angeles Clippers']],
+    [1610612747, 'Los Angeles Lakers', 'LAL', 'West', []],
+    [1610612748, 'Miami Heat', 'MIA', 'East', []],
+    [1610612749, 'Milwaukee Bucks', 'MIL', 'East', []],
+    [1610612750, 'Minnesota Timberwolves', 'MIN', 'West', []],
+    [1610612751, 'Brooklyn Nets', 'BKN', 'East', []],
+    [1610612752, 'New York Knicks', 'NYK', 'East', []],
+    [1610612753, 'Orlando Magic', 'ORL', 'East', []],
+    [1610612754, 'Indiana Pacers', 'IND', 'East', []],
+    [1610612755, 'Philadelphia 76ers', 'PHI', 'East', []],
+    [1610612756, 'Phoenix Suns', 'PHX', 'West', []],
+    [1610612757, 'Portland Trail Blazers', 'POR', 'West', []],
+    [1610612758, 'Sacramento Kings', 'SAC', 'West', []],
+    [1610612759, 'San Antonio Spurs', 'SAS', 'West', []],
+    [1610612760, 'Oklahoma City Thunder', 'OKC', 'West', []],
+    [1610612761, 'Toronto Raptors', 'TOR', 'East', []],
+    [1610612762, 'Utah Jazz', 'UTA', 'West', []],
+    [1610612763, 'Memphis Grizzlies', 'MEM', 'West', []],
+    [1610612764, 'Washington Wizards', 'WAS', 'East', []],
+    [1610612765, 'Detroit Pistons', 'DET', 'East', []],
+    [1610612766, 'Charlotte Hornets', 'CHA', 'East', []]
+]
+
+# [first game date, last game date] of the regular season of completed seasons, in format "mm/dd/yyyy"
+season_bounds = {
+    '2018-19': ['10/16/2018', '04/10/2019'],
+    '2019-20': ['10/22/2019', '08/14/2020'],
+    '2020-21': ['12/22/2020', '05/16/2021'],
+    '2021-22': ['10/19/2021', '04/10/2022']
+}
+
+# Lookups built once from the table, so finding a team is a single dictionary lookup
+_names = {team_id: name for team_id, name, abbreviation, conference, other_names in teams_table}
+_conferences = {team_id: conference for team_id, name, abbreviation, conference, other_names in teams_table}
+_ids = {}
+for team_id, name, abbreviation, conference, other_names in teams_table:
+    for team_name in [name, abbreviation] + other_names:
+        _ids[team_name] = team_id
+        _ids[team_name.lower()] = team_id
+
+
+def team_name(team_id):
+    """
+    :param team_id: A team's ID
+    :return:        The team's name as the API uses it in its game logs, or None if the ID isn't a team
+    """
+    return _names.get(team_id)
+
+
+def team_conference(team_id):
+    """
+    :param team_id: A team's ID
+    :return:        'East' or 'West', or None if the ID isn't a team
+    """
+    return _conferences.get(team_id)
+
+
+def team_id(name):
+    """
+    :param name:    A team's name, one of its other names or its abbreviation, in any case. ex: 'LA Clippers',
+                    'Los Angeles Clippers' or 'lac'
+    :return:        The team's ID, or None if the name isn't a team
+    """
+    found = _ids.get(name)
+    return found if found is not None else _ids.get(name.lower())
+
+
+def teams_dict():
+    """
+    :return:    A dictionary containing every team name and other name with the team's ID. The Clippers are in it under
+                both of their names.
+    """
+    teams = {}
+    for team_id, name, abbreviation, conference, other_names in teams_table:
+        for team_name in other_names + [name]:
+            teams[team_name] = team_id
+    return teams
+
+
+def get_season_bounds(season):
+    """
+    :param season:  The NBA season. ex: '2021-22'
+    :return:        A list containing the first and last game dates of the season in format "mm/dd/yyyy", or None if
+                    the season isn't in the table
+    """
+    bounds = season_bounds.get(season)
+    return list(bounds) if bounds is not None else None
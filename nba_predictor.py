@@ -5,14 +5,41 @@ Course:         Concepts in AI
 
 This program predicts the results of NBA games based on each team's stats and past matchups between the teams.
 
-This file (nba_predictor.py) controls the UI and prints the predicted results to the console.
+This file (nba_predictor.py) controls the UI and prints the predicted results to the console. Only the standard
+library is imported when the program starts, so the prompt appears right away. pandas, nba_api and the predictor are
+imported in the background while the user types a date. A date predicted ahead of time by precompute.py is answered
+from the prediction store without waiting for them.
 """
 
-from datetime import datetime, timedelta
-import data_processing as dp
-import model as m
-import pandas as pd
+import os
 import re
+import threading
+import instrumentation
+
+
+def preload():
+    """
+    Imports the modules that make the predictions, which take about a second to import because of pandas and nba_api,
+    and loads the exported model if there is one
+    """
+    import data_processing  # noqa
+    import fast_predictor
+    if os.path.exists(fast_predictor.booster_path):
+        fast_predictor.get_model()
+
+
+def print_prediction(home_team, away_team, result):
+    """
+    Prints which team will win a game
+
+    :param home_team:   The home team's name
+    :param away_team:   The away team's name
+    :param result:      The predicted result, 1 if the home team wins and 0 if the away team wins
+    """
+    if result == 0:
+        print(f"{away_team} will beat {home_team}")
+    elif result == 1:
+        print(f"{home_team} will beat {away_team}")
 
 
 def main():
@@ -21,6 +48,9 @@ def main():
     the games occurring on that date and for each team playing, get their stats. It will send this DataFrame to the
     model to predict who will win each game. The program will then print the winners to the console.
     """
+    # Python's import lock makes the imports below wait for these ones if the user is faster than them
+    threading.Thread(target=preload, daemon=True).start()
+
     print("Hello, welcome to NBA Predictor!")
     date = ""
     season = ""
@@ -55,33 +85,54 @@ def main():
         print(f"This date belongs to the {season} season.")
         success_both = True
 
-    nba_teams = dp.get_teams()
-    games = dp.get_matchups(date, nba_teams)
+    # A slate predicted ahead of time by precompute.py is answered right away, without collecting any stats
+    import prediction_store
+    with instrumentation.span('predictor.precomputed', date=date):
+        slate = prediction_store.default_store.get_slate(date, prediction_store.model_version())
+    if slate is not None:
+        if slate:
+            print("\nThe predictions are in!")
+            for home_team, away_team, result, probability in slate:
+                print_prediction(home_team, away_team, result)
+        else:
+            print("There are no games to predict!")
+        instrumentation.report()
+        return
+
+    import data_processing as dp
+    import fast_predictor
+
+    with instrumentation.span('predictor.schedule', date=date):
+        nba_teams = dp.get_teams()
+        games = dp.get_matchups(date, nba_teams)
 
     # If there are games on the specified date, make the predictions
     if games:
         print("Processing games...")
-        previous_day = (datetime.strptime(date, '%m/%d/%Y') - timedelta(days=1)).strftime('%m/%d/%Y')
-        season_start = dp.get_season_start_end(season)[0]
         print("Collecting stats...")
-        games_stats = dp.combine_games_stats([games], season_start, previous_day, season, nba_teams)
-        games_df = pd.DataFrame(games_stats, columns=['HOME_TEAM', 'AWAY_TEAM', 'H_W_PCT', 'H_FG_PCT', 'H_FG3_PCT',
-                                                      'H_FT_PCT', 'H_REB', 'H_AST', 'H_TOV', 'H_STL', 'H_BLK',
-                                                      'H_PLUS_MINUS', 'H_OFF_RATING', 'H_DEF_RATING', 'H_TS_PCT',
-                                                      'A_W_PCT', 'A_FG_PCT', 'A_FG3_PCT', 'A_FT_PCT', 'A_REB',
-                                                      'A_AST', 'A_TOV', 'A_STL', 'A_BLK', 'A_PLUS_MINUS',
-                                                      'A_OFF_RATING', 'A_DEF_RATING', 'A_TS_PCT'])
+        # Only the stats and game features the exported model uses are collected
+        with instrumentation.span('predictor.collect_stats', games=len(games)):
+            games_df = dp.get_prediction_games(date, season, nba_teams, fast_predictor.model_feature_names(), games)
         print("Making predictions...")
-        games_predictions = m.make_predictions(games_df)
+        try:
+            # The exported trees are much faster to load than the pickled model, so they're used when they exist
+            with instrumentation.span('predictor.predict', games=len(games_df)):
+                games_predictions = fast_predictor.make_predictions(games_df)
+        except FileNotFoundError as error:
+            # Training takes a long time, so it is never done here. The model has to be created ahead of time.
+            print(error)
+            instrumentation.report()
+            return
 
         print("\nThe predictions are in!")
         for index, row in games_predictions.iterrows():
-            if row['PREDICTED_RESULT'] == 0:
-                print(f"{row['AWAY_TEAM']} will beat {row['HOME_TEAM']}")
-            elif row['PREDICTED_RESULT'] == 1:
-                print(f"{row['HOME_TEAM']} will beat {row['AWAY_TEAM']}")
+            print_prediction(row['HOME_TEAM'], row['AWAY_TEAM'], row['PREDICTED_RESULT'])
     else:
         print("There are no games to predict!")
 
+    # Prints where the time went, if instrumentation is enabled with NBA_INSTRUMENT or NBA_TRACE
+    instrumentation.report()
+
 
-main()
+if __name__ == '__main__':
+    main()
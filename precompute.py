@@ -0,0 +1,165 @@
+"""
+Author Name:    Victoria Scavetta
+Date:           4/19/2022
+Course:         Concepts in AI
+
+This program predicts the results of NBA games based on each team's stats and past matchups between the teams.
+
+This file (precompute.py) predicts the next few days' games ahead of time and saves them in the prediction store
+(prediction_store.py), so nba_predictor.py can answer right away instead of collecting stats and running the model.
+A game's prediction only uses both team's stats through the day before it, so it can't change once those stats are
+final. That is the case when the day before the game is over, or when neither team plays between the last finished
+day and the game. Each run predicts every game that is final in that sense and hasn't been predicted by the current
+model yet, and marks a date's slate as complete once all of its games are predicted. Run it every few minutes while
+games are being played (--every) and each slate is predicted as soon as the results it depends on are in.
+
+Example:    python precompute.py --days 3 --every 15
+"""
+
+import argparse
+from datetime import datetime, timedelta
+import time
+import api_client
+import batch_predict
+import data_processing as dp
+import fast_predictor
+import instrumentation
+import prediction_store
+
+# The amount of days predicted ahead, starting with today
+precompute_days = 3
+
+
+def predict_games(date, matchups, season, stats_through, nba_teams, model_path=None):
+    """
+    Predicts some of a date's games from both team's stats through a specified day
+
+    :param date:            The date of the games in format "mm/dd/yyyy"
+    :param matchups:        A dictionary of the games to predict where the home team is the key
+    :param season:          The NBA season of the date. ex: '2021-22'
+    :param stats_through:   The last day of the stats in format "mm/dd/yyyy"
+    :param nba_teams:       Dictionary containing all of the NBA teams and their IDs
+    :param model_path:      The exported XGBoost JSON model. fast_predictor.booster_path is used if this is None
+    :return:                A list of [home team, away team, predicted result, home win probability] lists
+    """
+    games_df = dp.get_prediction_games(date, season, nba_teams, fast_predictor.model_feature_names(model_path),
+                                       matchups, stats_through)
+    probabilities = fast_predictor.predict_proba(games_df, model_path)
+    games_df = fast_predictor.make_predictions(games_df, model_path)
+    return [[home_team, away_team, result, probability] for home_team, away_team, result, probability
+            in zip(games_df['HOME_TEAM'], games_df['AWAY_TEAM'], games_df['PREDICTED_RESULT'], probabilities)]
+
+
+def precompute(days=precompute_days, start=None, model_path=None, store=None):
+    """
+    Predicts every game of the next few days whose stats are final and saves the predictions in the prediction store
+
+    :param days:        The amount of days to predict
+    :param start:       The first date in format "mm/dd/yyyy". Today is used if this is None
+    :param model_path:  The exported XGBoost JSON model. fast_predictor.booster_path is used if this is None, or the
+                        pickled model if nothing has been exported
+    :param store:       The PredictionStore to save to. prediction_store.default_store is used if this is None
+    :return:            A dictionary with each date as the key and the amount of its games predicted by the current
+                        model and on its slate as the value
+    :raises FileNotFoundError: If there is no saved model
+    """
+    store = store if store is not None else prediction_store.default_store
+    model = prediction_store.model_version(model_path)
+    if model is None:
+        raise FileNotFoundError("There is no saved model. Train one with model.create_model() first.")
+
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    first_date = datetime.strptime(start, '%m/%d/%Y') if start is not None else today
+    nba_teams = dp.get_teams()
+    # Each season's last finished day and each day's matchups are shared by every date that needs them
+    final_through = {}
+    schedule = {}
+
+    def get_day(day):
+        if day not in schedule:
+            schedule[day] = dp.get_matchups(day.strftime('%m/%d/%Y'), nba_teams)
+        return schedule[day]
+
+    summary = {}
+    for offset in range(days):
+        day = first_date + timedelta(days=offset)
+        date = day.strftime('%m/%d/%Y')
+        slate = store.get_slate(date, model)
+        if slate is not None:
+            summary[date] = (len(slate), len(slate))
+            continue
+
+        matchups = get_day(day)
+        predicted = store.get_games(date, model)
+        remaining = {home_team: away_team for home_team, away_team in matchups.items() if home_team not in predicted}
+        if remaining:
+            season = batch_predict.get_season_for_date(date)
+            if season not in final_through:
+                # The same rule that decides which stats are cached. A season that hasn't started has no stats that
+                # could still change.
+                final_day = dp.get_final_through(season)
+                final_through[season] = (datetime.strptime(final_day, '%m/%d/%Y') if final_day is not None
+                                         else today - timedelta(days=1))
+            stats_through = min(day - timedelta(days=1), final_through[season])
+
+            # A team playing between the last finished day and the game doesn't have its stats for the game yet
+            busy_teams = set()
+            pending_day = stats_through + timedelta(days=1)
+            while pending_day < day:
+                for home_team, away_team in get_day(pending_day).items():
+                    busy_teams.update([home_team, away_team])
+                pending_day += timedelta(days=1)
+            ready = {home_team: away_team for home_team, away_team in remaining.items()
+                     if home_team not in busy_teams and away_team not in busy_teams}
+
+            if ready:
+                with instrumentation.span('precompute.predict', date=date, games=len(ready)):
+                    games = predict_games(date, ready, season, stats_through.strftime('%m/%d/%Y'), nba_teams,
+                                          model_path)
+                store.put_games(date, games, model, stats_through.strftime('%m/%d/%Y'))
+                predicted.update({home_team: [away_team, result, probability]
+                                  for home_team, away_team, result, probability in games})
+
+        done = len([home_team for home_team in matchups if home_team in predicted])
+        if done == len(matchups):
+            store.complete_slate(date, list(matchups), model)
+        summary[date] = (done, len(matchups))
+
+    return summary
+
+
+def main(args=None):
+    """
+    Predicts the next few days' games from the command line, once or every few minutes
+
+    :param args:    The command line arguments. sys.argv is used if this is None
+    """
+    parser = argparse.ArgumentParser(description="Predicts the next few days of NBA games ahead of time.")
+    parser.add_argument('--days', type=int, default=precompute_days, help="The amount of days to predict")
+    parser.add_argument('--start', help="The first date in format mm/dd/yyyy. Defaults to today")
+    parser.add_argument('--model', default=None, help="The exported XGBoost JSON model")
+    parser.add_argument('--every', type=float, default=None,
+                        help="Keep running and predict again every this many minutes")
+    args = parser.parse_args(args)
+
+    while True:
+        try:
+            summary = precompute(args.days, args.start, args.model)
+            for date, (done, games) in summary.items():
+                status = "complete" if done == games else "waiting for results"
+                print(f"{date}: {done} of {games} games predicted ({status})")
+        except api_client.RequestFailedError as error:
+            # The next run tries again
+            print(f"Could not collect the games: {error}")
+        if args.every is None:
+            break
+        try:
+            time.sleep(args.every * 60)
+        except KeyboardInterrupt:
+            break
+
+    instrumentation.report()
+
+
+if __name__ == '__main__':
+    main()
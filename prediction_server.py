@@ -0,0 +1,352 @@
+"""
+Author Name:    Victoria Scavetta
+Date:           4/19/2022
+Course:         Concepts in AI
+
+This program predicts the results of NBA games based on each team's stats and past matchups between the teams.
+
+This file (prediction_server.py) is a long-running local HTTP service that answers "who wins tonight?" without the
+console prompts of nba_predictor.py. The model is loaded once, and the first request for a date collects that night's
+games and team stats and predicts them once. The predictions are kept in memory as the date's snapshot, so every later
+request for the date is answered in milliseconds. Requests for a date that is still being collected wait for that
+collection instead of starting their own. A background thread collects the current day's snapshot once a day, so the
+first request of the day is fast too.
+
+Example:    python prediction_server.py --port 8080
+            curl "http://127.0.0.1:8080/predictions?date=04/05/2022"
+            curl "http://127.0.0.1:8080/predictions?date=04/05/2022&team=Boston%20Celtics"
+"""
+
+import argparse
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+import pandas as pd
+import api_client
+import batch_predict
+import data_processing as dp
+import fast_predictor
+import instrumentation
+
+# The amount of dates whose snapshots are kept in memory. The least recently used snapshot is dropped first.
+max_snapshots = 64
+
+# The hour of the day, in local time, that the current day's snapshot is collected in the background. By then the
+# previous night's games are over and their stats are final.
+refresh_hour = 10
+
+# The amount of seconds a snapshot is kept for when the games of the day before its date weren't all over when it was
+# collected. Its stats will still change, so it's collected again after this.
+provisional_seconds = 5 * 60
+
+
+class Snapshot:
+    """
+    The games on one date, both team's stats through the day before and the predicted result of every game
+    """
+
+    def __init__(self, date, games_df, final=True):
+        """
+        :param date:        The date of the games in format "mm/dd/yyyy"
+        :param games_df:    A DataFrame of the games with the HOME_TEAM, AWAY_TEAM and PREDICTED_RESULT columns
+        :param final:       False if the stats through the day before the date could still change
+        """
+        self.date = date
+        self.final = final
+        self.created = datetime.now()
+        self.games = []
+        for game in games_df.itertuples(index=False):
+            self.games.append({
+                'home_team': game.HOME_TEAM,
+                'away_team': game.AWAY_TEAM,
+                'predicted_result': int(game.PREDICTED_RESULT),
+                'predicted_winner': game.HOME_TEAM if game.PREDICTED_RESULT == 1 else game.AWAY_TEAM
+            })
+
+    def find_game(self, team):
+        """
+        :param team:    The name of a team
+        :return:        The team's game on the snapshot's date, or None if it isn't playing
+        """
+        for game in self.games:
+            if team in (game['home_team'], game['away_team']):
+                return game
+        return None
+
+    def is_expired(self):
+        """
+        :return:    True if the snapshot was made from stats that weren't final and it's been kept long enough
+        """
+        return not self.final and (datetime.now() - self.created).total_seconds() > provisional_seconds
+
+    def to_dict(self):
+        """
+        :return:    The snapshot as a dictionary that can be sent as JSON
+        """
+        return {'date': self.date, 'snapshot_time': self.created.isoformat(timespec='seconds'), 'final': self.final,
+                'games': self.games}
+
+
+class PredictionService:
+    """
+    Keeps the model and the snapshots of recently asked for dates in memory and makes new snapshots on demand
+    """
+
+    def __init__(self, model_path=None, snapshots=max_snapshots):
+        """
+        :param model_path:  The exported XGBoost JSON model. fast_predictor.booster_path is used if this is None
+        :param snapshots:   The amount of snapshots to keep in memory
+        """
+        self.model_path = model_path
+        self.max_snapshots = snapshots
+        self._snapshots = OrderedDict()  # Date -> Snapshot, least recently used first
+        self._pending = {}  # Date -> Future of a snapshot that is being collected
+        self._lock = threading.Lock()
+        self._nba_teams = None
+        self._stop = threading.Event()
+
+    def warm_up(self):
+        """
+        Loads the team list and the model ahead of the first request
+        """
+        self._nba_teams = dp.get_teams()
+        if os.path.exists(self.model_path if self.model_path is not None else fast_predictor.booster_path):
+            fast_predictor.get_model(self.model_path)
+        else:
+            # Only import scikit-learn and XGBoost when there's no exported model
+            import model as m
+            m.loader.get()
+
+    def nba_teams(self):
+        """
+        :return:    Dictionary containing all of the NBA teams and their IDs, only collected once
+        """
+        if self._nba_teams is None:
+            self._nba_teams = dp.get_teams()
+        return self._nba_teams
+
+    def _collect(self, date):
+        """
+        Collects a date's games and both team's stats through the day before, and predicts every game
+
+        :param date:    The date in format "mm/dd/yyyy"
+        :return:        The date's Snapshot
+        """
+        nba_teams = self.nba_teams()
+        season = batch_predict.get_season_for_date(date)
+        previous_day = (datetime.strptime(date, '%m/%d/%Y') - timedelta(days=1)).strftime('%m/%d/%Y')
+        # Checked before collecting, so games that end during the collection can't make the snapshot look final
+        final = dp.is_final(season, previous_day)
+        with instrumentation.span('server.collect', date=date):
+            matchups = dp.get_matchups(date, nba_teams)
+            if not matchups:
+                return Snapshot(date, pd.DataFrame(columns=['HOME_TEAM', 'AWAY_TEAM', 'PREDICTED_RESULT']), final)
+            games_df = dp.get_prediction_games(date, season, nba_teams,
+                                               fast_predictor.model_feature_names(self.model_path), matchups)
+
+        with instrumentation.span('server.predict', date=date, games=len(games_df)):
+            return Snapshot(date, fast_predictor.make_predictions(games_df, self.model_path), final)
+
+    def get_snapshot(self, date, refresh=False):
+        """
+        Gets a date's snapshot from memory, or collects it. If the date is already being collected for another request,
+        this waits for that collection instead of starting a second one. A snapshot made before the games of the day
+        before its date were all over is collected again after provisional_seconds.
+
+        :param date:    The date in format "mm/dd/yyyy"
+        :param refresh: If True, collect the snapshot again even if one is in memory
+        :return:        The date's Snapshot
+        :raises RequestFailedError: If the games or stats could not be collected
+        """
+        with self._lock:
+            if not refresh and date in self._snapshots and not self._snapshots[date].is_expired():
+                self._snapshots.move_to_end(date)
+                instrumentation.count('server.snapshot_hits')
+                return self._snapshots[date]
+
+            future = self._pending.get(date)
+            collecting = future is None
+            if collecting:
+                future = Future()
+                self._pending[date] = future
+
+        if not collecting:
+            instrumentation.count('server.coalesced')
+            return future.result()
+
+        instrumentation.count('server.snapshot_misses')
+        try:
+            snapshot = self._collect(date)
+        except BaseException as error:
+            with self._lock:
+                del self._pending[date]
+            future.set_exception(error)
+            raise
+
+        with self._lock:
+            self._snapshots[date] = snapshot
+            self._snapshots.move_to_end(date)
+            while len(self._snapshots) > self.max_snapshots:
+                self._snapshots.popitem(last=False)
+            del self._pending[date]
+        future.set_result(snapshot)
+        return snapshot
+
+    def snapshot_dates(self):
+        """
+        :return:    The dates that have a snapshot in memory
+        """
+        with self._lock:
+            return list(self._snapshots)
+
+    def _refresh_loop(self, hour):
+        while True:
+            now = datetime.now()
+            next_refresh = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+            if next_refresh <= now:
+                next_refresh += timedelta(days=1)
+            if self._stop.wait((next_refresh - now).total_seconds()):
+                return
+            self.refresh_today()
+
+    def refresh_today(self):
+        """
+        Collects the current day's snapshot again, so it has the stats of every game played through yesterday. Errors
+        are printed instead of raised, so the background thread keeps refreshing on the following days.
+        """
+        today = datetime.now().strftime('%m/%d/%Y')
+        try:
+            self.get_snapshot(today, refresh=True)
+            print(f"Refreshed the predictions for {today}")
+        except Exception as error:
+            print(f"Could not refresh the predictions for {today}: {error}")
+
+    def start_refresh(self, hour=refresh_hour):
+        """
+        Starts the background thread that collects the current day's snapshot once a day
+
+        :param hour:    The hour of the day, in local time, to collect the snapshot at
+        :return:        The thread
+        """
+        thread = threading.Thread(target=self._refresh_loop, args=(hour,), daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        """
+        Stops the background refresh
+        """
+        self._stop.set()
+
+
+def parse_date(value):
+    """
+    :param value:   A date in format "mm/dd/yyyy" or "yyyy-mm-dd", or None for today
+    :return:        The date in format "mm/dd/yyyy"
+    :raises ValueError: If the date isn't in either format
+    """
+    if not value:
+        return datetime.now().strftime('%m/%d/%Y')
+    for date_format in ('%m/%d/%Y', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, date_format).strftime('%m/%d/%Y')
+        except ValueError:
+            pass
+    raise ValueError(f"Invalid date {value}. Use mm/dd/yyyy or yyyy-mm-dd.")
+
+
+def make_handler(service):
+    """
+    :param service: The PredictionService that answers the requests
+    :return:        A request handler class for the HTTP server
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body):
+            content = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+
+            if url.path == '/health':
+                self._send(200, {'status': 'ok', 'snapshots': service.snapshot_dates()})
+                return
+            if url.path != '/predictions':
+                self._send(404, {'error': f"Unknown path {url.path}. Use /predictions or /health."})
+                return
+
+            start = time.perf_counter()
+            try:
+                date = parse_date(query.get('date'))
+            except ValueError as error:
+                self._send(400, {'error': str(error)})
+                return
+
+            # The date is valid, so anything that goes wrong while collecting it means the predictions aren't available
+            try:
+                snapshot = service.get_snapshot(date, refresh=query.get('refresh') == '1')
+            except (api_client.RequestFailedError, FileNotFoundError, ValueError) as error:
+                self._send(503, {'error': str(error)})
+                return
+
+            if 'team' in query:
+                game = snapshot.find_game(query['team'])
+                if game is None:
+                    self._send(404, {'error': f"{query['team']} doesn't play on {date}."})
+                    return
+                body = {'date': date, 'game': game}
+            else:
+                body = snapshot.to_dict()
+            body['milliseconds'] = round((time.perf_counter() - start) * 1000, 3)
+            self._send(200, body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def main(args=None):
+    """
+    Runs the prediction server until it's stopped with Ctrl+C
+
+    :param args:    The command line arguments. sys.argv is used if this is None
+    """
+    parser = argparse.ArgumentParser(description="A local HTTP service that predicts NBA games.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--model', default=None, help="The exported XGBoost JSON model")
+    parser.add_argument('--refresh-hour', type=int, default=refresh_hour,
+                        help="The hour of the day the day's predictions are collected in the background")
+    args = parser.parse_args(args)
+
+    service = PredictionService(args.model)
+    service.warm_up()
+    service.start_refresh(args.refresh_hour)
+
+    httpd = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    httpd.daemon_threads = True
+    print(f"Serving predictions at http://{args.host}:{args.port}/predictions?date=mm/dd/yyyy")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        httpd.server_close()
+        instrumentation.report()
+
+
+if __name__ == '__main__':
+    main()
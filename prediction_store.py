@@ -0,0 +1,156 @@
+"""
+Author Name:    Victoria Scavetta
+Date:           4/19/2022
+Course:         Concepts in AI
+
+This program predicts the results of NBA games based on each team's stats and past matchups between the teams.
+
+This file (prediction_store.py) keeps the predictions made ahead of time by precompute.py in a small SQLite database,
+one row per game keyed by the date and the home team. A date's slate is only marked as complete once every game on it
+has been predicted, and a slate only counts for the model that predicted it, so replacing the model makes the old
+predictions be computed again. Only the standard library is imported, so nba_predictor.py can answer from the store
+before pandas and nba_api are loaded.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+# api_cache.cache_dir, which isn't imported here because api_cache loads pandas
+db_path = os.path.join('.nba_cache', 'predictions.sqlite')
+
+
+def model_version(path=None):
+    """
+    Identifies the saved model by its file's modified time and size, the same way the model loaders notice it changed
+
+    :param path:    The exported XGBoost JSON model. The model fast_predictor uses is identified if this is None: the
+                    exported model, or the pickled model if nothing has been exported
+    :return:        A string that changes whenever the model file is replaced, or None if there's no saved model
+    """
+    if path is None:
+        path = 'nba_model.json' if os.path.exists('nba_model.json') else 'nba.pickle.dat'
+    try:
+        file_stats = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return f"{os.path.basename(path)}:{file_stats.st_mtime_ns}:{file_stats.st_size}"
+
+
+class PredictionStore:
+    """
+    A table of predicted games keyed by date and home team, and a table of the dates whose whole slate is predicted
+    """
+
+    def __init__(self, path=db_path):
+        """
+        :param path:    The SQLite database file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = None
+        self._connection_pid = None
+
+    def _db(self):
+        # A connection can't be shared with a forked process, so each process opens its own
+        if self._connection is None or self._connection_pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._connection.execute('CREATE TABLE IF NOT EXISTS predictions (date TEXT, home_team TEXT, '
+                                     'away_team TEXT, predicted_result INTEGER, home_win_probability REAL, '
+                                     'stats_through TEXT, model TEXT, created REAL, PRIMARY KEY (date, home_team))')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS slates (date TEXT PRIMARY KEY, games INTEGER, '
+                                     'model TEXT, created REAL)')
+            self._connection.commit()
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def put_games(self, date, games, model, stats_through):
+        """
+        Saves the predictions of some of a date's games. Predictions of the date made by any other model are deleted.
+
+        :param date:            The date of the games in format "mm/dd/yyyy"
+        :param games:           A list of [home team, away team, predicted result, home win probability] lists
+        :param model:           The model_version of the model that made the predictions
+        :param stats_through:   The last date of the stats the predictions were made from in format "mm/dd/yyyy"
+        """
+        with self._lock:
+            db = self._db()
+            db.execute('DELETE FROM predictions WHERE date = ? AND model != ?', (date, model))
+            db.execute('DELETE FROM slates WHERE date = ? AND model != ?', (date, model))
+            db.executemany('INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                           [(date, home_team, away_team, int(result), float(probability), stats_through, model,
+                             time.time()) for home_team, away_team, result, probability in games])
+            db.commit()
+
+    def get_games(self, date, model):
+        """
+        :param date:    The date in format "mm/dd/yyyy"
+        :param model:   The model_version of the current model
+        :return:        A dictionary of the date's games predicted by the model so far, keyed by home team, with
+                        [away team, predicted result, home win probability] lists as values
+        """
+        with self._lock:
+            rows = self._db().execute('SELECT home_team, away_team, predicted_result, home_win_probability FROM '
+                                      'predictions WHERE date = ? AND model = ?', (date, model)).fetchall()
+        return {home_team: [away_team, result, probability] for home_team, away_team, result, probability in rows}
+
+    def complete_slate(self, date, home_teams, model):
+        """
+        Marks a date's slate as fully predicted, and deletes the predictions of games that are no longer on it, like
+        postponed games
+
+        :param date:        The date in format "mm/dd/yyyy"
+        :param home_teams:  The home teams of every game on the date
+        :param model:       The model_version of the model that predicted the games
+        """
+        with self._lock:
+            db = self._db()
+            placeholders = ', '.join('?' * len(home_teams))
+            db.execute(f'DELETE FROM predictions WHERE date = ? AND home_team NOT IN ({placeholders})',
+                       (date, *home_teams))
+            db.execute('INSERT OR REPLACE INTO slates VALUES (?, ?, ?, ?)', (date, len(home_teams), model, time.time()))
+            db.commit()
+
+    def get_slate(self, date, model):
+        """
+        :param date:    The date in format "mm/dd/yyyy"
+        :param model:   The model_version of the current model
+        :return:        A list of [home team, away team, predicted result, home win probability] lists for every game
+                        on the date, an empty list if it has no games, or None if the date's slate hasn't been fully
+                        predicted by this model
+        """
+        if model is None:
+            return None
+        with self._lock:
+            db = self._db()
+            slate = db.execute('SELECT games FROM slates WHERE date = ? AND model = ?', (date, model)).fetchone()
+            if slate is None:
+                return None
+            rows = db.execute('SELECT home_team, away_team, predicted_result, home_win_probability FROM predictions '
+                              'WHERE date = ? AND model = ? ORDER BY rowid', (date, model)).fetchall()
+        if len(rows) != slate[0]:
+            return None
+        return [list(row) for row in rows]
+
+    def dates(self):
+        """
+        :return:    The dates that have a complete slate, with the amount of games and the model of each
+        """
+        with self._lock:
+            return self._db().execute('SELECT date, games, model FROM slates').fetchall()
+
+    def clear(self):
+        """
+        Deletes every saved prediction
+        """
+        with self._lock:
+            db = self._db()
+            db.execute('DELETE FROM predictions')
+            db.execute('DELETE FROM slates')
+            db.commit()
+
+
+# The store shared by precompute.py and nba_predictor.py
+default_store = PredictionStore()
@@ -0,0 +1,302 @@
+"""
+Author Name:    Victoria Scavetta
+Date:           4/19/2022
+Course:         Concepts in AI
+
+This program predicts the results of NBA games based on each team's stats and past matchups between the teams.
+
+This file (season_simulator.py) projects the final standings and playoff odds of a season. Every remaining game is
+scored once with the model's chance of the home team winning, using both team's stats through the simulation date.
+Then the rest of the season is played out many times at once: each batch of simulations is a matrix of random draws
+with one row per simulation and one column per game, so there is no loop over the games. The wins, conference seeds
+and ties of every simulation are added up into each team's projected wins and chance of every seed. The batches are
+independent, so they're simulated in parallel.
+
+Example:    python season_simulator.py --season 2021-22 --as-of 02/01/2022 --simulations 100000
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+import os
+import numpy as np
+import pandas as pd
+import batch_predict
+import data_processing as dp
+import fast_predictor
+import instrumentation
+import nba_metadata
+import season_stats
+
+# The amount of simulations in each batch. A batch of a full season's 1,230 games is about 50MB of random draws.
+batch_size = 10000
+
+# Seeds 1 to 6 of each conference go straight to the playoffs, and seeds 7 to 10 play in the play-in tournament
+playoff_seeds = 6
+play_in_seeds = 10
+
+# The teams in the order of the standings arrays, and the ones in each conference
+team_ids = [team[0] for team in nba_metadata.teams_table]
+conference_names = ['East', 'West']
+
+# The scored schedule, shared with every worker process once instead of being sent with every batch
+_season = None
+
+
+def get_remaining_games(season, as_of, nba_teams, end_date=None):
+    """
+    Gets every game of a season after a date. Games that are already in the season game log, like every game of a past
+    season, come from it. Any later dates are looked up on the scoreboard one day at a time.
+
+    :param season:      The NBA season. ex: '2021-22'
+    :param as_of:       The last date that has been played in format "mm/dd/yyyy"
+    :param nba_teams:   Dictionary containing all of the NBA teams and their IDs
+    :param end_date:    The last day of the regular season in format "mm/dd/yyyy". If this is None, it's looked up in
+                        nba_metadata.py, or April 15th is used for a season that isn't over
+    :return:            A DataFrame with the DATE, HOME_TEAM and AWAY_TEAM of every remaining game, in date order
+    """
+    as_of_date = datetime.strptime(as_of, '%m/%d/%Y')
+    if end_date is None:
+        bounds = nba_metadata.get_season_bounds(season)
+        end_date = bounds[1] if bounds is not None else f"04/15/{int(season[0:4]) + 1}"
+
+    # The games that are in the game log, which has the whole schedule of a past season
+    games = []
+    schedule = dp.get_schedule_index(season)
+    for date, (matchups, results) in schedule.items():
+        if datetime.strptime(date, '%m/%d/%Y') > as_of_date:
+            games.extend([date, home_team, away_team] for home_team, away_team in matchups.items())
+
+    # The days after the end of the game log haven't been played yet, so their games are on the scoreboard
+    last_logged = max([datetime.strptime(date, '%m/%d/%Y') for date in schedule] + [as_of_date])
+    for date in batch_predict.get_date_range((last_logged + timedelta(days=1)).strftime('%m/%d/%Y'), end_date):
+        games.extend([date, home_team, away_team] for home_team, away_team in dp.get_matchups(date, nba_teams).items())
+
+    return pd.DataFrame(games, columns=['DATE', 'HOME_TEAM', 'AWAY_TEAM'])
+
+
+def score_games(games_df, game_log_df, as_of, nba_teams, model_path=None):
+    """
+    Gets the model's chance of the home team winning every game, with both team's stats through a date
+
+    :param games_df:    A DataFrame with the DATE, HOME_TEAM and AWAY_TEAM of every game
+    :param game_log_df: The season game log through as_of
+    :param as_of:       The date of the stats in format "mm/dd/yyyy"
+    :param nba_teams:   Dictionary containing all of the NBA teams and their IDs
+    :param model_path:  The exported XGBoost JSON model. fast_predictor.booster_path is used if this is None
+    :return:            A NumPy array containing the chance of the home team winning each game
+    """
+    if games_df.empty:
+        return np.zeros(0)
+
+    # Teams that haven't played yet this season don't have any stats, which the model treats as missing values
+    team_stats = season_stats.stats_as_of(season_stats.compute_cumulative_stats(game_log_df), as_of)
+    features_df = games_df[['HOME_TEAM', 'AWAY_TEAM']].reset_index(drop=True)
+    for prefix, column in [('H_', 'HOME_TEAM'), ('A_', 'AWAY_TEAM')]:
+        stats_df = team_stats.reindex(features_df[column].map(nba_teams))[season_stats.stat_names]
+        for stat in season_stats.stat_names:
+            features_df[f'{prefix}{stat}'] = stats_df[stat].to_numpy()
+    features_df = features_df[batch_predict.feature_columns]
+
+    # A model trained with the head-to-head, recent form and rest features needs them for these games too
+    features_df = dp.add_model_game_features(features_df, games_df['DATE'].to_numpy(), nba_teams,
+                                             fast_predictor.model_feature_names(model_path), game_log_df=game_log_df)
+
+    return fast_predictor.predict_proba(features_df, model_path)
+
+
+def _init_worker(season_arrays):
+    global _season
+    _season = season_arrays
+
+
+def _simulate_batch(simulations, seed):
+    """
+    Plays out the rest of the season a batch of times
+
+    :param simulations: The amount of simulations in the batch
+    :param seed:        The SeedSequence of the batch's random draws
+    :return:            A dictionary containing the batch's counts of each team's wins and seeds, the sum of each
+                        team's wins and the amount of simulations each team was tied with a conference rival, and tied
+                        across the playoff or play-in line
+    """
+    probabilities, swing, base_wins, conferences, max_wins = _season
+    rng = np.random.default_rng(seed)
+    n_teams = len(base_wins)
+
+    # One row per simulation and one column per game. A home win adds a win to the home team and an away win adds one
+    # to the away team, which is the away team's games plus the swing matrix times the home wins.
+    with instrumentation.span('simulator.draws', simulations=simulations, games=len(probabilities)):
+        home_wins = rng.random((simulations, len(probabilities)), dtype=np.float32) < probabilities
+        wins = (base_wins + home_wins.astype(np.float32) @ swing).round().astype(np.int64)
+
+    counts = {
+        'wins': np.bincount((wins + np.arange(n_teams) * (max_wins + 1)).ravel(),
+                            minlength=n_teams * (max_wins + 1)).reshape(n_teams, max_wins + 1),
+        'wins_total': wins.sum(axis=0),
+        'seeds': np.zeros((n_teams, max(len(teams) for teams in conferences)), dtype=np.int64),
+        'tied': np.zeros(n_teams, dtype=np.int64),
+        'tied_at_line': np.zeros(n_teams, dtype=np.int64)
+    }
+
+    with instrumentation.span('simulator.seeds', simulations=simulations):
+        for teams in conferences:
+            conference_wins = wins[:, teams]
+            size = len(teams)
+
+            # Teams are seeded by wins. Ties are broken by a coin flip, since the NBA's tiebreakers need head-to-head
+            # and division records.
+            order = np.argsort(-(conference_wins + rng.random(conference_wins.shape)), axis=1, kind='stable')
+            seeds = np.empty_like(order)
+            np.put_along_axis(seeds, order, np.broadcast_to(np.arange(size), order.shape), axis=1)
+            counts['seeds'][teams, :size] += np.bincount((seeds + np.arange(size) * size).ravel(),
+                                                         minlength=size * size).reshape(size, size)
+
+            # A tie decided whether a team made the playoffs or the play-in if a team it was tied with ended up on
+            # the other side of the line
+            same_wins = conference_wins[:, :, None] == conference_wins[:, None, :]
+            same_wins[:, np.arange(size), np.arange(size)] = False
+            counts['tied'][teams] += same_wins.any(axis=2).sum(axis=0)
+            at_line = np.zeros_like(same_wins)
+            for line in (playoff_seeds, play_in_seeds):
+                above = seeds < line
+                at_line |= same_wins & (above[:, :, None] != above[:, None, :])
+            counts['tied_at_line'][teams] += at_line.any(axis=2).sum(axis=0)
+
+    return counts
+
+
+def simulate_season(season, as_of=None, simulations=100000, processes=None, seed=0, model_path=None, end_date=None):
+    """
+    Simulates the rest of a season and projects the final standings
+
+    :param season:      The NBA season. ex: '2021-22'
+    :param as_of:       The last date that has been played in format "mm/dd/yyyy". Yesterday is used if this is None
+    :param simulations: The amount of times to play out the rest of the season
+    :param processes:   The amount of batches to simulate at the same time. Every core is used if this is None
+    :param seed:        The random seed. The same seed always gives the same standings
+    :param model_path:  The exported XGBoost JSON model. fast_predictor.booster_path is used if this is None
+    :param end_date:    The last day of the regular season, see get_remaining_games
+    :return:            A DataFrame with one row per team: its record, remaining games, projected wins, chance of
+                        each seed, of the playoffs and of the play-in, and of its seed coming down to a tie
+    """
+    if as_of is None:
+        as_of = (datetime.now() - timedelta(days=1)).strftime('%m/%d/%Y')
+    if processes is None:
+        processes = os.cpu_count()
+    nba_teams = dp.get_teams()
+
+    # The games played through as_of decide every team's current record and stats
+    game_log_df = dp.get_season_game_log(season)
+    game_log_df = game_log_df[pd.to_datetime(game_log_df['GAME_DATE']) <= pd.to_datetime(as_of, format='%m/%d/%Y')]
+    team_index = {team_id: i for i, team_id in enumerate(team_ids)}
+    played = game_log_df['TEAM_ID'].map(team_index).to_numpy()
+    base_wins = np.bincount(played[(game_log_df['WL'] == 'W').to_numpy()], minlength=len(team_ids))
+    base_losses = np.bincount(played[(game_log_df['WL'] == 'L').to_numpy()], minlength=len(team_ids))
+
+    with instrumentation.span('simulator.score', season=season):
+        games_df = get_remaining_games(season, as_of, nba_teams, end_date)
+        probabilities = score_games(games_df, game_log_df, as_of, nba_teams, model_path).astype(np.float32)
+
+    # The swing matrix has a 1 in the home team's column and a -1 in the away team's column of every game
+    home = games_df['HOME_TEAM'].map(nba_teams).map(team_index).to_numpy(dtype=np.int64)
+    away = games_df['AWAY_TEAM'].map(nba_teams).map(team_index).to_numpy(dtype=np.int64)
+    swing = np.zeros((len(games_df), len(team_ids)), dtype=np.float32)
+    swing[np.arange(len(games_df)), home] = 1
+    swing[np.arange(len(games_df)), away] = -1
+    remaining = np.bincount(home, minlength=len(team_ids)) + np.bincount(away, minlength=len(team_ids))
+    start_wins = (base_wins + np.bincount(away, minlength=len(team_ids))).astype(np.float32)
+    max_wins = int((base_wins + remaining).max())
+    conferences = [np.array([team_index[team_id] for team_id in team_ids
+                             if nba_metadata.team_conference(team_id) == conference])
+                   for conference in conference_names]
+    season_arrays = (probabilities, swing, start_wins, conferences, max_wins)
+
+    # Every batch gets its own random stream from the seed, so the results don't depend on the amount of processes
+    batches = [batch_size] * (simulations // batch_size)
+    if simulations % batch_size:
+        batches.append(simulations % batch_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(batches))
+    with instrumentation.span('simulator.simulate', simulations=simulations, games=len(games_df)):
+        if processes <= 1:
+            _init_worker(season_arrays)
+            results = [_simulate_batch(batch, batch_seed) for batch, batch_seed in zip(batches, seeds)]
+        else:
+            with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                     initargs=(season_arrays,)) as executor:
+                results = list(executor.map(_simulate_batch, batches, seeds))
+
+    totals = {name: sum(result[name] for result in results) for name in results[0]}
+    return make_standings(totals, simulations, base_wins, base_losses, remaining, conferences)
+
+
+def make_standings(totals, simulations, base_wins, base_losses, remaining, conferences):
+    """
+    Turns the counts of every simulation into the projected standings
+
+    :return:    A DataFrame with one row per team, ordered by conference and projected wins
+    """
+    cumulative = np.cumsum(totals['wins'], axis=1) / simulations
+    standings = pd.DataFrame({
+        'TEAM': [nba_metadata.team_name(team_id) for team_id in team_ids],
+        'CONFERENCE': [nba_metadata.team_conference(team_id) for team_id in team_ids],
+        'W': base_wins,
+        'L': base_losses,
+        'REMAINING': remaining,
+        'PROJECTED_W': totals['wins_total'] / simulations,
+        # The 10th, 50th and 90th percentile of the final amount of wins
+        'W_10': (cumulative < 0.1).sum(axis=1),
+        'W_50': (cumulative < 0.5).sum(axis=1),
+        'W_90': (cumulative < 0.9).sum(axis=1)
+    })
+    standings['PROJECTED_L'] = base_wins + base_losses + remaining - standings['PROJECTED_W']
+
+    seeds = totals['seeds'] / simulations
+    for seed in range(seeds.shape[1]):
+        standings[f'SEED_{seed + 1}'] = seeds[:, seed]
+    standings['PLAYOFFS'] = seeds[:, :playoff_seeds].sum(axis=1)
+    standings['PLAY_IN'] = seeds[:, playoff_seeds:play_in_seeds].sum(axis=1)
+    standings['MEAN_SEED'] = (seeds * np.arange(1, seeds.shape[1] + 1)).sum(axis=1)
+    standings['TIED'] = totals['tied'] / simulations
+    standings['TIED_AT_LINE'] = totals['tied_at_line'] / simulations
+
+    return standings.sort_values(['CONFERENCE', 'PROJECTED_W'], ascending=[True, False], ignore_index=True)
+
+
+def main(args=None):
+    """
+    Simulates the rest of a season from the command line and prints the projected standings
+
+    :param args:    The command line arguments. sys.argv is used if this is None
+    """
+    parser = argparse.ArgumentParser(description="Monte Carlo simulation of the rest of an NBA season.")
+    parser.add_argument('--season', help="The season in format yyyy-yy. Defaults to the season of --as-of")
+    parser.add_argument('--as-of', help="The last date that has been played in format mm/dd/yyyy. Defaults to "
+                                        "yesterday")
+    parser.add_argument('--end', help="The last day of the regular season in format mm/dd/yyyy")
+    parser.add_argument('--simulations', type=int, default=100000)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--model', default=None, help="The exported XGBoost JSON model")
+    parser.add_argument('--output', help="A CSV file to save the projected standings to")
+    args = parser.parse_args(args)
+
+    as_of = args.as_of or (datetime.now() - timedelta(days=1)).strftime('%m/%d/%Y')
+    season = args.season or batch_predict.get_season_for_date(as_of)
+    standings = simulate_season(season, as_of, args.simulations, args.processes, args.seed, args.model, args.end)
+
+    for conference in conference_names:
+        print(f"\n{conference}")
+        print(f"{'team':<26}{'W-L':>8}{'proj. W':>9}{'10-90%':>9}{'seed 1':>8}{'top 6':>8}{'play-in':>9}"
+              f"{'tied':>7}")
+        for team in standings[standings['CONFERENCE'] == conference].itertuples(index=False):
+            print(f"{team.TEAM:<26}{f'{team.W}-{team.L}':>8}{team.PROJECTED_W:>9.1f}{f'{team.W_10}-{team.W_90}':>9}"
+                  f"{team.SEED_1:>8.1%}{team.PLAYOFFS:>8.1%}{team.PLAY_IN:>9.1%}{team.TIED_AT_LINE:>7.1%}")
+
+    if args.output:
+        standings.to_csv(args.output, index=False)
+    instrumentation.report()
+
+
+if __name__ == '__main__':
+    main()
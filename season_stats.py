@@ -0,0 +1,129 @@
+"""
+Author Name:    Victoria Scavetta
+Date:           4/19/2022
+Course:         Concepts in AI
+
+This program predicts the results of NBA games based on each team's stats and past matchups between the teams.
+
+This file (season_stats.py) computes every team's season-to-date stats locally from a single season game log, instead
+of asking the TeamDashboardByGeneralSplits endpoint for each team on each day.
+"""
+
+import pandas as pd
+import game_features
+
+# The stats used by the model, in the same order as the columns created by data_processing.get_season_games_df
+stat_names = ['W_PCT', 'FG_PCT', 'FG3_PCT', 'FT_PCT', 'REB', 'AST', 'TOV', 'STL', 'BLK', 'PLUS_MINUS', 'OFF_RATING',
+              'DEF_RATING', 'TS_PCT']
+
+# Stats the NBA reports as percentages are rounded to 3 decimals, per 100 possession stats are rounded to 1 decimal
+pct_stats = ['W_PCT', 'FG_PCT', 'FG3_PCT', 'FT_PCT', 'TS_PCT']
+
+# Box score columns that are summed up to get the running totals
+total_columns = ['GP', 'WIN', 'FGM', 'FGA', 'FG3M', 'FG3A', 'FTM', 'FTA', 'OREB', 'REB', 'AST', 'TOV', 'STL', 'BLK',
+                 'PTS', 'OPP_PTS', 'POSS']
+
+game_columns = ['HOME_TEAM', 'AWAY_TEAM'] + [f'H_{stat}' for stat in stat_names] + \
+               [f'A_{stat}' for stat in stat_names] + ['RESULT', 'DATE']
+
+
+def compute_cumulative_stats(game_log_df):
+    """
+    Computes each team's season-to-date stats after every game they played. The stats on a row include the game played
+    on that row's date, the same as asking the dashboard endpoint for stats from the season start to that date.
+
+    :param game_log_df:     A DataFrame from the LeagueGameLog endpoint with one row per team per game
+    :return:                A DataFrame with TEAM_ID, TEAM_NAME, GAME_DATE and every stat in stat_names, sorted by
+                            team and date
+    """
+    log = game_log_df.copy()
+    log['GAME_DATE'] = pd.to_datetime(log['GAME_DATE'])
+
+    # Each game has two rows, so pairing the rows by game ID gives every team the points scored against them
+    opponents = log[['GAME_ID', 'TEAM_ID', 'PTS']].rename(columns={'TEAM_ID': 'OPP_TEAM_ID', 'PTS': 'OPP_PTS'})
+    log = log.merge(opponents, on='GAME_ID')
+    log = log[log['TEAM_ID'] != log['OPP_TEAM_ID']]
+
+    log['GP'] = 1
+    log['WIN'] = (log['WL'] == 'W').astype(int)
+    # Estimated possessions, which is what the per 100 possession and rating stats are based on
+    log['POSS'] = log['FGA'] + 0.44 * log['FTA'] - log['OREB'] + log['TOV']
+
+    log = log.sort_values(['TEAM_ID', 'GAME_DATE'], kind='mergesort').reset_index(drop=True)
+
+    # Running totals for each team, so every row holds the totals from the season start through that game
+    totals = log.groupby('TEAM_ID', sort=False)[total_columns].cumsum()
+    per_100 = 100 / totals['POSS']
+
+    cumulative = log[['TEAM_ID', 'TEAM_NAME', 'GAME_DATE']].copy()
+    cumulative['W_PCT'] = totals['WIN'] / totals['GP']
+    cumulative['FG_PCT'] = totals['FGM'] / totals['FGA']
+    cumulative['FG3_PCT'] = totals['FG3M'] / totals['FG3A']
+    cumulative['FT_PCT'] = totals['FTM'] / totals['FTA']
+    cumulative['REB'] = totals['REB'] * per_100
+    cumulative['AST'] = totals['AST'] * per_100
+    cumulative['TOV'] = totals['TOV'] * per_100
+    cumulative['STL'] = totals['STL'] * per_100
+    cumulative['BLK'] = totals['BLK'] * per_100
+    cumulative['PLUS_MINUS'] = (totals['PTS'] - totals['OPP_PTS']) * per_100
+    cumulative['OFF_RATING'] = totals['PTS'] * per_100
+    cumulative['DEF_RATING'] = totals['OPP_PTS'] * per_100
+    cumulative['TS_PCT'] = totals['PTS'] / (2 * (totals['FGA'] + 0.44 * totals['FTA']))
+
+    # Round the stats the same way the NBA api does
+    for stat in stat_names:
+        cumulative[stat] = cumulative[stat].fillna(0).round(3 if stat in pct_stats else 1)
+
+    return cumulative
+
+
+def stats_as_of(cumulative_df, date):
+    """
+    Gets every team's most recent season-to-date stats on or before a date. Teams that haven't played yet are left out.
+
+    :param cumulative_df:   A DataFrame returned by compute_cumulative_stats
+    :param date:            The last date to include stats from in format "mm/dd/yyyy"
+    :return:                A DataFrame with one row per team, indexed by TEAM_ID
+    """
+    played = cumulative_df[cumulative_df['GAME_DATE'] <= pd.to_datetime(date, format='%m/%d/%Y')]
+    return played.groupby('TEAM_ID', sort=False).tail(1).set_index('TEAM_ID')
+
+
+def build_season_games_df(game_log_df, extra_features=False):
+    """
+    Puts all of the games from a season game log and both team's season-to-date stats into a Pandas DataFrame with the
+    same columns as data_processing.get_season_games_df
+
+    :param game_log_df:     A DataFrame from the LeagueGameLog endpoint with one row per team per game
+    :param extra_features:  If True, add the head-to-head, recent form and rest features from game_features.py
+    :return:                A Pandas DataFrame containing all games played in the season and both team's stats from
+                            each day
+    """
+    cumulative = compute_cumulative_stats(game_log_df)
+
+    log = game_log_df[['GAME_ID', 'TEAM_ID', 'TEAM_NAME', 'GAME_DATE', 'MATCHUP', 'WL']].copy()
+    log['GAME_DATE'] = pd.to_datetime(log['GAME_DATE'])
+
+    # A team is the home team if its matchup looks like 'BOS vs. PHI' and the away team if it looks like 'PHI @ BOS'
+    is_home = log['MATCHUP'].str.contains('vs.', regex=False)
+    home = log[is_home]
+    away = log[~is_home][['GAME_ID', 'TEAM_ID', 'TEAM_NAME']]
+    games = home.merge(away, on='GAME_ID', suffixes=('_H', '_A'))
+
+    # Attach each team's stats through the date of the game
+    stat_keys = ['TEAM_ID', 'GAME_DATE']
+    home_stats = cumulative[stat_keys + stat_names].rename(columns={'TEAM_ID': 'TEAM_ID_H', **{
+        stat: f'H_{stat}' for stat in stat_names}})
+    away_stats = cumulative[stat_keys + stat_names].rename(columns={'TEAM_ID': 'TEAM_ID_A', **{
+        stat: f'A_{stat}' for stat in stat_names}})
+    games = games.merge(home_stats, on=['TEAM_ID_H', 'GAME_DATE']).merge(away_stats, on=['TEAM_ID_A', 'GAME_DATE'])
+
+    games = games.sort_values(['GAME_DATE', 'GAME_ID'], kind='mergesort').reset_index(drop=True)
+    games['HOME_TEAM'] = games['TEAM_NAME_H']
+    games['AWAY_TEAM'] = games['TEAM_NAME_A']
+    games['RESULT'] = (games['WL'] == 'W').astype(int)  # Binarize the home team's result. A win is 1 and a loss is 0
+    games['DATE'] = games['GAME_DATE'].dt.strftime('%m/%d/%Y')
+
+    if extra_features:
+        return game_features.add_game_features(games[game_columns], game_log_df)
+    return games[game_columns]
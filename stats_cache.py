@@ -0,0 +1,170 @@
+"""
+Author Name:    Victoria Scavetta
+Date:           4/19/2022
+Course:         Concepts in AI
+
+This program predicts the results of NBA games based on each team's stats and past matchups between the teams.
+
+This file (stats_cache.py) remembers the stats returned by data_processing.get_team_stats, keyed by the team, season
+and date window. Recently used stats are kept in memory, and every result is also saved in a small SQLite database, so
+the stats collected while building the datasets are reused by later builds and by live predictions. Both tiers have a
+size limit, and the least recently used stats are dropped first.
+"""
+
+from collections import OrderedDict
+import json
+import os
+import sqlite3
+import threading
+import time
+import api_cache
+
+# The amount of stats kept in memory
+memory_entries = 4096
+
+# The amount of stats kept in the database. A full season is about 5,000.
+max_rows = 250000
+
+db_path = os.path.join(api_cache.cache_dir, 'team_stats.sqlite')
+
+
+class TeamStatsCache:
+    """
+    A two tier cache of team stats. Keys are [team ID, season, start date, end date] lists and values are the
+    dictionaries returned by get_team_stats.
+    """
+
+    def __init__(self, path=db_path, memory_size=memory_entries, max_size=max_rows):
+        """
+        :param path:        The SQLite database file, or None to only keep the stats in memory
+        :param memory_size: The amount of stats kept in memory
+        :param max_size:    The amount of stats kept in the database
+        """
+        self.path = path
+        self.memory_size = memory_size
+        self.max_size = max_size
+        self._memory = OrderedDict()  # Key -> stats, least recently used first
+        self._lock = threading.Lock()
+        self._connection = None
+        self._connection_pid = None
+        self._rows = None
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+
+    def _db(self):
+        # A connection can't be shared with a forked process, so each process opens its own
+        if self._connection is None or self._connection_pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._connection.execute('CREATE TABLE IF NOT EXISTS team_stats (team_id INTEGER, season TEXT, '
+                                     'start_date TEXT, end_date TEXT, stats TEXT, used REAL, '
+                                     'PRIMARY KEY (team_id, season, start_date, end_date))')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS team_stats_used ON team_stats (used)')
+            self._connection.commit()
+            self._connection_pid = os.getpid()
+            self._rows = self._connection.execute('SELECT COUNT(*) FROM team_stats').fetchone()[0]
+        return self._connection
+
+    def _remember(self, key, stats):
+        self._memory[key] = stats
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """
+        :param key: A [team ID, season, start date, end date] list
+        :return:    The cached stats, or None if they aren't cached
+        """
+        key = tuple(key)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return self._memory[key]
+            if self.path is None:
+                self._stats['misses'] += 1
+                return None
+
+            db = self._db()
+            row = db.execute('SELECT stats FROM team_stats WHERE team_id = ? AND season = ? AND start_date = ? AND '
+                             'end_date = ?', key).fetchone()
+            if row is None:
+                self._stats['misses'] += 1
+                return None
+
+            # Mark the row as used so it's the last to be evicted
+            db.execute('UPDATE team_stats SET used = ? WHERE team_id = ? AND season = ? AND start_date = ? AND '
+                       'end_date = ?', (time.time(),) + key)
+            db.commit()
+            stats = json.loads(row[0])
+            self._remember(key, stats)
+            self._stats['disk_hits'] += 1
+            return stats
+
+    def put(self, key, stats):
+        """
+        Caches a team's stats in memory and in the database
+
+        :param key:     A [team ID, season, start date, end date] list
+        :param stats:   The dictionary of stats
+        """
+        key = tuple(key)
+        with self._lock:
+            self._remember(key, stats)
+            if self.path is None:
+                return
+
+            db = self._db()
+            # Replacing the stats of a key that's already saved doesn't add a row, so only new keys are counted
+            exists = db.execute('SELECT 1 FROM team_stats WHERE team_id = ? AND season = ? AND start_date = ? AND '
+                                'end_date = ?', key).fetchone() is not None
+            db.execute('INSERT OR REPLACE INTO team_stats VALUES (?, ?, ?, ?, ?, ?)',
+                       key + (json.dumps(stats), time.time()))
+            if not exists:
+                self._rows += 1
+
+            # Drop the least recently used tenth of the rows once the database is full, so evictions are rare
+            if self._rows > self.max_size:
+                evict = self._rows - int(self.max_size * 0.9)
+                db.execute('DELETE FROM team_stats WHERE rowid IN (SELECT rowid FROM team_stats ORDER BY used '
+                           'LIMIT ?)', (evict,))
+                self._rows = db.execute('SELECT COUNT(*) FROM team_stats').fetchone()[0]
+                self._stats['evictions'] += evict
+            db.commit()
+
+    def get_or_fetch(self, key, fetch):
+        """
+        Gets a team's cached stats, or calls fetch and caches its result if they aren't cached
+
+        :param key:     A [team ID, season, start date, end date] list
+        :param fetch:   A function with no arguments that collects the stats
+        :return:        The stats
+        """
+        stats = self.get(key)
+        if stats is None:
+            stats = fetch()
+            self.put(key, stats)
+        return stats
+
+    def stats(self):
+        """
+        :return:    A dictionary containing the amount of memory hits, database hits, misses and evicted rows
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def clear(self):
+        """
+        Deletes every cached stat from memory and from the database
+        """
+        with self._lock:
+            self._memory.clear()
+            if self.path is not None and os.path.exists(self.path):
+                db = self._db()
+                db.execute('DELETE FROM team_stats')
+                db.commit()
+                self._rows = 0
+
+
+# The cache shared by every get_team_stats call in this process
+default_cache = TeamStatsCache()